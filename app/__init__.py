@@ -0,0 +1,6 @@
+# app/__init__.py
+# .env is loaded once, here, before any module reads os.environ or builds
+# Settings; main.py, get_token.py and the CLIs all import app first.
+from dotenv import load_dotenv
+
+load_dotenv()
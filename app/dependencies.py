@@ -1,12 +1,21 @@
 # app/dependencies.py
 from fastapi import Depends
+from app.services.http_clients import UpstreamClients, http_clients
 from app.services.token_service import token_service
 from app.services.prescription_service import PrescriptionService
+from app.services.wsd_pricing import WsdPriceService, wsd_price_service
+
+def get_http_clients() -> UpstreamClients:
+    return http_clients
 
 def get_token_service():
     return token_service
 
 def get_prescription_service(
-    token_svc = Depends(get_token_service)
+    token_svc = Depends(get_token_service),
+    clients: UpstreamClients = Depends(get_http_clients),
 ) -> PrescriptionService:
-    return PrescriptionService(token_svc)
+    return PrescriptionService(token_svc, clients.fhir)
+
+def get_wsd_price_service() -> WsdPriceService:
+    return wsd_price_service
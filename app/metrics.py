@@ -0,0 +1,193 @@
+# app/metrics.py
+"""
+Prometheus metrics for the API, served at /metrics.
+
+* inbound requests: latency histogram per route template and status class,
+  plus an in-flight gauge (MetricsMiddleware);
+* upstream calls: latency histogram per upstream/endpoint and an error
+  counter keyed by status code (429, 520, ...) or transport error type,
+  recorded by the instrumented transport in http_clients;
+* pricebook lookups: latency per lookup kind (single GTIN or batch);
+* scrape-time gauges: threadpool usage, circuit breaker state, hedges
+  fired/won per upstream, and the existing cache/token/prefetch stats
+  (including prefetch hit ratios).
+"""
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Upstream URL path (last segment) -> endpoint label; anything else is "other"
+UPSTREAM_ENDPOINTS = {
+    "token":                              "token",
+    "MedicationRequest":                  "MedicationRequest",
+    "schedules":                          "schedules",
+    "items":                              "items",
+    "item-dispensing-rule-relationships": "item-dispensing-rule-relationships",
+}
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+LOOKUP_BUCKETS  = (.00001, .00005, .0001, .0005, .001, .005, .01, .05, .1, .5)
+
+
+# ─── Metrics ────────────────────────────────────────────────────────────────────
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Inbound request latency",
+    ("method", "route", "status"), buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge("http_requests_in_flight", "Inbound requests currently being handled")
+
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds", "Upstream call latency (until response headers)",
+    ("upstream", "endpoint"), buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total", "Failed upstream calls by HTTP status or transport error",
+    ("upstream", "endpoint", "kind"),
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total", "Upstream calls retried after a retryable failure", ("upstream",),
+)
+
+RATE_WAIT = Histogram(
+    "rate_governor_wait_seconds", "Time spent queued for an upstream rate-limit slot",
+    ("governor", "priority"), buckets=(0, .01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30),
+)
+RATE_REJECTED = Counter(
+    "rate_governor_rejected_total", "Calls refused because no slot was free within their budget",
+    ("governor", "priority"),
+)
+
+PRICEBOOK_LOOKUP = Histogram(
+    "pricebook_lookup_seconds", "WSD pricebook GTIN lookup and search latency",
+    ("kind",), buckets=LOOKUP_BUCKETS,
+)
+
+
+# ─── Recording ──────────────────────────────────────────────────────────────────
+def upstream_endpoint(path: str) -> str:
+    return UPSTREAM_ENDPOINTS.get(path.rstrip("/").rsplit("/", 1)[-1], "other")
+
+
+def observe_upstream(upstream: str, endpoint: str, elapsed: float, status: int | None = None,
+                     error: BaseException | None = None) -> None:
+    UPSTREAM_LATENCY.labels(upstream, endpoint).observe(elapsed)
+    if error is not None:
+        UPSTREAM_ERRORS.labels(upstream, endpoint, type(error).__name__).inc()
+    elif status is not None and status >= 400:
+        UPSTREAM_ERRORS.labels(upstream, endpoint, str(status)).inc()
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by matched route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                f"{status // 100}xx",
+            ).observe(time.perf_counter() - start)
+
+
+# ─── Scrape-time Collectors ─────────────────────────────────────────────────────
+# Stats fields that are levels rather than running totals
+_GAUGE_FIELDS = {"size", "maxsize", "bytes", "max_bytes", "hit_ratio", "cached", "expires_in",
+                 "loaded", "rows", "gtins", "mtime", "open", "consecutive_failures", "retry_in",
+                 "rate", "burst", "reserve", "tokens", "prefetch_hit_ratio", "pending",
+                 "enabled", "delay", "samples", "hedge_ratio", "win_ratio", "tracked_codes",
+                 "warmed_codes", "warmed_items", "warmed_rules"}
+
+
+class AppStatsCollector:
+    """Exports the caches', token service's and threadpool's own counters."""
+
+    def describe(self):
+        # Nothing to declare up front; stops register() from calling collect()
+        # while the services are still being imported.
+        return []
+
+    def collect(self):
+        from app.services import cache
+        from app.services.bundle_cache import bundle_cache
+        from app.services.hedging import hedge_stats
+        from app.services.pbs_rollover import rollover_warmer
+        from app.services.prefetch import prefetcher
+        from app.services.rate_governor import pbs_governor
+        from app.services.resilience import breaker_stats
+        from app.services.token_service import token_service
+        from app.services.wsd_pricing import wsd_price_service
+
+        groups = {("cache", name): s for name, s in cache.all_stats().items()}
+        groups[("cache", "bundle")] = bundle_cache.stats()
+        groups[("token", "token")] = token_service.stats()
+        groups[("pricebook", "wsd")] = wsd_price_service.pricebook.stats()
+        groups[("rate_governor", "pbs")] = pbs_governor.stats()
+        groups[("prefetch", "pbs")] = prefetcher.stats()
+        groups[("pbs_rollover", "pbs")] = rollover_warmer.stats()
+        for name, s in breaker_stats().items():
+            groups[("circuit", name)] = s
+        for name, s in hedge_stats().items():
+            groups[("hedge", name)] = s
+
+        families: dict[str, GaugeMetricFamily | CounterMetricFamily] = {}
+        for (prefix, name), stats in groups.items():
+            for field, value in stats.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                metric = f"{prefix}_{field}"
+                family = families.get(metric)
+                if family is None:
+                    if field in _GAUGE_FIELDS:
+                        family = GaugeMetricFamily(metric, f"{prefix} {field}", labels=("name",))
+                    else:
+                        family = CounterMetricFamily(metric, f"{prefix} {field}", labels=("name",))
+                    families[metric] = family
+                family.add_metric((name,), value)
+        yield from families.values()
+        yield from self._threadpool()
+
+    @staticmethod
+    def _threadpool():
+        # The limiter is per event loop; only available when scraped from inside it.
+        try:
+            from anyio import to_thread
+            limiter = to_thread.current_default_thread_limiter()
+        except Exception:
+            return
+        in_use = GaugeMetricFamily("threadpool_tokens_in_use", "Worker threads busy with sync handlers")
+        in_use.add_metric((), limiter.borrowed_tokens)
+        total = GaugeMetricFamily("threadpool_capacity", "Worker thread capacity")
+        total.add_metric((), limiter.total_tokens)
+        waiting = GaugeMetricFamily("threadpool_tasks_waiting", "Sync calls queued for a worker thread")
+        waiting.add_metric((), limiter.statistics().tasks_waiting)
+        yield from (in_use, total, waiting)
+
+
+REGISTRY.register(AppStatsCollector())
+
+
+def render() -> tuple[bytes, str]:
+    """Exposition body and content type for /metrics."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
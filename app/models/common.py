@@ -0,0 +1,8 @@
+# app/models/common.py
+from pydantic import BaseModel
+
+
+class ItemError(BaseModel):
+    """Per-item failure inside a batch response."""
+    status_code: int
+    detail: str
@@ -1,17 +1,69 @@
 # app/models/prescription.py
 from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
+from typing import Dict, List, Optional, Union
+
+from app.models.common import ItemError
+from app.models.pricing import PbsPrice, WsdPrice
+
+# FHIR extension values are strings or booleans depending on the extension
+ExtValue = Union[str, bool, None]
+Number = Union[int, float, None]
 
 class MedicationSummary(BaseModel):
-    id: str
-    status: str
-    intent: str
-    authoredOn: str
-    medication: Optional[str]
-    identifiers: List[str]
-    item_generic_intension: Optional[str]
-    schedule_number: Optional[int]
-    private_prescription: Optional[bool]
+    medicare_no: Optional[str]
+    irn: Optional[str]
     ihi: Optional[str]
+    racf: Optional[str]
+    pension_card: Optional[str]
+    seniors_card: Optional[str]
+    pensioner_elig: bool
+    seniors_elig: bool
+    name: str
+    dob: Optional[str]
+    allergies: List[str]
+    prescriber_notes: str
+    aip_drug_name: ExtValue
+    brand_name: ExtValue
+    generic_name: ExtValue
+    item_generic_intension: ExtValue
+    schedule_number: ExtValue
+    private_prescription: str
+    repeats_allowed: Optional[int]
+    repeats_dispensed: Optional[int]
+    repeats_remaining: Optional[int]
+    snomed: Optional[str]
+    gtin: Optional[str]
+    med_text: Optional[str]
+    pbs_code: Optional[str]
+    prescribed_qty: Number
+    max_qty_auth: Number
+    package_qty: Number
+    med_strength: Optional[str]
+    med_form: Optional[str]
+
+    # Fields added to bundle_summary.FIELDS are passed through until typed here
+    model_config = ConfigDict(from_attributes=True, extra="allow")
+
+class ScidResult(BaseModel):
+    scid: str
+    result: MedicationSummary
+
+class ScidFailure(BaseModel):
+    scid: str
+    error: ItemError
+
+BatchItem = Union[ScidResult, ScidFailure]
+
+class PricingInputs(BaseModel):
+    quantity: int
+    authority_medicare: bool
+    concession_eligible: bool
+    schedule_number: Optional[str]
 
-    model_config = ConfigDict(from_attributes=True)
+class PricedPrescription(BaseModel):
+    scid: str
+    summary: MedicationSummary
+    inputs: PricingInputs
+    pbs: Optional[PbsPrice]
+    wsd: Optional[WsdPrice]
+    errors: Dict[str, ItemError]
@@ -0,0 +1,79 @@
+# app/models/pricing.py
+from pydantic import BaseModel, Field
+from typing import List, Optional, Union
+
+from app.models.common import ItemError
+
+
+class WsdBatchLine(BaseModel):
+    gtin: str
+    qty: int = Field(1, description="Quantity")
+    auth: bool = Field(False, description="Authority Medicare?")
+    conc: bool = Field(False, description="Concession eligible?")
+
+
+class WsdPrice(BaseModel):
+    GTIN: str
+    quantity: int
+    BasePrice: float
+    DPMQ: float
+    FDP: float
+    General: float
+    Concessional: float
+    Brand: float
+
+
+class WsdSearchHit(BaseModel):
+    gtin: str
+    description: str
+    generic: Optional[str] = None
+    price: Optional[WsdPrice] = Field(None, description="Only with price=true; null when the row has no valid price")
+
+
+class WsdSearchResult(BaseModel):
+    query: str
+    total: int = Field(..., description="Rows matching the query; hits holds the best `limit` of them")
+    hits: List[WsdSearchHit]
+
+
+class WsdLineResult(BaseModel):
+    gtin: str
+    result: WsdPrice
+
+
+class WsdLineFailure(BaseModel):
+    gtin: str
+    error: ItemError
+
+
+WsdBatchItem = Union[WsdLineResult, WsdLineFailure]
+
+
+class PbsPrice(BaseModel):
+    schedule: str
+    DPMQ: float
+    FDP: float
+    General: float
+    Concessional: float
+    Brand: float
+
+
+class PbsBatchLine(BaseModel):
+    pbs_code: str
+    qty: int = Field(1, description="Quantity")
+    auth: bool = Field(False, description="Authority Medicare?")
+    conc: bool = Field(False, description="Concession eligible?")
+    sched: Optional[str] = Field(None, description="Override schedule code")
+
+
+class PbsLineResult(BaseModel):
+    pbs_code: str
+    result: PbsPrice
+
+
+class PbsLineFailure(BaseModel):
+    pbs_code: str
+    error: ItemError
+
+
+PbsBatchItem = Union[PbsLineResult, PbsLineFailure]
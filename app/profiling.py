@@ -0,0 +1,272 @@
+# app/profiling.py
+"""
+Per-request span timing, on-demand profiling and slow-request capture.
+
+Code on the request path marks its stages with `span(name)` (or `record()`
+for work it has already timed): token, rate_wait, upstream, parse,
+summarize, price, serialize. Spans go to the Trace of the request being
+served, carried in a contextvar, so tasks spawned by the request (gathers,
+batch fan-out) record into it too; outside a request they cost nothing.
+Concurrent spans overlap, so stage totals can add up to more than the
+request took.
+
+ProfilingMiddleware traces every request while slow capture is on:
+
+* a request slower than `settings.slow_request_threshold` is kept in a
+  bounded ring buffer, served by /_debug/slow;
+* a profiled request (X-Profile: 1 header, or the admin flag from
+  PROFILE_REQUESTS / POST /_debug/profiling) also gets a Server-Timing
+  header with its stage totals and an X-Profile-Id to fetch the full trace
+  from /_debug/profile/{id}. With `X-Profile: flame` the request is also
+  sampled with pyinstrument, if installed, for a flamegraph.
+
+Profiling costs CPU, so clients cannot turn it on themselves: the X-Profile
+header and POST /_debug/profiling are only honoured with an X-Profile-Token
+header matching `settings.profile_admin_token`, and not at all without one.
+The same token is needed to read traces (/_debug/slow, /_debug/profile).
+Traces record the route template (/prescription/{scid}), never the request
+path, so no SCID is kept.
+
+Streamed responses send their headers before the work is done, so their
+Server-Timing only covers what happened up to then; the stored trace is
+complete.
+"""
+import hmac
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from app.settings import settings
+
+log = logging.getLogger("profiling")
+
+SPANS, FLAME = "spans", "flame"
+MODES = (SPANS, FLAME)
+HEADER = b"x-profile"
+TOKEN_HEADER = b"x-profile-token"
+MAX_SPANS = 256   # per trace; further spans are counted, not kept
+
+_current: ContextVar["Trace | None"] = ContextVar("profiling_trace", default=None)
+_ids = itertools.count(1)
+
+
+# ─── Spans ──────────────────────────────────────────────────────────────────────
+class Trace:
+    __slots__ = ("id", "method", "route", "status", "mode", "at", "start",
+                 "duration", "spans", "dropped", "flame")
+
+    def __init__(self, method: str, mode: str | None = None):
+        self.id = f"{os.getpid():x}-{next(_ids)}"
+        self.method = method
+        self.route = None   # template of the matched route, set when the request is done
+        self.status = None
+        self.mode = mode
+        self.at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans: list[tuple[str, float, float, dict]] = []   # name, offset, elapsed, attrs
+        self.dropped = 0
+        self.flame = None   # pyinstrument Profiler, for mode == FLAME
+
+    def add(self, name: str, start: float, elapsed: float, attrs: dict) -> None:
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append((name, start - self.start, elapsed, attrs))
+
+    def elapsed(self) -> float:
+        return self.duration if self.duration is not None else time.perf_counter() - self.start
+
+    def breakdown(self) -> dict[str, dict]:
+        """Per stage: number of spans and total milliseconds."""
+        stages: dict[str, dict] = {}
+        for name, _, elapsed, _ in self.spans:
+            stage = stages.setdefault(name, {"count": 0, "ms": 0.0})
+            stage["count"] += 1
+            stage["ms"] += elapsed * 1000
+        for stage in stages.values():
+            stage["ms"] = round(stage["ms"], 2)
+        return stages
+
+    def server_timing(self) -> str:
+        parts = [f'{name};dur={stage["ms"]};desc="{stage["count"]}x"'
+                 for name, stage in self.breakdown().items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        return {
+            "id":          self.id,
+            "at":          datetime.fromtimestamp(self.at, timezone.utc).isoformat(),
+            "method":      self.method,
+            "route":       self.route,
+            "status":      self.status,
+            "duration_ms": round(self.elapsed() * 1000, 2),
+            "breakdown":   self.breakdown(),
+            "spans": [
+                {"name": name, "start_ms": round(offset * 1000, 2), "ms": round(elapsed * 1000, 2), **attrs}
+                for name, offset, elapsed, attrs in self.spans
+            ],
+            "dropped_spans": self.dropped,
+            "flamegraph":  f"/_debug/profile/{self.id}?format=html" if self.flame is not None else None,
+        }
+
+
+def current_trace() -> Trace | None:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block as stage `name` of the current request, if it is traced."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter() - start, attrs)
+
+
+def record(name: str, start: float, elapsed: float, **attrs) -> None:
+    """Add a span the caller has already timed (`start` from time.perf_counter())."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, elapsed, attrs)
+
+
+def is_admin(token: str | None) -> bool:
+    """Whether `token` is the profiling admin token (never, when none is configured)."""
+    expected = settings.profile_admin_token
+    return bool(expected and token) and hmac.compare_digest(token.encode(), expected.encode())
+
+
+# ─── Profiler ───────────────────────────────────────────────────────────────────
+def _flame_profiler():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        return None
+    return Profiler(interval=settings.profile_flame_interval, async_mode="enabled")
+
+
+class RequestProfiler:
+    """Keeps recent profiled traces and the slowest-request ring buffer."""
+
+    def __init__(self, mode: str | None, threshold: float, buffer: int):
+        self.mode = mode
+        self.threshold = threshold
+        self.slow: deque[Trace] = deque(maxlen=buffer)
+        self.profiles: OrderedDict[str, Trace] = OrderedDict()
+        self.buffer = buffer
+        self.traced = 0
+        self.captured = 0
+
+    def request_mode(self, headers: list[tuple[bytes, bytes]]) -> str | None:
+        """Mode for a request: its X-Profile header if sent with the admin token, else the admin flag."""
+        wanted = token = None
+        for name, value in headers:
+            if name == HEADER:
+                wanted = value.decode("latin-1").strip().lower()
+            elif name == TOKEN_HEADER:
+                token = value.decode("latin-1").strip()
+        if wanted is not None and is_admin(token):
+            if wanted == FLAME:
+                return FLAME
+            if wanted in ("1", "true", "yes", SPANS):
+                return SPANS
+        return self.mode
+
+    def finish(self, trace: Trace) -> None:
+        trace.duration = time.perf_counter() - trace.start
+        self.traced += 1
+        if trace.mode is not None:
+            self.profiles[trace.id] = trace
+            while len(self.profiles) > self.buffer:
+                self.profiles.popitem(last=False)
+        if self.threshold > 0 and trace.duration >= self.threshold:
+            self.captured += 1
+            self.slow.append(trace)
+            log.info("Slow request %s %s: %.0f ms (%s)", trace.method, trace.route,
+                     trace.duration * 1000, trace.id)
+
+    def get(self, trace_id: str) -> Trace | None:
+        trace = self.profiles.get(trace_id)
+        if trace is None:
+            trace = next((t for t in self.slow if t.id == trace_id), None)
+        return trace
+
+    def slowest(self, limit: int | None = None) -> list[dict]:
+        """Captured slow requests, newest first."""
+        traces = list(reversed(self.slow))[:limit]
+        return [t.to_dict() for t in traces]
+
+    def stats(self) -> dict:
+        return {
+            "mode":      self.mode,
+            "threshold": self.threshold,
+            "traced":    self.traced,
+            "captured":  self.captured,
+            "slow":      len(self.slow),
+            "profiles":  len(self.profiles),
+        }
+
+
+class ProfilingMiddleware:
+    """ASGI middleware tracing each HTTP request for `profiler`."""
+
+    def __init__(self, app, profiler: "RequestProfiler | None" = None):
+        self.app = app
+        self.profiler = profiler or request_profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profiler = self.profiler
+        mode = profiler.request_mode(scope["headers"])
+        if mode is None and profiler.threshold <= 0:
+            return await self.app(scope, receive, send)
+
+        trace = Trace(scope["method"], mode)
+        trace.status = 500
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                if trace.mode is not None:
+                    message["headers"] = [
+                        *message.get("headers", ()),
+                        (b"server-timing", trace.server_timing().encode("latin-1")),
+                        (b"x-profile-id", trace.id.encode("latin-1")),
+                    ]
+            await send(message)
+
+        if mode == FLAME:
+            trace.flame = _flame_profiler()
+            if trace.flame is None:
+                log.warning("X-Profile: flame needs pyinstrument; recording spans only")
+            else:
+                trace.flame.start()
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if trace.flame is not None:
+                trace.flame.stop()
+            route = scope.get("route")
+            trace.route = route.path if route is not None else "(unmatched)"
+            profiler.finish(trace)
+
+
+request_profiler = RequestProfiler(
+    settings.profile_requests if settings.profile_requests in MODES else None,
+    settings.slow_request_threshold,
+    settings.slow_request_buffer,
+)
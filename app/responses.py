@@ -0,0 +1,92 @@
+# app/responses.py
+"""
+Shared JSON response layer for the routers.
+
+* compact output by default, indented with ?pretty=1;
+* orjson for plain payloads (stdlib json if orjson is not installed);
+* payloads with a response model are validated and serialized in one pass
+  by pydantic-core (TypeAdapter.dump_json);
+* bodies over a size threshold are brotli- or gzip-compressed when the
+  client's Accept-Encoding allows it (brotli is in requirements.txt; an
+  install without it falls back to gzip).
+"""
+import gzip
+import json
+from functools import lru_cache
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+from app import profiling
+from app.settings import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TRUTHY = {"1", "true", "yes"}
+
+
+@lru_cache(maxsize=None)
+def _adapter(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def wants_pretty(request: Request) -> bool:
+    return request.query_params.get("pretty", "").lower() in TRUTHY
+
+
+def dumps(content, pretty: bool = False, model=None) -> bytes:
+    if model is not None:
+        adapter = _adapter(model)
+        return adapter.dump_json(adapter.validate_python(content), indent=2 if pretty else None)
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(content, indent=2).encode()
+    return json.dumps(content, separators=(",", ":")).encode()
+
+
+def _accepted_encodings(request: Request) -> dict[str, float]:
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    return accepted
+
+
+def compress(request: Request, body: bytes) -> tuple[bytes, str | None]:
+    """Compress `body` for the client when it is big enough; returns (body, encoding)."""
+    if len(body) < settings.response_compress_min_bytes:
+        return body, None
+    accepted = _accepted_encodings(request)
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return brotli.compress(body, quality=4), "br"
+    if accepted.get("gzip", 0) > 0:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
+
+
+def json_response(request: Request, content, model=None, status_code: int = 200) -> Response:
+    """Serialize `content` (validated against `model` if given) for this request."""
+    with profiling.span("serialize"):
+        body, encoding = compress(request, dumps(content, wants_pretty(request), model))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
@@ -1,12 +1,30 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import Response
-import json
-from app.services.pbs_pricing import calc_pbs_price
+from fastapi import APIRouter, Body, HTTPException, Query, Request
+from typing import List
+from app.models.pricing import PbsBatchItem, PbsBatchLine, PbsPrice
+from app.responses import json_response
+from app.services.pbs_pricing import calc_pbs_price, calc_pbs_prices
 
 router = APIRouter(prefix="/pricing/pbs", tags=["pbs_pricing"])
 
-@router.get("/{pbs_code}")
-def pbs_price(
+@router.post("/batch", response_model=List[PbsBatchItem])
+async def pbs_price_batch(
+    request: Request,
+    lines: List[PbsBatchLine] = Body(..., examples=[[{"pbs_code": "2622B", "qty": 1, "auth": True, "conc": False}]]),
+):
+    """
+    Prices many lines in one call, with one upstream lookup per distinct PBS
+    item rather than per line. Returns one entry per line, in order:
+    {"pbs_code", "result"} on success or {"pbs_code", "error": {"status_code", "detail"}}.
+    """
+    try:
+        results = await calc_pbs_prices(lines)
+        return json_response(request, results, List[PbsBatchItem])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{pbs_code}", response_model=PbsPrice)
+async def pbs_price(
+    request: Request,
     pbs_code: str,
     qty:     int    = Query(1,     description="Quantity"),
     auth:    bool   = Query(False, description="Authority Medicare?"),
@@ -14,14 +32,14 @@ def pbs_price(
     sched:   str|None = Query(None, description="Override schedule code"),
 ):
     try:
-        result = calc_pbs_price(
+        result = await calc_pbs_price(
             pbs_code=pbs_code,
             schedule_code=sched,
             quantity=qty,
             authority_medicare=auth,
             concession_eligible=conc,
         )
-        return Response(content=json.dumps(result, indent=2), media_type="application/json")
+        return json_response(request, result, PbsPrice)
     except LookupError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
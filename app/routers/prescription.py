@@ -1,42 +1,113 @@
 # app/routers/prescription.py
-from fastapi import APIRouter, Depends, HTTPException, Body
-from fastapi.responses import JSONResponse, Response
-import json
-from typing import List
+import logging
+import time
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from typing import List, Literal, Optional
+from app.dependencies import get_prescription_service, get_wsd_price_service
+from app.models.prescription import BatchItem, MedicationSummary, PricedPrescription, ScidResult
+from app.responses import dumps, json_response
 from app.services.prescription_service import PrescriptionService
-from app.services.token_service import token_service
+from app.services.priced_prescription import price_prescription
+from app.services.wsd_pricing import WsdPriceService
+
+log = logging.getLogger("prescription")
 
 router = APIRouter(prefix="/prescription", tags=["prescription"])
 
-def get_prescription_service():
-    return PrescriptionService(token_service)
+@router.get("/{scid}", response_model=MedicationSummary)
+async def fetch_scid(request: Request, scid: str, svc: PrescriptionService = Depends(get_prescription_service)):
+    try:
+        data = await svc.summarize(scid)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    # Outside the try: a summary that fails validation is our error (500), not "no data"
+    return json_response(request, data, MedicationSummary)
 
-@router.get("/{scid}")
-def fetch_scid(scid: str, svc: PrescriptionService = Depends(get_prescription_service)):
+@router.get("/{scid}/priced", response_model=PricedPrescription)
+async def fetch_scid_priced(
+    request: Request,
+    scid: str,
+    svc: PrescriptionService = Depends(get_prescription_service),
+    wsd: WsdPriceService = Depends(get_wsd_price_service),
+):
+    """
+    Summary plus PBS and WSD prices in one call. Quantity, schedule number and
+    concession entitlement come from the prescription; PBS and WSD pricing run
+    concurrently and a failure in either is reported under "errors".
+    """
     try:
-        data = svc.summarize(scid)
-        return Response(content=json.dumps(data, indent=2), media_type="application/json")
+        data = await price_prescription(svc, wsd, scid)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=502, detail=str(e))
+    return json_response(request, data, PricedPrescription)
+
+@router.delete("/{scid}/cache")
+async def invalidate_scid(scid: str, svc: PrescriptionService = Depends(get_prescription_service)):
+    """Drop the cached bundle for a SCID, e.g. once the script has been dispensed."""
+    return {"scid": scid, "invalidated": svc.invalidate(scid)}
 
-@router.post("/batch")
-def fetch_batch(
-    scids: List[str] = Body(..., example=["21KR32KDBCY38MCDW7", "anotherSCID"]),
+@router.post("/batch", response_model=List[BatchItem])
+async def fetch_batch(
+    request: Request,
+    scids: List[str] = Body(..., examples=[["21KR32KDBCY38MCDW7", "anotherSCID"]]),
+    stream: Optional[Literal["ndjson"]] = Query(None, description="Stream results as NDJSON"),
     svc: PrescriptionService = Depends(get_prescription_service)
 ):
     """
-    Accepts a JSON array of SCIDs, returns a list of summaries.
+    Accepts a JSON array of SCIDs and fetches them concurrently. Returns one
+    entry per SCID in input order: {"scid", "result": summary} on success or
+    {"scid", "error": {"status_code", "detail"}} on failure.
+
+    With ?stream=ndjson each entry is written as its own line as soon as the
+    SCID completes (completion order, with its input "index"), followed by a
+    {"summary": ...} line. Streamed batches have no overall time limit.
     Usage with curl:
       curl -X POST http://127.0.0.1:8000/prescription/batch \
            -H 'Content-Type: application/json' \
            -d '["21KR32KDBCY38MCDW7", "anotherSCID"]'
     """
-    results = []
-    for s in scids:
-        try:
-            results.append(svc.summarize(s))
-        except Exception:
-            continue
-    return Response(content=json.dumps(results, indent=2), media_type="application/json")
+    if stream == "ndjson":
+        return StreamingResponse(_stream_batch(svc, scids), media_type="application/x-ndjson")
+    results = [_validated(entry) for entry in await svc.summarize_many(scids)]
+    return json_response(request, results, List[BatchItem])
+
+
+def _validated(entry: dict):
+    """A batch entry as a model, or as a 500 item error if its summary fails validation."""
+    if "result" not in entry:
+        return entry
+    try:
+        return ScidResult.model_validate(entry)
+    except ValidationError as e:
+        log.error("Summary of SCID %s failed validation: %s", entry["scid"], e)
+        return {"scid": entry["scid"], "error": {
+            "status_code": 500, "detail": f"Summary failed validation ({e.error_count()} errors)",
+        }}
+
+
+async def _stream_batch(svc: PrescriptionService, scids: List[str]):
+    start = time.perf_counter()
+    errors: dict[str, int] = {}
+    async for i, entry in svc.iter_summaries(scids):
+        # Validated like the non-streamed response; a failure is that entry's 500
+        entry = _validated(entry)
+        if isinstance(entry, ScidResult):
+            entry = entry.model_dump(mode="json")
+        if "error" in entry:
+            code = str(entry["error"]["status_code"])
+            errors[code] = errors.get(code, 0) + 1
+        yield dumps({"index": i, **entry}) + b"\n"
+    failed = sum(errors.values())
+    yield dumps({"summary": {
+        "total":      len(scids),
+        "succeeded":  len(scids) - failed,
+        "failed":     failed,
+        "errors":     errors,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }}) + b"\n"
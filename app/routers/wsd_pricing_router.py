@@ -1,16 +1,131 @@
 # app/routers/wsd_pricing_router.py
 
-from fastapi import APIRouter, Query, HTTPException
-from fastapi.responses import Response
-import json
+import hashlib
+import itertools
+import re
 
-from app.services.wsd_pricing import WsdPriceService
+from fastapi import APIRouter, Body, Query, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from typing import List, Literal
+
+from app.models.pricing import WsdBatchItem, WsdBatchLine, WsdPrice, WsdSearchResult
+from app.responses import json_response
+from app.services.pricebook import PricebookError
+from app.services.wsd_pricing import wsd_price_service as _service
 
 router = APIRouter(prefix="/pricing/wsd", tags=["wsd_pricing"])
-_service = WsdPriceService()
 
-@router.get("/{gtin}")
-def wsd_price(
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+MAX_EXPORT_COMBOS = 64
+_RECORD_RANGE = re.compile(r"^records=(\d+)-(\d*)$")
+
+
+def _record_range(header: str | None, total: int) -> tuple[int, int] | None:
+    """[start, stop) from `Range: records=N-` / `records=N-M` (inclusive M); None = whole export."""
+    if not header:
+        return None
+    m = _RECORD_RANGE.match(header.strip())
+    if not m:
+        return None  # unknown units are ignored, as for bytes ranges
+    start = int(m.group(1))
+    stop = min(int(m.group(2)) + 1, total) if m.group(2) else total
+    if start >= total or stop <= start:
+        raise HTTPException(416, "Requested record range not satisfiable",
+                            headers={"Content-Range": f"records */{total}"})
+    return start, stop
+
+@router.post("/batch", response_model=List[WsdBatchItem])
+async def wsd_price_batch(
+    request: Request,
+    lines: List[WsdBatchLine] = Body(..., examples=[[{"gtin": "9323610007506", "qty": 2, "auth": True, "conc": False}]]),
+):
+    """
+    Prices a basket of lines in one call. Returns one entry per line, in order:
+    {"gtin", "result"} on success or {"gtin", "error": {"status_code", "detail"}}.
+    """
+    try:
+        # ~100 ms of CPU for 10k lines; keep it off the event loop
+        results = await run_in_threadpool(_service.calc_prices, lines)
+        return json_response(request, results, List[WsdBatchItem])
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/export", response_class=StreamingResponse)
+async def wsd_export(
+    request: Request,
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="Output format"),
+    qty: List[int] = Query([1], description="Quantities to price (repeatable)"),
+    auth: List[bool] = Query([False, True], description="Authority Medicare values (repeatable)"),
+    conc: List[bool] = Query([False, True], description="Concession values (repeatable)"),
+):
+    """
+    Streams a price for every GTIN in the pricebook at every combination of
+    qty x auth x conc, as NDJSON or CSV. Records are numbered from 0 in GTIN
+    order; send `Range: records=N-` (with `If-Range: <ETag>`) to resume an
+    interrupted download from record N. A resumed CSV has no header row.
+    """
+    if any(q < 1 for q in qty):
+        raise HTTPException(400, "qty must be at least 1")
+    combos = list(itertools.product(qty, auth, conc))
+    if len(combos) > MAX_EXPORT_COMBOS:
+        raise HTTPException(400, f"At most {MAX_EXPORT_COMBOS} qty/auth/conc combinations per export")
+    try:
+        index = await run_in_threadpool(_service.pricebook.index)
+    except PricebookError as e:
+        raise HTTPException(500, str(e))
+
+    total = len(index) * len(combos)
+    version = f"{index.mtime}:{index.rows}:{format}:{combos}"
+    etag = f'"{hashlib.sha1(version.encode()).hexdigest()[:20]}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "records",
+        "X-Record-Count": str(total),
+        "Content-Disposition": f'attachment; filename="wsd-prices.{format}"',
+    }
+    if_range = request.headers.get("if-range")
+    span = _record_range(request.headers.get("range"), total) if if_range in (None, etag) else None
+    if span is None:
+        start, stop, status = 0, total, 200
+    else:
+        (start, stop), status = span, 206
+        headers["Content-Range"] = f"records {start}-{stop - 1}/{total}"
+    if total == 0:
+        return Response(b"", media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+
+    # Sync generator: Starlette iterates it in the threadpool, chunk by chunk
+    body = _service.export(index, combos, start, stop, format)
+    return StreamingResponse(body, status_code=status, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+
+@router.get("/search", response_model=WsdSearchResult)
+async def wsd_search(
+    request: Request,
+    q: str = Query(..., min_length=2, max_length=100, description="Drug name, generic or strength, e.g. 'amox 500'"),
+    limit: int = Query(20, ge=1, le=100),
+    price: bool = Query(False, description="Include the computed price of each hit"),
+    qty: int  = Query(1,     description="Quantity (with price=true)"),
+    auth: bool = Query(False, description="Authority Medicare? (with price=true)"),
+    conc: bool = Query(False, description="Concession eligible? (with price=true)"),
+):
+    """
+    Typeahead search of the pricebook by description and generic name. Every
+    word must match the start of a word in either column (close misspellings
+    are tolerated); best matches first.
+    """
+    try:
+        result = _service.search(q, limit, price, qty, auth, conc)
+        return json_response(request, result, WsdSearchResult)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{gtin}", response_model=WsdPrice)
+async def wsd_price(
+    request: Request,
     gtin: str,
     qty: int  = Query(1,     description="Quantity"),
     auth: bool = Query(False, description="Authority Medicare?"),
@@ -23,7 +138,7 @@ def wsd_price(
             authority_medicare=auth,
             concession_eligible=conc,
         )
-        return Response(content=json.dumps(result, indent=2), media_type="application/json")
+        return json_response(request, result, WsdPrice)
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,160 @@
+# app/services/bundle_cache.py
+"""
+Short-lived cache of FHIR MedicationRequest bundles keyed by SCID.
+
+Repeat lookups of a SCID within the TTL are served from memory, concurrent
+lookups of an uncached SCID share one upstream call, and expired entries are
+revalidated with If-None-Match when the upstream sent an ETag. Upstream
+Cache-Control (no-store, no-cache, max-age) can shorten the TTL. The
+cache is bounded by the total size of the cached response bodies, and lives
+in a cache_backend so workers share fetched bundles and invalidations.
+"""
+import asyncio
+import re
+import time
+from typing import Awaitable, Callable, NamedTuple
+from app.settings import settings
+from app.services.cache_backend import CacheBackend, make_backend
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+# Expired entries with an ETag are kept this much longer to revalidate against
+REVALIDATE_WINDOW = 3600.0
+
+# An invalidation is remembered this long, so that fetches already in flight
+# (in any worker) do not store what they fetched; longer than any fetch runs
+INVALIDATION_WINDOW = max(settings.upstream_deadline, settings.request_budget) + 5.0
+
+
+class UpstreamBundle(NamedTuple):
+    """What a bundle fetch returns: 304 responses carry no bundle."""
+    status: int
+    bundle: dict | None
+    size: int
+    etag: str | None
+    cache_control: str | None
+
+
+class _Entry(NamedTuple):
+    bundle: dict
+    size: int
+    etag: str | None
+    expires_at: float   # time.time()
+
+
+Fetch = Callable[[str, str | None], Awaitable[UpstreamBundle]]
+
+
+class BundleCache:
+    def __init__(self, ttl: float = 15.0, max_bytes: int = 32 * 1024 * 1024,
+                 backend: CacheBackend | None = None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._backend = backend or make_backend("bundle", max_bytes=max_bytes)
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.revalidated = 0
+        self.invalidations = 0
+
+    async def get(self, scid: str, fetch: Fetch) -> dict:
+        """
+        Bundle for `scid`, calling `fetch(scid, etag)` only when no fresh copy
+        is cached and no fetch for it is already in flight.
+        """
+        entry = self._backend.get(scid)
+        if entry is not None:
+            entry = _Entry(*entry)
+        if entry is not None and time.time() < entry.expires_at:
+            self.hits += 1
+            return entry.bundle
+
+        task = self._inflight.get(scid)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = self._inflight[scid] = asyncio.ensure_future(self._load(scid, entry, fetch))
+            task.add_done_callback(lambda t: self._load_done(scid, t))
+        return await asyncio.shield(task)
+
+    def invalidate(self, scid: str) -> bool:
+        """Forget `scid` (e.g. once it is dispensed). Returns whether it was cached."""
+        self.invalidations += 1
+        # Results of fetches already in flight (here or in other workers)
+        # must not be stored either; see _load.
+        now = time.time()
+        self._backend.set(("invalidated", scid), now, now + INVALIDATION_WINDOW)
+        self._inflight.pop(scid, None)
+        cached = self._backend.get(scid) is not None
+        self._backend.delete(scid)
+        return cached
+
+    def stats(self) -> dict:
+        backend = self._backend.stats()
+        return {
+            "backend":              backend["backend"],
+            "size":                 backend["size"],
+            "bytes":                backend["bytes"],
+            "max_bytes":            self.max_bytes,
+            "hits":                 self.hits,
+            "coalesced":            self.coalesced,
+            "upstream_calls":       self.upstream_calls,
+            "upstream_calls_saved": self.hits + self.coalesced,
+            "revalidated":          self.revalidated,
+            "evictions":            backend["evictions"],
+            "backend_errors":       backend.get("errors", 0),
+            "invalidations":        self.invalidations,
+        }
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    async def _load(self, scid: str, stale: _Entry | None, fetch: Fetch) -> dict:
+        started = time.time()
+        self.upstream_calls += 1
+        res = await fetch(scid, stale.etag if stale else None)
+        ttl = self._ttl_for(res.cache_control)
+
+        if res.status == 304 and stale is not None:
+            self.revalidated += 1
+            bundle, size, etag = stale.bundle, stale.size, stale.etag
+        else:
+            bundle, size, etag = res.bundle, res.size, res.etag
+
+        invalidated = self._backend.get(("invalidated", scid))
+        if invalidated is None or invalidated < started:
+            self._store(scid, bundle, size, etag, ttl)
+        return bundle
+
+    def _load_done(self, scid: str, task: asyncio.Task) -> None:
+        if self._inflight.get(scid) is task:
+            del self._inflight[scid]
+        if not task.cancelled():
+            task.exception()
+
+    def _ttl_for(self, cache_control: str | None) -> float | None:
+        """
+        None means "do not store"; 0 keeps the entry only for revalidation.
+        An upstream max-age can shorten the configured TTL, never extend it.
+        """
+        if not cache_control:
+            return self.ttl
+        cc = cache_control.lower()
+        if "no-store" in cc:
+            return None
+        if "no-cache" in cc:
+            return 0.0
+        m = _MAX_AGE.search(cc)
+        return min(float(m.group(1)), self.ttl) if m else self.ttl
+
+    def _store(self, scid, bundle, size, etag, ttl) -> None:
+        if ttl is None or size > self.max_bytes or (ttl <= 0 and not etag):
+            # Not storable, or nothing to revalidate against
+            self._backend.delete(scid)
+            return
+        expires_at = time.time() + ttl
+        keep_until = expires_at + (REVALIDATE_WINDOW if etag else 0)
+        # Plain tuple: what the shared backend stores is independent of this module
+        self._backend.set(scid, tuple(_Entry(bundle, size, etag, expires_at)), keep_until, size)
+
+
+bundle_cache = BundleCache(settings.bundle_cache_ttl, settings.bundle_cache_max_bytes)
@@ -0,0 +1,151 @@
+# app/services/bundle_summary.py
+"""
+Single-pass summarizer for eRx MedicationRequest bundles.
+
+`BundleIndex` walks the MedicationRequest once, picking out the contained
+Patient and Medication, the patient identifiers, the request extensions and
+the medication codings. The summary is then produced from `FIELDS`, a table of
+(output key, extractor) pairs, so a new field is one more row in the table.
+"""
+import re
+from typing import Callable
+
+PBS_CODE_RE = re.compile(r"^[0-9]{1,5}[A-Z]$")
+
+# Identifier / coding systems
+MEDICARE_NO   = "http://ns.electronichealth.net.au/id/medicare-number"
+AUTHORITY_NO  = "http://fhir.erx.com.au/NamingSystem/identifiers#authority-script-number"
+PENSION_CARD  = "http://ns.electronichealth.net.au/id/pensioner-concession-card"
+SENIORS_CARD  = "http://ns.electronichealth.net.au/id/commonwealth-seniors-health-card"
+IHI           = "http://ns.electronichealth.net.au/id/hi/ihi/1.0"
+RACF_ID       = "http://ns.electronichealth.net.au/id/racf-id"
+SNOMED        = "http://snomed.info/sct"
+GTIN          = "http://www.gs1.org/gtin"
+
+
+class BundleIndex:
+    """Everything the summary needs from one MedicationRequest, gathered in one pass."""
+
+    __slots__ = ("bundle", "mr", "patient", "medication", "name", "identifiers",
+                 "extensions", "codings", "pbs_code", "dispense")
+
+    def __init__(self, bundle: dict, mr: dict):
+        self.bundle = bundle
+        self.mr = mr
+
+        patient = medication = None
+        for c in mr.get("contained", ()):
+            rtype = c.get("resourceType")
+            if rtype == "Patient" and patient is None:
+                patient = c
+            elif rtype == "Medication" and medication is None:
+                medication = c
+            if patient is not None and medication is not None:
+                break
+        self.patient = patient or {}
+        self.medication = medication or {}
+
+        names = self.patient.get("name") or [{}]
+        self.name = names[0]
+        self.identifiers = {i.get("system"): i.get("value") for i in self.patient.get("identifier", ())}
+        self.extensions = {
+            e.get("url").rsplit("/", 1)[-1]: e.get("valueString") or e.get("valueBoolean")
+            for e in mr.get("extension", ())
+        }
+
+        # First code per system, plus the first code shaped like a PBS item code
+        codings: dict = {}
+        pbs_code = "N/A"
+        for c in self.medication.get("code", {}).get("coding", ()):
+            codings.setdefault(c.get("system"), c.get("code"))
+            if pbs_code == "N/A" and PBS_CODE_RE.match(c.get("code", "")):
+                pbs_code = c.get("code")
+        self.codings = codings
+        self.pbs_code = pbs_code
+        self.dispense = mr.get("dispenseRequest", {})
+
+
+Extractor = Callable[[BundleIndex], object]
+
+
+# ─── Extractor Builders ─────────────────────────────────────────────────────────
+def identifier(system: str, default="N/A") -> Extractor:
+    return lambda ix: ix.identifiers.get(system, default)
+
+def extension(name: str, default="N/A") -> Extractor:
+    return lambda ix: ix.extensions.get(name, default)
+
+def coding(system: str, default="N/A") -> Extractor:
+    return lambda ix: ix.codings.get(system, default)
+
+def dispense(key: str, sub: str | None = None) -> Extractor:
+    if sub is None:
+        return lambda ix: ix.dispense.get(key)
+    return lambda ix: ix.dispense.get(key, {}).get(sub)
+
+def constant(value) -> Extractor:
+    return lambda ix: value
+
+
+# ─── Field Extractors ───────────────────────────────────────────────────────────
+def _full_name(ix: BundleIndex):
+    name = ix.name
+    return name.get("text") or " ".join(name.get("given", []) + [name.get("family", "")])
+
+def _repeats_remaining(ix: BundleIndex):
+    allowed = ix.dispense.get("numberOfRepeatsAllowed")
+    dispensed = ix.dispense.get("repeatsDispensed")
+    return allowed - dispensed if allowed is not None and dispensed is not None else None
+
+def _notes(ix: BundleIndex):
+    return "; ".join(n.get("text", "") for n in ix.mr.get("note", ()))
+
+def _med_strength(ix: BundleIndex):
+    return (ix.medication.get("extension") or [{}])[0].get("valueString")
+
+
+# Output key -> extractor, in response order
+FIELDS: list[tuple[str, Extractor]] = [
+    ("medicare_no",            identifier(MEDICARE_NO)),
+    ("irn",                    identifier(AUTHORITY_NO)),
+    ("ihi",                    identifier(IHI)),
+    ("racf",                   identifier(RACF_ID)),
+    ("pension_card",           identifier(PENSION_CARD)),
+    ("seniors_card",           identifier(SENIORS_CARD)),
+    ("pensioner_elig",         constant(False)),
+    ("seniors_elig",           constant(False)),
+    ("name",                   _full_name),
+    ("dob",                    lambda ix: ix.patient.get("birthDate", "N/A")),
+    ("allergies",              lambda ix: []),  # not yet extracted
+    ("prescriber_notes",       _notes),
+    ("aip_drug_name",          extension("aip-complient-drug-name")),
+    ("brand_name",             extension("medication-brand-name")),
+    ("generic_name",           extension("medication-generic-name")),
+    ("item_generic_intension", extension("item-generic-intension")),
+    ("schedule_number",        extension("schedule-number")),
+    ("private_prescription",   lambda ix: str(ix.extensions.get("private-prescription", "N/A"))),
+    ("repeats_allowed",        dispense("numberOfRepeatsAllowed")),
+    ("repeats_dispensed",      dispense("repeatsDispensed")),
+    ("repeats_remaining",      _repeats_remaining),
+    ("snomed",                 coding(SNOMED)),
+    ("gtin",                   coding(GTIN)),
+    ("med_text",               lambda ix: ix.medication.get("code", {}).get("text", "N/A")),
+    ("pbs_code",               lambda ix: ix.pbs_code),
+    ("prescribed_qty",         dispense("quantity", "value")),
+    ("max_qty_auth",           dispense("quantity", "value")),
+    ("package_qty",            dispense("expectedSupplyDuration", "value")),
+    ("med_strength",           _med_strength),
+    ("med_form",               lambda ix: ix.medication.get("form", {}).get("text")),
+]
+
+
+def summarize_bundle(bundle: dict) -> dict:
+    """
+    Summary of the first MedicationRequest in `bundle`. Raises ValueError
+    when the bundle has no entries.
+    """
+    entries = bundle.get("entry", [])
+    if not entries:
+        raise ValueError("Bundle has no entries")
+    ix = BundleIndex(bundle, entries[0]["resource"])
+    return {key: extract(ix) for key, extract in FIELDS}
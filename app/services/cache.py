@@ -0,0 +1,319 @@
+# app/services/cache.py
+"""
+TTL cache with negative caching, request coalescing and
+stale-while-revalidate, used for upstream lookups that change rarely.
+Entries are kept in a cache_backend, so with the shared backend a lookup
+loaded by one worker is served to all of them.
+"""
+import asyncio
+import logging
+import time
+
+from app.services.cache_backend import CacheBackend, make_backend
+from app.services.rate_governor import background
+
+log = logging.getLogger("cache")
+
+# Every TTLCache registers itself here so stats can be reported in one place
+_registry: dict[str, "TTLCache"] = {}
+
+
+class TTLCache:
+    """
+    `await get_or_load(key, loader)` returns the cached value for `key`,
+    awaiting `loader()` on a miss. Behaviour:
+
+    * fresh entries are returned directly (LRU order is updated);
+    * entries past `ttl` but within `stale_ttl` are returned immediately and
+      refreshed once in the background;
+    * exceptions of type `negative_exceptions` (not-found results) are cached
+      for `negative_ttl` and re-raised on every hit;
+    * concurrent misses for the same key (in this process) share a single
+      loader call, which keeps running even if the caller that started it
+      is cancelled;
+    * at most `maxsize` keys are held; the backend decides which go first.
+
+    `await prefetch(key, loader)` warms a key ahead of its expected use. The
+    entry is marked as prefetched, and the first lookup that is served by it
+    (in any worker) counts as a prefetch hit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 1024,
+        ttl: float = 3600,
+        stale_ttl: float = 0,
+        negative_ttl: float = 300,
+        negative_exceptions: tuple = (LookupError,),
+        backend: CacheBackend | None = None,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.negative_exceptions = negative_exceptions
+        # Stored entries are (value, error, expires_at, stale_until) in time.time(),
+        # with a fifth True element while a prefetched value has not been used;
+        # a cached not-found error is kept as data, [type name, message]
+        self._backend = backend or make_backend(name, maxsize=maxsize)
+        self._inflight: dict = {}
+        self._refreshing: dict = {}
+        self._prefetching: set = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.load_errors = 0
+        self.prefetches = 0
+        self.prefetch_hits = 0
+        _registry[name] = self
+
+    async def get_or_load(self, key, loader, ttl: float | None = None):
+        entry = self._backend.get(key)
+        if entry is not None:
+            value, error, expires_at = entry[:3]
+            if time.time() < expires_at:
+                if error is not None:
+                    self.negative_hits += 1
+                    raise self._error(error)
+                self.hits += 1
+                self._claim(key, entry)
+                return value
+            if error is None:
+                self.stale_hits += 1
+                self._claim(key, entry)
+                if key not in self._refreshing:
+                    self._refreshing[key] = asyncio.create_task(self._refresh(key, loader, ttl))
+                return value
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self._claim_inflight(key)
+        else:
+            task = self._inflight[key] = asyncio.ensure_future(self._load(key, loader, ttl))
+            task.add_done_callback(lambda t: self._load_done(key, t))
+        return await asyncio.shield(task)
+
+    async def get_or_load_many(self, keys, loader) -> dict:
+        """
+        get_or_load for several keys with a single loader call. Cached keys are
+        answered from the cache (stale ones refreshed together in the
+        background), keys already being loaded are awaited, and the rest are
+        passed to `await loader(missing)`, which returns {key: value or
+        exception}; keys it leaves out are not found. Returns {key: value or
+        exception} for every key.
+        """
+        out, waiting, missing, stale = {}, {}, [], []
+        now = time.time()
+        for key in dict.fromkeys(keys):
+            entry = self._backend.get(key)
+            if entry is not None:
+                value, error, expires_at = entry[:3]
+                if now < expires_at:
+                    if error is not None:
+                        self.negative_hits += 1
+                        out[key] = self._error(error)
+                    else:
+                        self.hits += 1
+                        self._claim(key, entry)
+                        out[key] = value
+                    continue
+                if error is None:
+                    self.stale_hits += 1
+                    self._claim(key, entry)
+                    out[key] = value
+                    if key not in self._refreshing:
+                        stale.append(key)
+                    continue
+            self.misses += 1
+            if key in self._inflight:
+                self._claim_inflight(key)
+                waiting[key] = self._inflight[key]
+            else:
+                missing.append(key)
+
+        if stale:
+            task = asyncio.create_task(self._refresh_many(stale, loader))
+            for key in stale:
+                self._refreshing[key] = task
+        if missing:
+            # One future per key, so single get_or_load calls coalesce with the batch
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            for key, fut in futures.items():
+                self._inflight[key] = fut
+                fut.add_done_callback(lambda f, key=key: self._load_done(key, f))
+            asyncio.ensure_future(self._load_many(futures, loader))
+            waiting.update(futures)
+
+        for key, fut in waiting.items():
+            try:
+                out[key] = await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                out[key] = e
+        return out
+
+    async def prefetch(self, key, loader, ttl: float | None = None):
+        """
+        Value for `key`, loading it with `loader()` unless it is fresh or
+        already being loaded. Unlike get_or_load this is not a lookup: it
+        does not count as a hit or miss, and a value it loads is marked for
+        prefetch hit accounting.
+        """
+        entry = self._backend.get(key)
+        if entry is not None and time.time() < entry[2]:
+            if entry[1] is not None:
+                raise self._error(entry[1])
+            return entry[0]
+        task = self._inflight.get(key)
+        if task is None:
+            self.prefetches += 1
+            self._prefetching.add(key)
+            task = self._inflight[key] = asyncio.ensure_future(self._load(key, loader, ttl))
+            task.add_done_callback(lambda t: self._load_done(key, t))
+        return await asyncio.shield(task)
+
+    def invalidate(self, key=None) -> None:
+        """Drop one key, or everything when `key` is None."""
+        if key is None:
+            self._backend.clear()
+        else:
+            self._backend.delete(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.negative_hits + self.misses
+        served = lookups - self.misses
+        backend = self._backend.stats()
+        return {
+            "backend":        backend["backend"],
+            "size":           backend["size"],
+            "bytes":          backend["bytes"],
+            "maxsize":        self.maxsize,
+            "hits":           self.hits,
+            "stale_hits":     self.stale_hits,
+            "negative_hits":  self.negative_hits,
+            "misses":         self.misses,
+            "refreshes":      self.refreshes,
+            "load_errors":    self.load_errors,
+            "evictions":      backend["evictions"],
+            "backend_errors": backend.get("errors", 0),
+            "hit_ratio":      round(served / lookups, 4) if lookups else None,
+            "prefetches":     self.prefetches,
+            "prefetch_hits":  self.prefetch_hits,
+            "prefetch_hit_ratio": round(self.prefetch_hits / self.prefetches, 4) if self.prefetches else None,
+        }
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    async def _load(self, key, loader, ttl):
+        try:
+            value = await loader()
+        except self.negative_exceptions as e:
+            self._store(key, None, e, self.negative_ttl)
+            raise
+        except Exception:
+            self.load_errors += 1
+            raise
+        self._store(key, value, None, self.ttl if ttl is None else ttl)
+        return value
+
+    def _load_done(self, key, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        self._prefetching.discard(key)
+        # Every waiter may have been cancelled; don't leave the error unretrieved.
+        if not task.cancelled():
+            task.exception()
+
+    async def _refresh(self, key, loader, ttl):
+        try:
+            # Nobody is waiting on a refresh; let interactive calls go first.
+            with background():
+                await self._load(key, loader, ttl)
+            self.refreshes += 1
+        except self.negative_exceptions:
+            self.refreshes += 1
+        except Exception as e:
+            # Keep serving the stale value; the next stale hit retries.
+            log.warning("Background refresh of %s[%r] failed: %s", self.name, key, e)
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def _load_many(self, futures: dict, loader) -> None:
+        try:
+            results = await loader(list(futures))
+        except Exception as e:
+            self.load_errors += 1
+            for fut in futures.values():
+                fut.set_exception(e)
+            return
+        except BaseException:
+            for fut in futures.values():
+                fut.cancel()   # the load itself was cancelled
+            raise
+        for key, fut in futures.items():
+            result = self._settle(key, results.get(key))
+            if isinstance(result, BaseException):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+    async def _refresh_many(self, keys: list, loader) -> None:
+        try:
+            with background():
+                results = await loader(keys)
+            for key in keys:
+                self._settle(key, results.get(key))
+                self.refreshes += 1
+        except Exception as e:
+            log.warning("Background refresh of %d %s keys failed: %s", len(keys), self.name, e)
+        finally:
+            for key in keys:
+                self._refreshing.pop(key, None)
+
+    def _settle(self, key, result):
+        """Store one result of a many-key load; returns the value or exception."""
+        if result is None:
+            result = LookupError(f"{key!r} not found")
+        if isinstance(result, BaseException):
+            if isinstance(result, self.negative_exceptions):
+                self._store(key, None, result, self.negative_ttl)
+            else:
+                self.load_errors += 1
+            return result
+        self._store(key, result, None, self.ttl)
+        return result
+
+    def _store(self, key, value, error, ttl):
+        now = time.time()
+        stale_until = now + ttl + (0 if error is not None else self.stale_ttl)
+        entry = (value, None if error is None else [type(error).__name__, str(error)], now + ttl, stale_until)
+        if error is None and key in self._prefetching:
+            entry += (True,)
+        self._backend.set(key, entry, stale_until)
+
+    def _error(self, data) -> Exception:
+        # A fresh exception of the stored type (else the first negative type)
+        name, message = data
+        cls = next((c for c in self.negative_exceptions if c.__name__ == name), self.negative_exceptions[0])
+        return cls(message)
+
+    def _claim(self, key, entry) -> None:
+        # First use of a prefetched value: count it and clear the mark
+        if len(entry) > 4:
+            self.prefetch_hits += 1
+            self._backend.set(key, entry[:4], entry[3])
+
+    def _claim_inflight(self, key) -> None:
+        # A lookup joining a prefetch still in flight; its value is stored unmarked
+        if key in self._prefetching:
+            self._prefetching.discard(key)
+            self.prefetch_hits += 1
+
+
+def all_stats() -> dict:
+    return {name: c.stats() for name, c in _registry.items()}
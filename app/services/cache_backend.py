@@ -0,0 +1,324 @@
+# app/services/cache_backend.py
+"""
+Storage behind the service caches (TTLCache, BundleCache, TokenService).
+
+Two backends share one small interface:
+
+* MemoryBackend keeps entries in the worker's own memory (LRU, bounded by
+  entry count and/or bytes); nothing is serialized.
+* SQLiteBackend keeps them in one WAL-mode SQLite file on the local disk,
+  shared by every worker on the host, so a token minted or a bundle fetched
+  by one worker is a hit in all the others. Values are stored as JSON
+  (orjson): data only, never code, so nothing read back from the file can
+  run anything; tuples come back as lists. Reads go through SQLite's mmap
+  and never take the write lock.
+
+The SQLite backend is opt-in (CACHE_BACKEND=sqlite): its calls are
+synchronous and run on the event loop, so a busy file can stall it briefly.
+The file holds bundles and the access token, so it is only opened in a
+directory owned by the service user and closed to everyone else (by default
+a per-user directory under the system temp dir), and only if the service
+user owns it (see private_files); otherwise the caches fall back to memory.
+
+Entries carry a hard expiry (wall-clock, so it means the same in every
+process); the caches keep their own freshness/staleness times inside the
+value. Backend errors are logged and treated as misses: a cache that cannot
+be read must not fail the request.
+
+`make_backend(namespace, ...)` returns the backend chosen by
+`settings.cache_backend`.
+"""
+import logging
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+
+import orjson
+
+from app.settings import settings
+from app.services.private_files import default_path, open_private
+
+log = logging.getLogger("cache_backend")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_v2 (
+    ns         TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      BLOB NOT NULL,
+    size       INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_v2_expiry ON cache_v2 (ns, expires_at);
+"""
+
+# SQLite backend: trim a namespace back to its bounds every this many writes
+_TRIM_EVERY = 64
+
+
+class CacheBackend(ABC):
+    """
+    get(key)                      -> stored value, or None when absent/expired
+    set(key, value, expires_at)   store until `expires_at` (time.time())
+    add(key, value, expires_at)   store only if absent or expired; True if stored
+    delete(key) / clear()
+    stats()                       size, bytes, evictions, ...
+    """
+
+    kind = "none"
+
+    def __init__(self, namespace: str, maxsize: int | None = None, max_bytes: int | None = None):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.evictions = 0
+
+    @abstractmethod
+    def get(self, key):
+        ...
+
+    @abstractmethod
+    def set(self, key, value, expires_at: float, size: int = 0) -> None:
+        ...
+
+    @abstractmethod
+    def add(self, key, value, expires_at: float) -> bool:
+        ...
+
+    @abstractmethod
+    def delete(self, key) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process LRU; `size` passed to set() counts towards `max_bytes`."""
+
+    kind = "memory"
+
+    def __init__(self, namespace: str, maxsize: int | None = None, max_bytes: int | None = None):
+        super().__init__(namespace, maxsize, max_bytes)
+        self._data: OrderedDict = OrderedDict()   # key -> (value, expires_at, size)
+        self._bytes = 0
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if time.time() >= item[1]:
+            self._drop(key)
+            return None
+        self._data.move_to_end(key)
+        return item[0]
+
+    def set(self, key, value, expires_at: float, size: int = 0) -> None:
+        self._drop(key)
+        self._data[key] = (value, expires_at, size)
+        self._bytes += size
+        while self._data and ((self.maxsize is not None and len(self._data) > self.maxsize)
+                              or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            _, (_, _, evicted) = self._data.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+    def add(self, key, value, expires_at: float) -> bool:
+        if self.get(key) is not None:
+            return False
+        self.set(key, value, expires_at)
+        return True
+
+    def delete(self, key) -> None:
+        self._drop(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {"backend": self.kind, "size": len(self._data), "bytes": self._bytes,
+                "evictions": self.evictions}
+
+    def _drop(self, key) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Host-wide cache in a SQLite file. When a namespace grows past its bounds,
+    expired entries go first, then those closest to expiry (reads never write,
+    so there is no shared LRU order to maintain).
+    """
+
+    kind = "sqlite"
+
+    def __init__(self, namespace: str, path: str, maxsize: int | None = None,
+                 max_bytes: int | None = None):
+        super().__init__(namespace, maxsize, max_bytes)
+        self.path = path
+        self.errors = 0
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key):
+        row = self._execute(
+            "SELECT value FROM cache_v2 WHERE ns = ? AND key = ? AND expires_at > ?",
+            (self.namespace, _key(key), time.time()),
+        )
+        if not row:
+            return None
+        try:
+            return orjson.loads(row[0][0])
+        except orjson.JSONDecodeError as e:
+            self.errors += 1
+            log.warning("Cache %s: unreadable entry dropped: %s", self.namespace, e)
+            self.delete(key)
+            return None
+
+    def set(self, key, value, expires_at: float, size: int = 0) -> None:
+        blob = self._dumps(value)
+        if blob is None or (self.max_bytes is not None and len(blob) > self.max_bytes):
+            return
+        self._execute(
+            "INSERT OR REPLACE INTO cache_v2 (ns, key, value, size, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, _key(key), blob, len(blob), expires_at), write=True,
+        )
+
+    def add(self, key, value, expires_at: float) -> bool:
+        blob = self._dumps(value)
+        if blob is None:
+            return False
+        # Upsert that only replaces an expired row; RETURNING says whether we won.
+        rows = self._execute(
+            "INSERT INTO cache_v2 (ns, key, value, size, expires_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (ns, key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+            "expires_at = excluded.expires_at WHERE cache_v2.expires_at <= ? "
+            "RETURNING 1",
+            (self.namespace, _key(key), blob, len(blob), expires_at, time.time()), write=True,
+        )
+        return bool(rows)
+
+    def delete(self, key) -> None:
+        self._execute("DELETE FROM cache_v2 WHERE ns = ? AND key = ?",
+                      (self.namespace, _key(key)), write=True)
+
+    def clear(self) -> None:
+        self._execute("DELETE FROM cache_v2 WHERE ns = ?", (self.namespace,), write=True)
+
+    def stats(self) -> dict:
+        row = self._execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_v2 WHERE ns = ? AND expires_at > ?",
+            (self.namespace, time.time()),
+        )
+        size, nbytes = row[0] if row else (0, 0)
+        return {"backend": self.kind, "size": size, "bytes": nbytes,
+                "evictions": self.evictions, "errors": self.errors}
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    def _dumps(self, value) -> bytes | None:
+        try:
+            return orjson.dumps(value)
+        except orjson.JSONEncodeError as e:
+            self.errors += 1
+            log.warning("Cache %s: value not storable: %s", self.namespace, e)
+            return None
+
+    def _execute(self, sql: str, params: tuple, write: bool = False) -> list:
+        try:
+            with self._lock:
+                conn = self._connect()
+                rows = conn.execute(sql, params).fetchall()
+                if not write:
+                    return rows
+                self._writes += 1
+                if self._writes % _TRIM_EVERY == 0:
+                    self._trim(conn)
+                return rows
+        except sqlite3.Error as e:
+            self.errors += 1
+            log.warning("Cache %s: %s failed: %s", self.namespace, sql.split(None, 1)[0], e)
+            return []
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not cross a fork; each worker opens its own.
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = _open(self.path)
+            self._pid = os.getpid()
+        return self._conn
+
+    def _trim(self, conn: sqlite3.Connection) -> None:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        cur = conn.execute("DELETE FROM cache_v2 WHERE ns = ? AND expires_at <= ?",
+                           (self.namespace, time.time()))
+        self.evictions += cur.rowcount
+        if self.maxsize is None and self.max_bytes is None:
+            return
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_v2 WHERE ns = ?", (self.namespace,),
+        ).fetchone()
+        over_count = count - self.maxsize if self.maxsize is not None else 0
+        over_bytes = total - self.max_bytes if self.max_bytes is not None else 0
+        victims = []
+        if over_count > 0 or over_bytes > 0:
+            for key, size in conn.execute(
+                "SELECT key, size FROM cache_v2 WHERE ns = ? ORDER BY expires_at", (self.namespace,),
+            ):
+                if over_count <= 0 and over_bytes <= 0:
+                    break
+                victims.append((self.namespace, key))
+                over_count -= 1
+                over_bytes -= size
+        conn.executemany("DELETE FROM cache_v2 WHERE ns = ? AND key = ?", victims)
+        self.evictions += len(victims)
+
+
+def _key(key) -> str:
+    # Cache keys are strings or small tuples of strings/ints
+    return key if isinstance(key, str) else repr(key)
+
+
+def _open(path: str) -> sqlite3.Connection:
+    os.close(open_private(path))   # holds tokens: owner-only
+    conn = sqlite3.connect(path, timeout=0.5, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")      # a cache can lose its last writes on power loss
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def make_backend(namespace: str, maxsize: int | None = None, max_bytes: int | None = None) -> CacheBackend:
+    """Backend for one cache, as configured by CACHE_BACKEND / CACHE_PATH."""
+    if settings.cache_backend == "sqlite":
+        path = settings.cache_path or default_path("cache.sqlite3")
+        try:
+            _open(path).close()
+            return SQLiteBackend(namespace, path, maxsize, max_bytes)
+        except (OSError, sqlite3.Error) as e:
+            log.warning("Cannot use %s as shared cache (%s); %s stays per-process",
+                        path, e, namespace)
+            return MemoryBackend(namespace, maxsize, max_bytes)
+    if settings.cache_backend != "memory":
+        log.warning("Unknown CACHE_BACKEND %r; using memory", settings.cache_backend)
+    return MemoryBackend(namespace, maxsize, max_bytes)
@@ -0,0 +1,137 @@
+# app/services/drug_search.py
+"""
+In-memory typeahead index over the pricebook's Description and Generic
+columns, built alongside each PricebookIndex.
+
+Both columns are split into lowercase alphanumeric tokens. A query term
+matches every vocabulary token it is a prefix of (bisect on the sorted
+vocabulary); a term that prefixes nothing falls back to trigram overlap, which
+catches typos and infixes ("amoxycillin", "cillin"). Every term must match.
+Hits are ranked in tiers:
+
+1. the description starts with the first term and every term is a whole word;
+2. the description starts with the first term;
+3. every term is a whole word;
+4. everything else;
+
+and within a tier shorter descriptions first. Documents are numbered in that
+static order when the index is built, so ranking inside a tier is picking the
+lowest ids, and all the set work happens in C.
+"""
+import heapq
+import math
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_AFTER = "\x7f"   # sorts after every token character
+
+NGRAM = 3
+FUZZY_MIN_OVERLAP = 0.6   # share of a term's trigrams a token must contain to match it
+MAX_TERMS = 8
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def _grams(token: str) -> set[str]:
+    return {token[i:i + NGRAM] for i in range(len(token) - NGRAM + 1)}
+
+
+def _prefixed(vocab: list[str], term: str) -> list[str]:
+    return vocab[bisect_left(vocab, term):bisect_left(vocab, term + _AFTER)]
+
+
+class SearchIndex:
+    """Immutable; build a new one (passing the old as `previous`) on reload."""
+
+    __slots__ = ("docs", "vocab", "postings", "lead_vocab", "lead_postings", "grams", "_words")
+
+    def __init__(self, docs: list[tuple[str, str, str]], previous: "SearchIndex | None" = None):
+        """
+        `docs` are (gtin, description, generic) rows; the first row of a GTIN
+        wins. Tokenized rows are carried over from `previous`, so a reload only
+        tokenizes rows whose text changed.
+        """
+        seen = set()
+        unique = []
+        for doc in docs:
+            if doc[0] not in seen:
+                seen.add(doc[0])
+                unique.append(doc)
+        unique.sort(key=lambda d: (len(d[1]), d[1].lower()))
+        self.docs = unique
+
+        # (description, generic) -> (distinct words, first description word)
+        known = previous._words if previous is not None else {}
+        row_words: dict[tuple[str, str], tuple[tuple[str, ...], str | None]] = {}
+        postings: defaultdict[str, list[int]] = defaultdict(list)
+        lead_postings: defaultdict[str, list[int]] = defaultdict(list)
+        for doc_id, (_, description, generic) in enumerate(unique):
+            text = (description, generic)
+            entry = row_words.get(text) or known.get(text)
+            if entry is None:
+                lead = tokenize(description)
+                entry = (tuple(set(lead).union(tokenize(generic))), lead[0] if lead else None)
+            row_words[text] = entry
+            words, lead = entry
+            for word in words:
+                postings[word].append(doc_id)
+            if lead is not None:
+                lead_postings[lead].append(doc_id)
+
+        grams: dict[str, list[str]] = {}
+        for word in postings:
+            for gram in _grams(word):
+                grams.setdefault(gram, []).append(word)
+
+        self.vocab = sorted(postings)
+        self.postings = dict(postings)
+        self.lead_vocab = sorted(lead_postings)
+        self.lead_postings = dict(lead_postings)
+        self.grams = grams
+        self._words = row_words
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def search(self, query: str, limit: int = 20) -> tuple[int, list[tuple[str, str, str]]]:
+        """(number of matching rows, best `limit` of them as (gtin, description, generic))."""
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_TERMS]
+        if not terms:
+            return 0, []
+
+        matched, exact = [], []
+        for term in terms:
+            words = _prefixed(self.vocab, term) or self._fuzzy(term)
+            if not words:
+                return 0, []
+            matched.append(set().union(*(self.postings[w] for w in words)))
+            exact.append(self.postings.get(term, ()))
+        matched.sort(key=len)
+        candidates = matched[0].intersection(*matched[1:])
+        if not candidates:
+            return 0, []
+
+        leading = _prefixed(self.lead_vocab, terms[0])
+        lead = candidates.intersection(set().union(*(self.lead_postings[w] for w in leading)))
+        whole = candidates.intersection(*exact)
+        hits: list[int] = []
+        for tier in (lead & whole, lead - whole, whole - lead, candidates - lead - whole):
+            if len(hits) >= limit:
+                break
+            hits.extend(heapq.nsmallest(limit - len(hits), tier))
+        return len(candidates), [self.docs[i] for i in hits]
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    def _fuzzy(self, term: str) -> list[str]:
+        grams = _grams(term)
+        if not grams:
+            return []
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.grams.get(gram, ()))
+        need = math.ceil(len(grams) * FUZZY_MIN_OVERLAP)
+        return [word for word, n in counts.items() if n >= need]
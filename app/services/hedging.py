@@ -0,0 +1,163 @@
+# app/services/hedging.py
+"""
+Request hedging for idempotent upstream GETs, to cut tail latency.
+
+When an attempt has not answered within the hedge delay, a second, identical
+attempt is sent; whichever response arrives first is used and the other
+attempt is cancelled (or its response closed). The delay adapts to the
+upstream: it is a high percentile (`settings.hedge_percentile`) of the
+recent first-attempt latencies, so only the slowest few percent of calls
+are hedged.
+
+A hedge budget keeps extra load bounded: every request earns
+`settings.hedge_budget` of a hedge (0.05 = at most one hedge per 20
+requests, with a small burst), and no hedge is sent without credit. Until
+enough latencies have been seen nothing is hedged.
+
+`HedgedTransport` sits under ResilientTransport (see http_clients), so a
+hedged pair counts as one attempt for retries and the circuit breaker, and
+each of its attempts is timed and counted like any other call.
+"""
+import asyncio
+import time
+from collections import deque
+
+import httpx
+
+from app.settings import settings
+
+IDEMPOTENT = frozenset({"GET", "HEAD"})
+RECOMPUTE_EVERY = 16   # samples between recomputing the hedge delay
+MAX_CREDIT = 10.0      # hedges that may be saved up for a burst of slow calls
+
+
+class Hedger:
+    """Latency window, hedge delay and budget for one upstream."""
+
+    def __init__(self, name: str, percentile: float, budget: float, window: int,
+                 min_samples: int, min_delay: float):
+        self.name = name
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._delay: float | None = None
+        self._since_recompute = 0
+        self._credit = 0.0
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+        self.over_budget = 0
+
+    def delay(self) -> float | None:
+        """Seconds to wait before hedging; None while there is too little history."""
+        return self._delay
+
+    def observe(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self._since_recompute += 1
+        if len(self._latencies) >= self.min_samples and (
+            self._delay is None or self._since_recompute >= RECOMPUTE_EVERY
+        ):
+            ordered = sorted(self._latencies)
+            at = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+            self._delay = max(self.min_delay, at)
+            self._since_recompute = 0
+
+    def admit(self) -> None:
+        """One request seen; earns its share of the hedge budget."""
+        self.requests += 1
+        self._credit = min(MAX_CREDIT, self._credit + self.budget)
+
+    def take(self) -> bool:
+        """Spend budget on one hedge, if there is enough."""
+        if self._credit < 1:
+            self.over_budget += 1
+            return False
+        self._credit -= 1
+        self.fired += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "delay":       round(self._delay, 4) if self._delay is not None else None,
+            "samples":     len(self._latencies),
+            "requests":    self.requests,
+            "fired":       self.fired,
+            "won":         self.won,
+            "over_budget": self.over_budget,
+            "hedge_ratio": round(self.fired / self.requests, 4) if self.requests else None,
+            "win_ratio":   round(self.won / self.fired, 4) if self.fired else None,
+        }
+
+
+_hedgers: dict[str, Hedger] = {}
+
+
+def hedger(upstream: str) -> Hedger:
+    h = _hedgers.get(upstream)
+    if h is None:
+        h = _hedgers[upstream] = Hedger(
+            upstream, settings.hedge_percentile, settings.hedge_budget, settings.hedge_window,
+            settings.hedge_min_samples, settings.hedge_min_delay,
+        )
+    return h
+
+
+def hedge_stats() -> dict:
+    return {name: h.stats() for name, h in _hedgers.items()}
+
+
+class HedgedTransport(httpx.AsyncBaseTransport):
+    """Transport that hedges slow idempotent requests to `inner`."""
+
+    def __init__(self, upstream: str, inner: httpx.AsyncBaseTransport):
+        self.hedger = hedger(upstream)
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method not in IDEMPOTENT:
+            return await self.inner.handle_async_request(request)
+        h = self.hedger
+        h.admit()
+        start = time.perf_counter()
+        first = asyncio.ensure_future(self.inner.handle_async_request(request))
+        attempts = [first]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=h.delay())
+            if not done and h.take():
+                attempts.append(asyncio.ensure_future(self.inner.handle_async_request(request)))
+            winner = await _first_success(attempts)
+            if winner.exception() is None:
+                h.observe(time.perf_counter() - start)   # of the first attempt, or a lower bound
+                if winner is not first:
+                    h.won += 1
+            return winner.result()
+        finally:
+            losers = [a for a in attempts if a is not winner]
+            for attempt in losers:
+                attempt.cancel()
+            await _discard(losers)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+async def _first_success(attempts: list[asyncio.Future]) -> asyncio.Future:
+    """The first attempt to return a response; the original one if all failed."""
+    pending = set(attempts)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for attempt in attempts:
+            if attempt in done and not attempt.cancelled() and attempt.exception() is None:
+                return attempt
+    return attempts[0]
+
+
+async def _discard(attempts: list[asyncio.Future]) -> None:
+    """Wait out cancelled attempts, closing any response that arrived regardless."""
+    for result in await asyncio.gather(*attempts, return_exceptions=True):
+        if isinstance(result, httpx.Response):
+            await result.aclose()
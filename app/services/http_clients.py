@@ -0,0 +1,105 @@
+# app/services/http_clients.py
+"""
+Shared outbound HTTP clients: one pooled, keep-alive AsyncClient per upstream
+host (token exchange, FHIR, PBS). Opened in the app lifespan and reused by
+every request, so calls skip the TCP+TLS handshake after the first.
+Every call is timed and its failures counted in app.metrics, and goes
+through the retry/deadline/circuit-breaker layer in resilience; FHIR
+GETs can also be hedged (see hedging).
+"""
+import time
+
+import httpx
+
+from app import metrics, profiling
+from app.settings import settings
+from app.services.hedging import HedgedTransport
+from app.services.rate_governor import GovernedTransport, pbs_governor
+from app.services.resilience import ResilientTransport, send_by_deadline
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+UPSTREAMS = ("token", "fhir", "pbs")
+
+LIMITS  = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """
+    Pooled transport that records latency and errors for one upstream, and
+    times each send out at the deadline of the call it belongs to.
+    """
+
+    def __init__(self, upstream: str, **kwargs):
+        super().__init__(**kwargs)
+        self.upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = metrics.upstream_endpoint(request.url.path)
+        start = time.perf_counter()
+        try:
+            response = await send_by_deadline(super().handle_async_request, request)
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            metrics.observe_upstream(self.upstream, endpoint, elapsed, error=e)
+            profiling.record("upstream", start, elapsed, upstream=self.upstream, endpoint=endpoint,
+                             error=type(e).__name__)
+            raise
+        elapsed = time.perf_counter() - start
+        metrics.observe_upstream(self.upstream, endpoint, elapsed, response.status_code)
+        profiling.record("upstream", start, elapsed, upstream=self.upstream, endpoint=endpoint,
+                         status=response.status_code)
+        return response
+
+
+def make_client(upstream: str) -> httpx.AsyncClient:
+    """New pooled client for `upstream` with metrics and resilience wired in."""
+    inner = InstrumentedTransport(upstream, http2=HTTP2, limits=LIMITS)
+    if upstream == "pbs":
+        # Every attempt, retries included, waits for a host-wide quota slot
+        inner = GovernedTransport(pbs_governor, inner)
+    if upstream == "fhir" and settings.fhir_hedge_enabled:
+        # A hedged pair is one attempt as far as retries and the breaker go
+        inner = HedgedTransport(upstream, inner)
+    return httpx.AsyncClient(transport=ResilientTransport(upstream, inner), timeout=TIMEOUT)
+
+
+class UpstreamClients:
+    def __init__(self):
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    async def start(self) -> None:
+        for name in UPSTREAMS:
+            self.get(name)
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Client for `name`; created on first use outside the app lifespan (CLI, scripts)."""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = make_client(name)
+        return client
+
+    @property
+    def token(self) -> httpx.AsyncClient:
+        return self.get("token")
+
+    @property
+    def fhir(self) -> httpx.AsyncClient:
+        return self.get("fhir")
+
+    @property
+    def pbs(self) -> httpx.AsyncClient:
+        return self.get("pbs")
+
+
+http_clients = UpstreamClients()
@@ -0,0 +1,148 @@
+# app/services/pbs_ingest.py
+"""
+Offline PBS schedule ingester.
+
+Pages through the v3 /items and /item-dispensing-rule-relationships endpoints
+for one schedule and writes them to a SQLite snapshot (see pbs_snapshot).
+
+    python -m app.services.pbs_ingest --out pbs_snapshot.sqlite [--schedule 3900]
+
+The public data API allows roughly one request every 20 seconds, so requests
+are paced by --min-interval and 429s honour Retry-After. The snapshot is
+written to a temp file and renamed into place, so a running service never
+sees a half-written file.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import requests
+
+from app.services.pbs_pricing import PBS_API_KEY, PBS_BASE_URL, PBS_SNAPSHOT_PATH, schedule_month
+from app.services.pbs_snapshot import INDEXES, SCHEMA
+
+log = logging.getLogger("pbs_ingest")
+
+PAGE_SIZE    = 1000
+MIN_INTERVAL = 20.0   # seconds between requests
+MAX_RETRIES  = 5
+
+
+class PbsPager:
+    """Paced, 429-aware pager over one PBS API collection endpoint."""
+
+    def __init__(self, base_url: str = PBS_BASE_URL, api_key: str | None = PBS_API_KEY,
+                 min_interval: float = MIN_INTERVAL, page_size: int = PAGE_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.min_interval = min_interval
+        self.page_size = page_size
+        self.session = requests.Session()
+        self.session.headers["subscription-key"] = api_key or ""
+        self._last_request = 0.0
+        self.requests = 0
+
+    def pages(self, path: str, params: dict):
+        """Yield the `data` list of each page until the collection is exhausted."""
+        page = 1
+        seen = 0
+        while True:
+            body = self._get(path, {**params, "page": page, "limit": self.page_size})
+            data = body.get("data", [])
+            if not data:
+                return
+            yield data
+            seen += len(data)
+            total = (body.get("_meta") or {}).get("total_records")
+            if len(data) < self.page_size or (total is not None and seen >= int(total)):
+                return
+            page += 1
+
+    def _get(self, path: str, params: dict) -> dict:
+        for attempt in range(1, MAX_RETRIES + 1):
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_request = time.monotonic()
+            self.requests += 1
+            r = self.session.get(f"{self.base_url}{path}", params=params, timeout=60)
+            if r.status_code == 429 and attempt < MAX_RETRIES:
+                retry_after = r.headers.get("Retry-After", "")
+                delay = float(retry_after) if retry_after.isdigit() else self.min_interval * attempt
+                log.warning("429 on %s page %s, retrying in %.0fs", path, params.get("page"), delay)
+                time.sleep(delay)
+                continue
+            r.raise_for_status()
+            return r.json()
+        raise RuntimeError(f"Gave up on {path} after {MAX_RETRIES} attempts")
+
+
+def current_schedule(pager: PbsPager) -> str:
+    mon, yr = schedule_month(0)
+    for s in pager._get("/schedules", {"limit": 100}).get("data", []):
+        if s.get("effective_month", "").upper() == mon and s.get("effective_year") == yr:
+            return s["schedule_code"]
+    raise LookupError(f"No schedule for {mon} {yr}")
+
+
+def ingest(schedule_code: str, out: Path, pager: PbsPager) -> dict:
+    """Write a snapshot for `schedule_code` to `out`; returns row counts."""
+    tmp = out.with_name(out.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        n_items = n_rules = 0
+        for data in pager.pages("/items", {"schedule_code": schedule_code}):
+            conn.executemany(
+                "INSERT INTO items (schedule_code, pbs_code, li_item_id, data) VALUES (?, ?, ?, ?)",
+                [(schedule_code, d.get("pbs_code"), d.get("li_item_id"), json.dumps(d)) for d in data],
+            )
+            n_items += len(data)
+            log.info("items: %d", n_items)
+        for data in pager.pages("/item-dispensing-rule-relationships", {"schedule_code": schedule_code}):
+            conn.executemany(
+                "INSERT INTO rules (schedule_code, li_item_id, data) VALUES (?, ?, ?)",
+                [(schedule_code, d.get("li_item_id"), json.dumps(d)) for d in data],
+            )
+            n_rules += len(data)
+            log.info("rules: %d", n_rules)
+        if not n_items:
+            raise RuntimeError(f"No items returned for schedule {schedule_code}")
+        conn.executescript(INDEXES)
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ("schedule_code", schedule_code),
+            ("ingested_at",   datetime.datetime.now(datetime.timezone.utc).isoformat()),
+            ("items",         str(n_items)),
+            ("rules",         str(n_rules)),
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, out)
+    return {"schedule_code": schedule_code, "items": n_items, "rules": n_rules, "requests": pager.requests}
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description="Snapshot one PBS schedule into SQLite.")
+    ap.add_argument("--out", type=Path, default=Path(PBS_SNAPSHOT_PATH or "pbs_snapshot.sqlite"))
+    ap.add_argument("--schedule", help="schedule code (default: current month's schedule)")
+    ap.add_argument("--base-url", default=PBS_BASE_URL)
+    ap.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    ap.add_argument("--min-interval", type=float, default=MIN_INTERVAL,
+                    help="seconds between API requests")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    pager = PbsPager(args.base_url, PBS_API_KEY, args.min_interval, args.page_size)
+    schedule = args.schedule or current_schedule(pager)
+    result = ingest(schedule, args.out, pager)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
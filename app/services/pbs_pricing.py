@@ -1,15 +1,34 @@
-import os, time, datetime,requests
+import asyncio, datetime, logging
+from collections import Counter
 
-from dotenv import load_dotenv
-from get_token import get_access_token
+import httpx
+from starlette.concurrency import run_in_threadpool
 
+from get_token import get_access_token
+from app.settings import settings
+from app.services.cache import TTLCache
+from app.services.http_clients import http_clients
+from app.services import pbs_snapshot
 
-# ─── Load environment ───────────────────────────────────────────────────────────
-load_dotenv()
+log = logging.getLogger("pbs_pricing")
 
 # ─── Configuration ───────────────────────────────────────────────────────────────
-PBS_API_KEY       = os.getenv("PBS_API_KEY") or os.getenv("OCP_APIM_SUBSCRIPTION_KEY")
-PBS_BASE_URL      = "https://data-api.health.gov.au/pbs/api/v3"
+# From app.settings; see there for what each one does
+PBS_API_KEY            = settings.pbs_api_key or settings.ocp_apim_subscription_key
+PBS_BASE_URL           = settings.pbs_base_url
+
+PBS_CACHE_TTL          = settings.pbs_cache_ttl
+PBS_CACHE_STALE_TTL    = settings.pbs_cache_stale_ttl
+PBS_CACHE_NEGATIVE_TTL = settings.pbs_cache_negative_ttl
+PBS_CACHE_MAXSIZE      = settings.pbs_cache_maxsize
+
+PBS_ITEMS_PER_CALL     = settings.pbs_items_per_call
+PBS_ITEMS_PAGE_SIZE    = settings.pbs_items_page_size
+PBS_ITEMS_MAX_PAGES    = 10
+PBS_BATCH_CONCURRENCY  = settings.pbs_batch_concurrency
+
+PBS_SNAPSHOT_PATH      = settings.pbs_snapshot_path
+PBS_TRACKED_CODES      = settings.pbs_tracked_codes
 
 # ─── Fees & Caps ─────────────────────────────────────────────────────────────────
 GENERAL_CAP       = 31.60
@@ -42,6 +61,41 @@ def markup_tier(amount):
 def cap(price, limit):
     return round(min(price, limit), 2)
 
+
+# Vectorized forms of markup_tier / cap for pricing many lines at once
+MARKUP_BOUNDS = (30.00, 45.00, 450.00, 1000.00, 2000.00)
+
+def markup_tier_array(amount):
+    import numpy as np  # deferred: numpy is only needed for batch pricing
+    a = np.asarray(amount, dtype=np.float64)
+    b = MARKUP_BOUNDS
+    return np.select(
+        [a <= b[0], a <= b[1], a <= b[2], a <= b[3], a <= b[4]],
+        [0.15 * a, 4.50, 0.10 * a, 45.00, 0.045 * a],
+        default=90.00,
+    )
+
+
+def round_cents(values):
+    """
+    Vectorized round(x, 2). np.round scales by 100 first, which can land on the
+    other side of a half cent than Python's exact round(); those few near-tie
+    values are re-rounded with round() so batch and single prices agree.
+    """
+    import numpy as np
+    a = np.asarray(values, dtype=np.float64)
+    out = np.round(a, 2)
+    scaled = a * 100
+    near_tie = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    if near_tie.size:
+        out[near_tie] = [round(float(v), 2) for v in a[near_tie]]
+    return out
+
+
+def cap_array(price, limit):
+    import numpy as np
+    return round_cents(np.minimum(price, limit))
+
 # ─── DPMQ Calculators ────────────────────────────────────────────────────────────
 def DPMQ_calculate_PBS(base_price, quantity, is_schedule_8, container_fee, pfdi):
     price_to_pharmacist = base_price * quantity
@@ -52,49 +106,108 @@ def DPMQ_calculate_PBS(base_price, quantity, is_schedule_8, container_fee, pfdi)
 
 
 # ─── PBS API Routines ───────────────────────────────────────────────────────────
-def get_schedule(months_back=0):
-    today = datetime.datetime.now()
+def schedule_month(months_back=0, today=None):
+    today = today or datetime.datetime.now()
     ref = (today.replace(day=1) - datetime.timedelta(days=1)) if months_back else today
-    mon, yr = ref.strftime('%B').upper(), ref.year
-    backoff = 1
-    for attempt in range(3):
-        r = requests.get(f"{PBS_BASE_URL}/schedules?limit=100", headers={'subscription-key': PBS_API_KEY})
+    return ref.strftime('%B').upper(), ref.year
+
+
+def next_schedule_month(today=None):
+    today = today or datetime.datetime.now()
+    ref = (today.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+    return ref.strftime('%B').upper(), ref.year
+
+
+async def _lookup_schedule(mon, yr):
+    # 429s are retried (honouring Retry-After) by the PBS client's transport
+    r = await http_clients.pbs.get(f"{PBS_BASE_URL}/schedules?limit=100", headers={'subscription-key': PBS_API_KEY})
+    r.raise_for_status()
+    for s in r.json().get('data', []):
+        if s.get('effective_month','').upper() == mon and s.get('effective_year') == yr:
+            return s['schedule_code']
+    raise LookupError(f"No schedule for {mon} {yr}")
+
+
+async def _fetch_item_upstream(pbs_code, sched_code):
+    r = await http_clients.pbs.get(f"{PBS_BASE_URL}/items", headers={'subscription-key': PBS_API_KEY}, params={'pbs_code': pbs_code, 'schedule_code': sched_code, 'limit':1})
+    r.raise_for_status()
+    data = r.json().get('data', [])
+    if not data: raise LookupError(f"PBS item {pbs_code} not found in schedule {sched_code}")
+    itm = data[0]; itm['schedule_code'] = sched_code; return itm
+
+
+async def _fetch_items_upstream(pbs_codes: list[str], sched_code: str) -> dict:
+    """
+    Items for several codes with one (paged) /items call using a
+    comma-separated pbs_code filter; {code: item or LookupError}. The first
+    row of each code is used, as with limit=1. If the API returns nothing at
+    all for a multi-code filter, or rejects it, the codes are looked up one
+    by one instead, so an unsupported filter is never mistaken for "not found".
+    """
+    wanted = set(pbs_codes)
+    found: dict = {}
+    for page in range(1, PBS_ITEMS_MAX_PAGES + 1):
+        r = await http_clients.pbs.get(
+            f"{PBS_BASE_URL}/items", headers={'subscription-key': PBS_API_KEY},
+            params={'pbs_code': ",".join(pbs_codes), 'schedule_code': sched_code,
+                    'limit': PBS_ITEMS_PAGE_SIZE, 'page': page},
+        )
+        if r.status_code in (400, 422) and len(pbs_codes) > 1:
+            return await _fetch_items_one_by_one(pbs_codes, sched_code)
+        r.raise_for_status()
+        data = r.json().get('data', [])
+        for itm in data:
+            code = itm.get('pbs_code')
+            if code in wanted and code not in found:
+                itm['schedule_code'] = sched_code
+                found[code] = itm
+        if len(data) < PBS_ITEMS_PAGE_SIZE or len(found) == len(wanted):
+            break
+    if not found and len(pbs_codes) > 1:
+        return await _fetch_items_one_by_one(pbs_codes, sched_code)
+    return {
+        code: found.get(code) or LookupError(f"PBS item {code} not found in schedule {sched_code}")
+        for code in pbs_codes
+    }
+
+
+async def _fetch_items_one_by_one(pbs_codes: list[str], sched_code: str) -> dict:
+    async def one(code):
         try:
-            r.raise_for_status()
-            for s in r.json().get('data', []):
-                if s.get('effective_month','').upper() == mon and s.get('effective_year') == yr:
-                    return s['schedule_code']
-            raise Exception(f"No schedule for {mon} {yr}")
-        except requests.exceptions.HTTPError:
-            if r.status_code == 429 and attempt < 2:
-                time.sleep(backoff); backoff *= 2; continue
-            raise
-    raise Exception('Failed to fetch schedule')
-
-
-def fetch_item(pbs_code, sched_code):
-    backoff = 1
-    for attempt in range(3):
-        r = requests.get(f"{PBS_BASE_URL}/items", headers={'subscription-key': PBS_API_KEY}, params={'pbs_code': pbs_code, 'schedule_code': sched_code, 'limit':1})
+            return code, await _fetch_item_upstream(code, sched_code)
+        except Exception as e:
+            return code, e
+    return dict(await asyncio.gather(*(one(c) for c in pbs_codes)))
+
+
+async def _load_items(keys: list[tuple[str, str]]) -> dict:
+    """item_cache loader for many (pbs_code, schedule_code) keys at once."""
+    by_sched: dict[str, list[str]] = {}
+    for code, sched in keys:
+        by_sched.setdefault(sched, []).append(code)
+    chunks = [(codes[i:i + PBS_ITEMS_PER_CALL], sched)
+              for sched, codes in by_sched.items()
+              for i in range(0, len(codes), PBS_ITEMS_PER_CALL)]
+
+    async def one(codes, sched):
         try:
-            r.raise_for_status()
-            data = r.json().get('data', [])
-            if not data: raise Exception('PBS item not found')
-            itm = data[0]; itm['schedule_code'] = sched_code; return itm
-        except requests.exceptions.HTTPError:
-            if r.status_code == 429 and attempt < 2:
-                time.sleep(backoff); backoff*=2; continue
-            raise
-    raise Exception('Failed to fetch PBS item')
-
-
-def fetch_rules(li_item_id: str) -> tuple[float|None, float]:
+            return sched, await _fetch_items_upstream(codes, sched)
+        except Exception as e:
+            return sched, {code: e for code in codes}
+
+    out = {}
+    for sched, items in await asyncio.gather(*(one(c, s) for c, s in chunks)):
+        out.update(((code, sched), item) for code, item in items.items())
+    return out
+
+
+async def _fetch_rules_upstream(li_item_id: str) -> tuple[float|None, float]:
     """
     Pull the 'cmnwlth_dsp_price_max_qty' and brand_premium from the
     item-dispensing-rule-relationships endpoint. Only records with
     dispensing_rule_mnem of 'S90-CP' are used for DPMQ.
     """
-    r = requests.get(
+    r = await http_clients.pbs.get(
         f"{PBS_BASE_URL}/item-dispensing-rule-relationships",
         headers={"subscription-key": PBS_API_KEY},
         params={"li_item_id": li_item_id, "limit": 50},
@@ -105,7 +218,11 @@ def fetch_rules(li_item_id: str) -> tuple[float|None, float]:
             f"Unauthorized: invalid PBS_API_KEY for /liitems/{li_item_id}/item-dispensing-rule-relationships"
         )
     r.raise_for_status()
-    data = r.json().get("data", [])
+    return rules_from_records(r.json().get("data", []))
+
+
+def rules_from_records(data: list[dict]) -> tuple[float|None, float]:
+    """Reduce item-dispensing-rule records to (DPMQ, brand premium)."""
     dpmq = None
     brand_premium = 0.0
     for rec in data:
@@ -126,6 +243,124 @@ def fetch_rules(li_item_id: str) -> tuple[float|None, float]:
                 pass
     return (dpmq, brand_premium)
 
+# ─── Cached Lookups ──────────────────────────────────────────────────────────────
+schedule_cache = TTLCache("pbs_schedule", maxsize=12, negative_ttl=PBS_CACHE_NEGATIVE_TTL)
+item_cache = TTLCache(
+    "pbs_item", maxsize=PBS_CACHE_MAXSIZE, ttl=PBS_CACHE_TTL,
+    stale_ttl=PBS_CACHE_STALE_TTL, negative_ttl=PBS_CACHE_NEGATIVE_TTL,
+)
+rules_cache = TTLCache(
+    "pbs_rules", maxsize=PBS_CACHE_MAXSIZE, ttl=PBS_CACHE_TTL,
+    stale_ttl=PBS_CACHE_STALE_TTL, negative_ttl=PBS_CACHE_NEGATIVE_TTL,
+)
+
+
+def seconds_to_month_end(now=None, months_ahead=0):
+    now = now or datetime.datetime.now()
+    end = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(months_ahead + 1):
+        end = (end + datetime.timedelta(days=32)).replace(day=1)
+    return max(1.0, (end - now).total_seconds())
+
+
+async def get_schedule(months_back=0):
+    """
+    Schedule code for the current (or previous) month. Keyed on the calendar
+    month, and expiring at the month boundary, so the schedules list is only
+    downloaded once per month.
+    """
+    mon, yr = schedule_month(months_back)
+    return await schedule_cache.get_or_load(
+        (yr, mon), lambda: _lookup_schedule(mon, yr), ttl=seconds_to_month_end()
+    )
+
+
+async def next_schedule(today=None):
+    """
+    Schedule code for next month, cached until the end of next month;
+    LookupError until it has been published. Fetching it before the month
+    boundary means get_schedule(0) is a cache hit from the first second.
+    """
+    mon, yr = next_schedule_month(today)
+    return await schedule_cache.get_or_load(
+        (yr, mon), lambda: _lookup_schedule(mon, yr), ttl=seconds_to_month_end(today, months_ahead=1)
+    )
+
+
+async def current_schedule():
+    """This month's schedule code, or last month's until this month's is published."""
+    try:
+        return await get_schedule(0)
+    except LookupError as e:
+        sched = await get_schedule(1)
+        log.warning("%s; pricing against last month's schedule %s", e, sched)
+        return sched
+
+
+async def fetch_item(pbs_code, sched_code):
+    return await item_cache.get_or_load(
+        (pbs_code, sched_code), lambda: _fetch_item_upstream(pbs_code, sched_code)
+    )
+
+
+async def fetch_rules(li_item_id: str) -> tuple[float|None, float]:
+    return await rules_cache.get_or_load(li_item_id, lambda: _fetch_rules_upstream(li_item_id))
+
+
+async def fetch_items(keys) -> dict:
+    """fetch_item for many (pbs_code, schedule_code) keys; {key: item or exception}."""
+    return await item_cache.get_or_load_many(keys, _load_items)
+
+
+async def fetch_rules_many(li_item_ids, concurrency: int = PBS_BATCH_CONCURRENCY) -> dict:
+    """fetch_rules for each distinct id, `concurrency` at a time; {id: rules or exception}."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(li_item_id):
+        async with sem:
+            try:
+                return li_item_id, await fetch_rules(li_item_id)
+            except Exception as e:
+                return li_item_id, e
+    return dict(await asyncio.gather(*(one(li) for li in dict.fromkeys(li_item_ids))))
+
+
+async def prefetch(pbs_code: str) -> None:
+    """Warm the current schedule's item and rules lookups for `pbs_code`."""
+    if pbs_snapshot.current(PBS_SNAPSHOT_PATH) is not None:
+        return   # served from the snapshot; nothing to warm
+    code = pbs_code.strip().upper()
+    sched = await current_schedule()
+    item = await item_cache.prefetch((code, sched), lambda: _fetch_item_upstream(code, sched))
+    await prefetch_rules(item["li_item_id"])
+
+
+async def prefetch_rules(li_item_id: str) -> tuple[float|None, float]:
+    return await rules_cache.prefetch(li_item_id, lambda: _fetch_rules_upstream(li_item_id))
+
+
+class CodeCounter:
+    """How often each PBS code was priced, bounded to roughly the `maxsize` busiest."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.counts: Counter = Counter()
+
+    def note(self, codes) -> None:
+        self.counts.update(codes)
+        if len(self.counts) > 2 * self.maxsize:
+            self.counts = Counter(dict(self.counts.most_common(self.maxsize)))
+
+    def top(self, n: int) -> list[str]:
+        return [code for code, _ in self.counts.most_common(n)]
+
+
+requested_codes = CodeCounter(PBS_TRACKED_CODES)
+
+
+def cache_stats() -> dict:
+    return {c.name: c.stats() for c in (schedule_cache, item_cache, rules_cache)}
+
 # ─── Pricing Functions ──────────────────────────────────────────────────────────
 # def price_pbs():
     pbs_code = input("Enter PBS code: ").strip().upper()
@@ -151,22 +386,122 @@ def fetch_rules(li_item_id: str) -> tuple[float|None, float]:
     brand_cost = round((general_cost if auth else FDP)+brand_pr,2)
     print({'DPMQ':D,'FDP':FDP,'General':general_cost,'Concessional':concess_cost,'Brand':brand_cost})
 #--- Price Calcu -------------------------
-def calc_pbs_price(
+async def calc_pbs_price(
     pbs_code: str,
     schedule_code: str|None = None,
     quantity: int = 1,
     authority_medicare: bool = False,
     concession_eligible: bool = False,
+    schedule_number: str|None = None,
 ) -> dict:
     code = pbs_code.strip().upper()
-    sched = schedule_code or get_schedule(0)
-    item  = fetch_item(code, sched)
+    requested_codes.note((code,))
+    from_snapshot = await run_in_threadpool(_read_snapshot, [(code, schedule_code)]) if PBS_SNAPSHOT_PATH else None
+    if from_snapshot is not None:
+        # Snapshot-backed mode: no calls to the PBS data API at all
+        default, items, rules = from_snapshot
+        sched = schedule_code or default
+        item  = items[(code, sched)]
+        if isinstance(item, BaseException):
+            raise item
+        dpmq_val, brand_pr = rules[item["li_item_id"]]
+    else:
+        sched = schedule_code or await current_schedule()
+        item  = await fetch_item(code, sched)
+        dpmq_val, brand_pr = await fetch_rules(item["li_item_id"])
+    return _price(item, (dpmq_val, brand_pr), sched, quantity,
+                  authority_medicare, concession_eligible, schedule_number)
+
+
+async def calc_pbs_prices(lines) -> list[dict]:
+    """
+    Price many lines (pbs_code/qty/auth/conc/sched attributes, see
+    PbsBatchLine) with upstream calls per distinct item, not per line: the
+    current schedule is resolved once, items are fetched in bulk and the
+    rules of each distinct li_item_id once, concurrently. Returns one entry
+    per line, in order: {"pbs_code", "result"} or {"pbs_code", "error"}.
+    """
+    lines = list(lines)
+    codes = [line.pbs_code.strip().upper() for line in lines]
+    requested_codes.note(codes)
+    from_snapshot = await run_in_threadpool(
+        _read_snapshot, [(code, line.sched) for code, line in zip(codes, lines)]
+    ) if PBS_SNAPSHOT_PATH else None
+
+    if from_snapshot is not None:
+        default, items, rules = from_snapshot
+    elif any(not line.sched for line in lines):
+        try:
+            default = await current_schedule()
+        except Exception as e:
+            default = e
+    else:
+        default = None
+    scheds = [line.sched or default for line in lines]
+    keys = {(code, sched) for code, sched in zip(codes, scheds) if isinstance(sched, str)}
+
+    if from_snapshot is None:
+        items = await fetch_items(keys)
+        rules = await fetch_rules_many(
+            item["li_item_id"] for item in items.values() if isinstance(item, dict)
+        )
+
+    out = []
+    for line, code, sched in zip(lines, codes, scheds):
+        # Each step yields a value or the exception that stopped the line;
+        # `sched` itself is an exception when the schedule lookup failed.
+        item = items.get((code, sched), sched)
+        found = rules.get(item["li_item_id"]) if isinstance(item, dict) else item
+        try:
+            if isinstance(found, BaseException):
+                raise found
+            out.append({"pbs_code": line.pbs_code, "result": _price(
+                item, found, sched, line.qty, line.auth, line.conc,
+            )})
+        except Exception as e:
+            out.append({"pbs_code": line.pbs_code, "error": _line_error(e)})
+    return out
+
+
+def _read_snapshot(keys) -> tuple[str, dict, dict] | None:
+    """
+    (default schedule, items, rules) for `keys` ((pbs_code, sched or None)
+    pairs) from the PBS snapshot, or None when none is configured. Items and
+    rules are keyed as in calc_pbs_prices; a missing item is its LookupError.
+    Blocks on SQLite: run it in the threadpool.
+    """
+    snapshot = pbs_snapshot.current(PBS_SNAPSHOT_PATH)
+    if snapshot is None:
+        return None
+    default = snapshot.schedule_code
+    items, rules = {}, {}
+    for code, sched in dict.fromkeys((code, sched or default) for code, sched in keys):
+        try:
+            items[(code, sched)] = snapshot.fetch_item(code, sched)
+        except LookupError as e:
+            items[(code, sched)] = e
+    for item in items.values():
+        if isinstance(item, dict) and item["li_item_id"] not in rules:
+            rules[item["li_item_id"]] = rules_from_records(snapshot.rule_records(item["li_item_id"]))
+    return default, items, rules
+
+
+def _line_error(e: BaseException) -> dict:
+    if isinstance(e, LookupError):
+        return {"status_code": 404, "detail": str(e)}
+    if isinstance(e, httpx.HTTPError):
+        return {"status_code": 502, "detail": str(e) or type(e).__name__}
+    return {"status_code": 500, "detail": str(e)}
+
 
+def _price(item, rules, sched, quantity, authority_medicare, concession_eligible,
+           schedule_number=None) -> dict:
+    """calc_pbs_price's fee logic for an item and its (DPMQ, brand premium)."""
+    dpmq_val, brand_pr = rules
     base_price = float(item["determined_price"])
-    dpmq_val, brand_pr = fetch_rules(item["li_item_id"])
     D = dpmq_val if dpmq_val is not None else base_price * quantity
 
-    if sched == "8":
+    if sched == "8" or schedule_number == "8":
         fdp_raw = D + EXTRA_DISP_FEE + PFDI  # schedule-8 flat load
     elif dpmq_val is not None:
         fdp_raw = D + EXTRA_DISP_FEE + PFDI
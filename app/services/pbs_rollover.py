@@ -0,0 +1,163 @@
+# app/services/pbs_rollover.py
+"""
+Month-rollover pre-warming for PBS pricing.
+
+PBS lookups are keyed on the schedule, and the schedule on the calendar
+month, so at midnight on the 1st every cached item and rule is for the
+wrong schedule at once and all traffic misses upstream together. This
+background task gets ahead of that:
+
+* pbs_pricing counts which codes are priced (`requested_codes`);
+* from `settings.pbs_rollover_lead` seconds before the boundary it checks
+  every `pbs_rollover_interval` seconds for next month's schedule;
+* once that is published, it loads the schedule into the schedule cache
+  (valid until the end of next month) and the items and dispensing rules of
+  the `pbs_rollover_top_n` busiest codes under it, at background priority.
+
+At the boundary nothing needs to happen: the schedule lookup is keyed on
+the clock, so every request switches to the new schedule at the same
+moment, and finds it and its items already cached. If the new schedule has
+not been published by then, pbs_pricing.current_schedule() keeps pricing
+against last month's.
+
+With several workers, one of them (whichever takes the shared lease first)
+does the warming for a schedule; the others find its entries in the shared
+cache. The busiest codes are the ones that worker has seen.
+"""
+import asyncio
+import datetime
+import logging
+import os
+import time
+
+from app.settings import settings
+from app.services import pbs_pricing, pbs_snapshot
+from app.services.cache_backend import make_backend
+from app.services.rate_governor import background
+
+log = logging.getLogger("pbs_rollover")
+
+IDLE, WAITING, WARMING, WARMED, ELSEWHERE = "idle", "waiting_for_schedule", "warming", "warmed", "other_worker"
+
+
+class RolloverWarmer:
+    def __init__(self, lead: float, interval: float, top_n: int, concurrency: int):
+        self.lead = lead
+        self.interval = interval
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self._shared = make_backend("pbs_rollover")
+        self._task: asyncio.Task | None = None
+        self.status = IDLE
+        self.schedule: str | None = None   # next month's schedule, once warmed
+        self.warmed_month: tuple | None = None
+        self.runs = 0
+        self.codes = 0
+        self.items = 0
+        self.rules = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        if settings.pbs_rollover_enabled and self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="pbs-rollover")
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self, now: datetime.datetime | None = None) -> str:
+        """One check; warms next month's schedule if it is due and published. Returns the status."""
+        now = now or datetime.datetime.now()
+        month = pbs_pricing.next_schedule_month(now)
+        if pbs_snapshot.current(pbs_pricing.PBS_SNAPSHOT_PATH) is not None:
+            self.status = IDLE   # snapshot mode: no upstream lookups to warm
+        elif pbs_pricing.seconds_to_month_end(now) > self.lead:
+            self.status = IDLE
+        elif self.warmed_month != month:
+            await self._warm(month, now)
+        return self.status
+
+    def stats(self) -> dict:
+        return {
+            "enabled":       settings.pbs_rollover_enabled,
+            "status":        self.status,
+            "schedule":      self.schedule,
+            "runs":          self.runs,
+            "tracked_codes": len(pbs_pricing.requested_codes.counts),
+            "warmed_codes":  self.codes,
+            "warmed_items":  self.items,
+            "warmed_rules":  self.rules,
+            "failures":      self.failures,
+        }
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                log.warning("PBS rollover check failed: %s", e)
+            await asyncio.sleep(self._sleep_for())
+
+    def _sleep_for(self) -> float:
+        # Sleep through most of the month; check every `interval` in the lead window
+        until_window = pbs_pricing.seconds_to_month_end() - self.lead
+        return max(1.0, min(until_window, self.interval)) if until_window > 0 else self.interval
+
+    async def _warm(self, month: tuple, now: datetime.datetime) -> None:
+        with background():
+            try:
+                sched = await pbs_pricing.next_schedule(now)
+            except LookupError:
+                self.status = WAITING   # not published yet; negative-cached, retried next check
+                return
+            # One worker per schedule; the lease outlives the lead window
+            if not self._shared.add(("warm", sched), os.getpid(), time.time() + self.lead + self.interval):
+                self.status = ELSEWHERE
+                return
+
+            self.status = WARMING
+            self.runs += 1
+            try:
+                await self._load(sched)
+            except BaseException:
+                self.status = WAITING
+                self._shared.delete(("warm", sched))   # let the next check (any worker) retry
+                raise
+        self.schedule = sched
+        self.warmed_month = month
+        self.status = WARMED
+
+    async def _load(self, sched: str) -> None:
+        codes = pbs_pricing.requested_codes.top(self.top_n)
+        start = time.monotonic()
+        items = await pbs_pricing.fetch_items([(code, sched) for code in codes])
+        li_item_ids = list(dict.fromkeys(
+            item["li_item_id"] for item in items.values() if isinstance(item, dict)
+        ))
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def rules(li_item_id):
+            async with sem:
+                return await pbs_pricing.prefetch_rules(li_item_id)
+        results = await asyncio.gather(*(rules(li) for li in li_item_ids), return_exceptions=True)
+
+        # Not-found codes are fine (cached as such); anything else is a failure
+        failed = sum(isinstance(r, Exception) and not isinstance(r, LookupError)
+                     for r in (*items.values(), *results))
+        self.codes = len(codes)
+        self.items = sum(isinstance(i, dict) for i in items.values())
+        self.rules = sum(not isinstance(r, Exception) for r in results)
+        self.failures += failed
+        log.info("Pre-warmed PBS schedule %s: %d codes, %d items, %d rules in %.1fs (%d failed)",
+                 sched, self.codes, self.items, self.rules, time.monotonic() - start, failed)
+
+
+rollover_warmer = RolloverWarmer(
+    lead=settings.pbs_rollover_lead,
+    interval=settings.pbs_rollover_interval,
+    top_n=settings.pbs_rollover_top_n,
+    concurrency=settings.pbs_rollover_concurrency,
+)
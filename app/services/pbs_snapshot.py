@@ -0,0 +1,157 @@
+# app/services/pbs_snapshot.py
+"""
+Read side of the offline PBS schedule snapshot.
+
+A snapshot is a SQLite file written by `python -m app.services.pbs_ingest`
+holding every item and item-dispensing-rule record for one schedule, indexed
+on pbs_code and li_item_id. When PBS_SNAPSHOT_PATH points at one, PBS pricing
+reads from it instead of the data API.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    schedule_code TEXT NOT NULL,
+    pbs_code      TEXT NOT NULL,
+    li_item_id    TEXT,
+    data          TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rules (
+    schedule_code TEXT,
+    li_item_id    TEXT NOT NULL,
+    data          TEXT NOT NULL
+);
+"""
+
+# Created after the bulk insert, which is much faster than maintaining them row by row
+INDEXES = """
+CREATE INDEX IF NOT EXISTS items_pbs_code   ON items (pbs_code, schedule_code);
+CREATE INDEX IF NOT EXISTS items_li_item_id ON items (li_item_id);
+CREATE INDEX IF NOT EXISTS rules_li_item_id ON rules (li_item_id);
+"""
+
+# How often (seconds) to check whether the snapshot file was replaced
+CHECK_INTERVAL = 5.0
+
+
+class PbsSnapshot:
+    """
+    Read-only view of one snapshot file; safe to share across threads. Each
+    thread reads through its own connection. Lookups block on SQLite: call
+    them from the threadpool, not the event loop.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.mtime = os.stat(self.path).st_mtime
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._readers = 0
+        self._closed = False
+        with self._reading() as conn:
+            self.meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+    @property
+    def schedule_code(self) -> str:
+        return self.meta["schedule_code"]
+
+    def fetch_item(self, pbs_code: str, sched_code: str) -> dict:
+        with self._reading() as conn:
+            row = conn.execute(
+                "SELECT data FROM items WHERE pbs_code = ? AND schedule_code = ? ORDER BY rowid LIMIT 1",
+                (pbs_code, sched_code),
+            ).fetchone()
+        if row is None:
+            raise LookupError(f"PBS item {pbs_code} not found in snapshot for schedule {sched_code}")
+        item = json.loads(row[0])
+        item["schedule_code"] = sched_code
+        return item
+
+    def rule_records(self, li_item_id: str) -> list[dict]:
+        with self._reading() as conn:
+            rows = conn.execute(
+                "SELECT data FROM rules WHERE li_item_id = ? ORDER BY rowid", (li_item_id,)
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def close(self) -> None:
+        """
+        Close every thread's connection, so the replaced file's space is
+        freed. Lookups already running finish first; the last one closes.
+        """
+        with self._conns_lock:
+            self._closed = True
+            if self._readers == 0:
+                self._close_all()
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    @contextmanager
+    def _reading(self):
+        with self._conns_lock:
+            self._readers += 1
+        try:
+            yield self._conn()
+        finally:
+            with self._conns_lock:
+                self._readers -= 1
+                if self._closed and self._readers == 0:
+                    self._close_all()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def _close_all(self) -> None:
+        # Called with _conns_lock held and no lookup running; a late reader
+        # of a closed snapshot opens a fresh connection and closes it after
+        for conn in self._conns:
+            conn.close()
+        self._conns.clear()
+        self._local = threading.local()
+
+
+_current: PbsSnapshot | None = None
+_next_check = 0.0
+_lock = threading.Lock()
+
+
+def current(path: str | None) -> PbsSnapshot | None:
+    """
+    Snapshot at `path`, reopened when the ingester atomically replaces the
+    file; the replaced snapshot is closed. Returns None when no path is
+    configured.
+    """
+    global _current, _next_check
+    if not path:
+        return None
+    snap = _current
+    now = time.monotonic()
+    if snap is not None and snap.path == Path(path) and now < _next_check:
+        return snap
+    with _lock:
+        _next_check = now + CHECK_INTERVAL
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            raise RuntimeError(f"PBS snapshot not found at {path}")
+        if _current is None or _current.path != Path(path) or _current.mtime != mtime:
+            previous, _current = _current, PbsSnapshot(Path(path))
+            if previous is not None:
+                previous.close()
+        return _current
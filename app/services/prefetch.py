@@ -0,0 +1,150 @@
+# app/services/prefetch.py
+"""
+Speculative warming of the pricing lookups for a prescription that has just
+been summarized: its pbs_code is almost always priced within seconds, so the
+PBS item and rules lookups are loaded into the (shared) caches in the
+background and the follow-up /pricing/pbs call is a cache hit.
+
+Prefetching must never cost interactive traffic anything, so it is bounded
+every way:
+
+* jobs run at background priority on the PBS rate governor, and are skipped
+  outright when the governor has no headroom above its interactive reserve;
+* at most `concurrency` jobs run at once and `max_pending` wait; anything
+  beyond that is dropped, never queued;
+* at most `rate` jobs start per second (per worker);
+* a PBS code is prefetched at most once per `dedupe_window` seconds.
+
+Jobs run detached from the request that triggered them (own context, own
+time budget), so they neither hold it up nor count against its budget.
+Whether a prefetch paid off is counted by the caches themselves
+(`prefetches` / `prefetch_hits` in their stats).
+
+WSD prices need no warming: the pricebook is memory-resident.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+
+from app.settings import settings
+from app.services import pbs_pricing
+from app.services.rate_governor import background, pbs_governor
+from app.services.resilience import request_budget
+
+log = logging.getLogger("prefetch")
+
+MISSING = (None, "", "N/A")
+
+
+class Prefetcher:
+    def __init__(self, concurrency: int, max_pending: int, rate: float, dedupe_window: float,
+                 timeout: float):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.rate = rate
+        self.dedupe_window = dedupe_window
+        self.timeout = timeout
+        self._tasks: set[asyncio.Task] = set()
+        self._sem: asyncio.Semaphore | None = None
+        self._recent: OrderedDict[str, float] = OrderedDict()   # pbs code -> time.monotonic()
+        self._allowance = float(max(1.0, rate))
+        self._last = time.monotonic()
+        self.submitted = 0
+        self.duplicates = 0
+        self.throttled = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+
+    def after_summary(self, summary: dict) -> None:
+        """Prefetch what pricing `summary` will need; returns immediately."""
+        if not settings.prefetch_enabled:
+            return
+        code = summary.get("pbs_code")
+        if code in MISSING:
+            return
+        self.submit(str(code).strip().upper())
+
+    def submit(self, pbs_code: str) -> bool:
+        """Start a background prefetch for `pbs_code` unless a limit says no."""
+        self.submitted += 1
+        now = time.monotonic()
+        self._expire(now)
+        if pbs_code in self._recent:
+            self.duplicates += 1
+            return False
+        if len(self._tasks) >= self.max_pending:
+            self.dropped += 1
+            return False
+        if not self._take(now) or pbs_governor.available() <= pbs_governor.reserve + 1:
+            self.throttled += 1
+            return False
+
+        self._recent[pbs_code] = now
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        # Fresh context: no request budget, trace or priority carried over
+        task = asyncio.create_task(self._run(pbs_code), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled":    settings.prefetch_enabled,
+            "pending":    len(self._tasks),
+            "submitted":  self.submitted,
+            "duplicates": self.duplicates,
+            "throttled":  self.throttled,
+            "dropped":    self.dropped,
+            "completed":  self.completed,
+            "failed":     self.failed,
+        }
+
+    async def aclose(self) -> None:
+        """Cancel outstanding prefetches (app shutdown)."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    async def _run(self, pbs_code: str) -> None:
+        async with self._sem:
+            try:
+                with background(), request_budget(self.timeout):
+                    await pbs_pricing.prefetch(pbs_code)
+                self.completed += 1
+            except LookupError:
+                self.completed += 1   # not-found is cached too
+            except Exception as e:
+                self.failed += 1
+                log.info("Prefetch of PBS %s failed: %s", pbs_code, e)
+
+    def _take(self, now: float) -> bool:
+        # Per-worker token bucket: `rate` prefetches per second
+        if self.rate <= 0:
+            return False
+        burst = max(1.0, self.rate)
+        self._allowance = min(burst, self._allowance + (now - self._last) * self.rate)
+        self._last = now
+        if self._allowance < 1:
+            return False
+        self._allowance -= 1
+        return True
+
+    def _expire(self, now: float) -> None:
+        while self._recent:
+            if now - next(iter(self._recent.values())) < self.dedupe_window:
+                break
+            self._recent.popitem(last=False)
+
+
+prefetcher = Prefetcher(
+    concurrency=settings.prefetch_concurrency,
+    max_pending=settings.prefetch_max_pending,
+    rate=settings.prefetch_rate,
+    dedupe_window=settings.prefetch_dedupe_window,
+    timeout=settings.prefetch_timeout,
+)
@@ -1,122 +1,166 @@
 # app/services/prescription_service.py
+import asyncio
 import logging
-import requests
-import re
+from typing import AsyncIterator
+import httpx
+from app import profiling
 from app.settings import settings
+from app.services.http_clients import http_clients
+from app.services.bundle_cache import BundleCache, UpstreamBundle, bundle_cache
+from app.services.bundle_summary import summarize_bundle
+from app.services.prefetch import prefetcher
+from app.services.resilience import request_budget
 
 log = logging.getLogger("prescription_service")
 
+
+def _item_error(scid: str, status: int, detail: str) -> dict:
+    return {"scid": scid, "error": {"status_code": status, "detail": detail}}
+
+
 class PrescriptionService:
-    def __init__(self, token_service):
+    def __init__(
+        self,
+        token_service,
+        client: httpx.AsyncClient | None = None,
+        cache: BundleCache | None = bundle_cache,
+    ):
         self.token_svc = token_service
+        self.client = client or http_clients.fhir
+        self.cache = cache
+
+    async def fetch_raw_bundle(self, scid: str) -> dict:
+        if self.cache is None:
+            return (await self._fetch_bundle_upstream(scid)).bundle
+        return await self.cache.get(scid, self._fetch_bundle_upstream)
 
-    def fetch_raw_bundle(self, scid: str) -> dict:
-        token = self.token_svc.get_token()
+    def invalidate(self, scid: str) -> bool:
+        """Drop any cached bundle for `scid`, e.g. after it has been dispensed."""
+        return self.cache.invalidate(scid) if self.cache is not None else False
+
+    async def _fetch_bundle_upstream(self, scid: str, etag: str | None = None) -> UpstreamBundle:
+        token = await self.token_svc.get_token()
         headers = {
             "Authorization": f"Bearer {token}",
             "Ocp-Apim-Subscription-Key": settings.ocp_apim_subscription_key
         }
+        if etag:
+            headers["If-None-Match"] = etag
         params = {
             "identifier": f"http://fhir.erx.com.au/NamingSystem/identifiers#scid|{scid}",
             "_format": "json"
         }
-        resp = requests.get(
+        resp = await self.client.get(
             f"{settings.fhir_api_base}/MedicationRequest",
             headers=headers,
             params=params,
             timeout=10
         )
+        if resp.status_code == 401:
+            # Cached token was rejected; make the next call mint a new one.
+            self.token_svc.invalidate()
+        if resp.status_code == 304:
+            return UpstreamBundle(304, None, 0, etag, resp.headers.get("Cache-Control"))
         resp.raise_for_status()
-        return resp.json()
+        with profiling.span("parse", bytes=len(resp.content)):
+            bundle = resp.json()
+        return UpstreamBundle(
+            resp.status_code,
+            bundle,
+            len(resp.content),
+            resp.headers.get("ETag"),
+            resp.headers.get("Cache-Control"),
+        )
+
+    async def summarize_many(
+        self,
+        scids: list[str],
+        concurrency: int | None = None,
+        item_timeout: float | None = None,
+        batch_timeout: float | None = None,
+    ) -> list[dict]:
+        """
+        Summarize SCIDs concurrently, at most `concurrency` in flight. Returns
+        one entry per SCID in input order: {"scid", "result"} or {"scid", "error"},
+        where error is {"status_code", "detail"} (404 no data, 502 upstream
+        failure, 504 timed out).
+        """
+        results: list[dict | None] = [None] * len(scids)
+        async for i, entry in self.iter_summaries(
+            scids, concurrency, item_timeout, batch_timeout or settings.batch_timeout
+        ):
+            results[i] = entry
+        return results
 
-    def extract_allergies(self, bundle: dict) -> list[str]:
-        # Placeholder for allergy extraction
-        return []
+    async def iter_summaries(
+        self,
+        scids: list[str],
+        concurrency: int | None = None,
+        item_timeout: float | None = None,
+        batch_timeout: float | None = None,
+    ) -> AsyncIterator[tuple[int, dict]]:
+        """
+        Like summarize_many, but yields (input index, entry) as each SCID
+        finishes. Only `concurrency` SCIDs are in flight at a time, so memory
+        does not grow with the batch. With a `batch_timeout`, whatever has not
+        finished by then is reported as 504; without one the batch runs until
+        every SCID is done (or the consumer stops iterating).
+        """
+        concurrency = concurrency or settings.batch_concurrency
+        item_timeout = item_timeout or settings.batch_item_timeout
+        loop = asyncio.get_running_loop()
+        deadline = None if batch_timeout is None else loop.time() + batch_timeout
+        inflight: dict[asyncio.Task, int] = {}
+        next_i = 0
+        try:
+            while next_i < len(scids) or inflight:
+                while next_i < len(scids) and len(inflight) < concurrency:
+                    task = asyncio.create_task(self._summarize_item(scids[next_i], item_timeout))
+                    inflight[task] = next_i
+                    next_i += 1
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                done, _ = await asyncio.wait(inflight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break  # batch deadline
+                for task in done:
+                    yield inflight.pop(task), task.result()
 
-    def extract_notes(self, med_request: dict) -> str:
-        notes = med_request.get("note", [])
-        return "; ".join(n.get("text", "") for n in notes)
+            timed_out = f"Batch timed out after {batch_timeout}s"
+            for task, i in sorted(inflight.items(), key=lambda kv: kv[1]):
+                task.cancel()
+                yield i, _item_error(scids[i], 504, timed_out)
+            inflight.clear()
+            for i in range(next_i, len(scids)):
+                yield i, _item_error(scids[i], 504, timed_out)
+        finally:
+            for task in inflight:
+                task.cancel()
 
-    def extract_coding(self, code_block: dict, system: str) -> str:
-        for c in code_block.get("coding", []):
-            if c.get("system") == system:
-                return c.get("code")
-        return "N/A"
+    async def _summarize_item(self, scid: str, item_timeout: float) -> dict:
+        # Each item gets its own upstream budget rather than sharing the
+        # request's, which a long batch would exhaust.
+        with request_budget(item_timeout, inherit=False):
+            try:
+                return {"scid": scid, "result": await asyncio.wait_for(self.summarize(scid), item_timeout)}
+            except asyncio.TimeoutError:
+                return _item_error(scid, 504, f"Timed out after {item_timeout}s")
+            except ValueError as e:
+                return _item_error(scid, 404, str(e))
+            except Exception as e:
+                log.warning("Batch fetch of SCID %s failed: %s", scid, e)
+                return _item_error(scid, 502, str(e))
 
-    def summarize(self, scid: str) -> dict:
+    async def summarize(self, scid: str, prefetch: bool = True) -> dict:
+        """
+        Summary of the SCID's bundle. With `prefetch`, the pricing lookups it
+        will most likely need next are warmed in the background (see prefetch).
+        """
         log.info("Summarizing SCID %s", scid)
-        bundle = self.fetch_raw_bundle(scid)
-        entries = bundle.get("entry", [])
-        if not entries:
+        bundle = await self.fetch_raw_bundle(scid)
+        if not bundle.get("entry"):
             raise ValueError(f"No data for SCID {scid}")
-
-        mr = entries[0]["resource"]
-        # Find Patient resource in contained
-        patient = next((c for c in mr.get("contained", []) if c.get("resourceType") == "Patient"), {})
-        # Build PID map
-        pid_map = {sid.get("system"): sid.get("value") for sid in patient.get("identifier", [])}
-
-        # Patient demographics
-        full_name = patient.get("name", [{}])[0].get("text") or \
-                    " ".join(patient.get("name", [{}])[0].get("given", []) + [patient.get("name", [{}])[0].get("family", "")])
-        dob = patient.get("birthDate", "N/A")
-
-        # Find Medication resource
-        med = next((c for c in mr.get("contained", []) if c.get("resourceType") == "Medication"), {})
-        # Dispense info
-        dispense = mr.get("dispenseRequest", {})
-
-        # Extract core fields
-        med_no = pid_map.get("http://ns.electronichealth.net.au/id/medicare-number", "N/A")
-        irn = pid_map.get("http://fhir.erx.com.au/NamingSystem/identifiers#authority-script-number", "N/A")
-        pension = pid_map.get("http://ns.electronichealth.net.au/id/pensioner-concession-card", "N/A")
-        seniors = pid_map.get("http://ns.electronichealth.net.au/id/commonwealth-seniors-health-card", "N/A")
-        reps_allowed = dispense.get("numberOfRepeatsAllowed")
-        disp_count = dispense.get("repeatsDispensed")
-        reps_remain = reps_allowed - disp_count if reps_allowed is not None and disp_count is not None else None
-        prescribed_qty = dispense.get("quantity", {}).get("value")
-        max_qty_auth = dispense.get("quantity", {}).get("value")
-        package_qty = dispense.get("expectedSupplyDuration", {}).get("value")
-
-        # Medication details
-        med_ext = {ext.get("url").split("/")[-1]: ext.get("valueString") or ext.get("valueBoolean")
-                   for ext in mr.get("extension", [])}
-        med_strength = med.get("extension", [{}])[0].get("valueString")
-        med_form = med.get("form", {}).get("text")
-
-        return {
-            "medicare_no": med_no,
-            "irn": irn,
-            "ihi": pid_map.get("http://ns.electronichealth.net.au/id/hi/ihi/1.0", "N/A"),
-            "racf": pid_map.get("http://ns.electronichealth.net.au/id/racf-id", "N/A"),
-            "pension_card": pension,
-            "seniors_card": seniors,
-            "pensioner_elig": False,
-            "seniors_elig": False,
-            "name": full_name,
-            "dob": dob,
-            "allergies": self.extract_allergies(bundle),
-            "prescriber_notes": self.extract_notes(mr),
-            "aip_drug_name": med_ext.get("aip-complient-drug-name", "N/A"),
-            "brand_name": med_ext.get("medication-brand-name", "N/A"),
-            "generic_name": med_ext.get("medication-generic-name", "N/A"),
-            "item_generic_intension": med_ext.get("item-generic-intension", "N/A"),
-            "schedule_number": med_ext.get("schedule-number", "N/A"),
-            "private_prescription": str(med_ext.get("private-prescription", "N/A")),
-            "repeats_allowed": reps_allowed,
-            "repeats_dispensed": disp_count,
-            "repeats_remaining": reps_remain,
-            "snomed": self.extract_coding(med.get("code", {}), "http://snomed.info/sct"),
-            "gtin": self.extract_coding(med.get("code", {}), "http://www.gs1.org/gtin"),
-            "med_text": med.get("code", {}).get("text", "N/A"),
-            "pbs_code": next(
-                (c.get("code") for c in med.get("code", {}).get("coding", [])
-                 if re.match(r"^[0-9]{1,5}[A-Z]$", c.get("code", ""))),
-                "N/A"
-            ),
-            "prescribed_qty": prescribed_qty,
-            "max_qty_auth": max_qty_auth,
-            "package_qty": package_qty,
-            "med_strength": med_strength,
-            "med_form": med_form
-        }
+        with profiling.span("summarize"):
+            summary = summarize_bundle(bundle)
+        if prefetch:
+            prefetcher.after_summary(summary)
+        return summary
@@ -0,0 +1,211 @@
+# app/services/pricebook.py
+"""
+Memory-resident, GTIN-indexed view of the WSD pricebook CSV.
+
+The CSV is parsed once into a compact index (integer GTIN keys, prices in a
+flat float array) and swapped for a freshly built one whenever the file's
+mtime changes. Reloads run in the background; readers keep using the previous
+index until the new one is complete, so lookups never wait on a reload. Each
+index carries a drug_search.SearchIndex over the description columns.
+"""
+import csv
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from pathlib import Path
+
+from app.metrics import PRICEBOOK_LOOKUP
+from app.services.drug_search import SearchIndex
+
+log = logging.getLogger("pricebook")
+
+# Column positions in the pricebook CSV (0-based)
+DESCRIPTION_COL = 1   # Description (trade name, form, strength, pack)
+GTIN_COL        = 3   # EAN
+GENERIC_COL     = 4   # Generic
+PRICE_COL       = 8   # Price GST Exc
+MIN_COLUMNS = 9
+
+# How often (seconds) lookups may stat() the file to look for changes
+CHECK_INTERVAL = 2.0
+
+
+class PricebookError(Exception):
+    """The pricebook file is missing or malformed."""
+
+
+class InvalidPriceError(PricebookError):
+    """The pricebook row for a GTIN has a non-numeric price."""
+
+    def __init__(self, gtin: str, raw: str):
+        super().__init__(f"Invalid base price value '{raw}' for GTIN {gtin}")
+        self.gtin = gtin
+        self.raw = raw
+
+
+def _gtin_key(gtin: str):
+    """
+    GTINs are kept as ints where that round-trips exactly (the common case);
+    anything with leading zeros or non-digits keeps its string form so that
+    lookups stay exact-match, like the original CSV scan. Only ASCII digits
+    count: str.isdigit() also accepts "²" (which int() rejects) and "١٢٣"
+    (which int() reads as 123).
+    """
+    if gtin.isascii() and gtin.isdigit() and gtin[0] != "0":
+        return int(gtin)
+    return gtin
+
+
+class PricebookIndex:
+    """Immutable snapshot of one version of the pricebook file."""
+
+    __slots__ = ("path", "mtime", "rows", "prices", "search", "_rows_by_key", "_bad_prices")
+
+    def __init__(self, path: Path, mtime: float, keys: list, prices: array, bad_prices: dict,
+                 search: SearchIndex | None = None):
+        self.path = path
+        self.mtime = mtime
+        self.rows = len(prices)
+        self.prices = prices
+        self.search = search if search is not None else SearchIndex([])
+        self._bad_prices = bad_prices
+        # First occurrence of a GTIN wins, matching the original scan order.
+        rows_by_key = {}
+        for i, key in enumerate(keys):
+            rows_by_key.setdefault(key, i)
+        self._rows_by_key = rows_by_key
+
+    def __len__(self) -> int:
+        return len(self._rows_by_key)
+
+    def row_of(self, gtin: str) -> int | None:
+        if not gtin:
+            return None
+        return self._rows_by_key.get(_gtin_key(gtin))
+
+    def entries(self) -> tuple[list[str], list[int]]:
+        """Every distinct GTIN (in first-occurrence order) and its row in `prices`."""
+        return [str(k) for k in self._rows_by_key], list(self._rows_by_key.values())
+
+    def price(self, gtin: str) -> float | None:
+        """Base price for `gtin`, or None when the GTIN is not in the pricebook."""
+        row = self.row_of(gtin)
+        if row is None:
+            return None
+        value = self.prices[row]
+        if math.isnan(value):
+            raise InvalidPriceError(gtin, self._bad_prices.get(row, ""))
+        return value
+
+    @classmethod
+    def load(cls, path: Path, previous: "PricebookIndex | None" = None) -> "PricebookIndex":
+        """Parse `path`; the search index reuses what it can from `previous`."""
+        mtime = os.stat(path).st_mtime
+        keys: list = []
+        prices = array("d")
+        bad_prices: dict[int, str] = {}
+        docs: list[tuple[str, str, str]] = []
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            if len(header) < MIN_COLUMNS:
+                raise PricebookError(
+                    f"Expected at least {MIN_COLUMNS} columns in CSV, found {len(header)}"
+                )
+            for rec in reader:
+                if len(rec) <= PRICE_COL:
+                    continue
+                gtin = rec[GTIN_COL]
+                if not gtin:
+                    continue
+                raw = rec[PRICE_COL]
+                try:
+                    value = float(raw)
+                except ValueError:
+                    value = math.nan
+                    bad_prices[len(prices)] = raw
+                keys.append(_gtin_key(gtin))
+                prices.append(value)
+                docs.append((gtin, rec[DESCRIPTION_COL].strip(), rec[GENERIC_COL].strip()))
+        search = SearchIndex(docs, previous.search if previous is not None else None)
+        return cls(path, mtime, keys, prices, bad_prices, search)
+
+
+class Pricebook:
+    """
+    Holds the current PricebookIndex for a file and hot-swaps it on change.
+
+    The first access loads synchronously. After that, a changed mtime starts a
+    single background reload; the old index keeps serving until the new one
+    has been fully built and is published with one reference assignment.
+    """
+
+    def __init__(self, path: Path, check_interval: float = CHECK_INTERVAL):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._index: PricebookIndex | None = None
+        self._load_lock = threading.Lock()
+        self._next_check = 0.0
+        self.reloads = 0
+
+    def index(self) -> PricebookIndex:
+        idx = self._index
+        if idx is None:
+            return self._initial_load()
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self._maybe_reload(idx)
+        return idx
+
+    def price(self, gtin: str) -> float | None:
+        with PRICEBOOK_LOOKUP.labels("single").time():
+            return self.index().price(gtin)
+
+    def stats(self) -> dict:
+        idx = self._index
+        return {
+            "path":    str(self.path),
+            "loaded":  idx is not None,
+            "rows":    idx.rows if idx else 0,
+            "gtins":   len(idx) if idx else 0,
+            "mtime":   idx.mtime if idx else None,
+            "reloads": self.reloads,
+        }
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    def _initial_load(self) -> PricebookIndex:
+        with self._load_lock:
+            if self._index is None:
+                try:
+                    self._index = PricebookIndex.load(self.path)
+                except FileNotFoundError:
+                    raise PricebookError(f"Pricebook file not found at {self.path}")
+                self._next_check = time.monotonic() + self.check_interval
+            return self._index
+
+    def _maybe_reload(self, current: PricebookIndex) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return  # keep serving the last good index
+        if mtime == current.mtime or not self._load_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                new = PricebookIndex.load(self.path, previous=current)
+                # Skip files caught mid-write; the next check will retry.
+                if os.stat(self.path).st_mtime == new.mtime:
+                    self._index = new
+                    self.reloads += 1
+                    log.info("Reloaded pricebook %s (%d rows)", self.path, new.rows)
+            except Exception as e:
+                log.warning("Pricebook reload failed, keeping previous index: %s", e)
+            finally:
+                self._load_lock.release()
+
+        threading.Thread(target=run, name="pricebook-reload", daemon=True).start()
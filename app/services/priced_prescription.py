@@ -0,0 +1,97 @@
+# app/services/priced_prescription.py
+import asyncio
+import logging
+
+from fastapi import HTTPException
+
+from app import profiling
+from app.services.pbs_pricing import calc_pbs_price
+from app.services.prescription_service import PrescriptionService
+from app.services.wsd_pricing import WsdPriceService
+
+log = logging.getLogger("priced_prescription")
+
+MISSING = (None, "", "N/A")
+
+
+def pricing_inputs(summary: dict) -> dict:
+    """Quantity, schedule and entitlement flags for pricing, taken from a summary."""
+    qty = summary.get("prescribed_qty")
+    try:
+        quantity = max(1, int(qty))
+    except (TypeError, ValueError):
+        quantity = 1
+    schedule_number = summary.get("schedule_number")
+    return {
+        "quantity":            quantity,
+        "authority_medicare":  summary.get("medicare_no") not in MISSING,
+        "concession_eligible": any(summary.get(k) not in MISSING for k in ("pension_card", "seniors_card")),
+        "schedule_number":     None if schedule_number in MISSING else str(schedule_number),
+    }
+
+
+async def _price_pbs(summary: dict, inputs: dict) -> dict:
+    code = summary.get("pbs_code")
+    if code in MISSING:
+        raise LookupError("Prescription has no PBS code")
+    return await calc_pbs_price(
+        pbs_code=code,
+        quantity=inputs["quantity"],
+        authority_medicare=inputs["authority_medicare"],
+        concession_eligible=inputs["concession_eligible"],
+        schedule_number=inputs["schedule_number"],
+    )
+
+
+async def _price_wsd(wsd: WsdPriceService, summary: dict, inputs: dict) -> dict:
+    gtin = summary.get("gtin")
+    if gtin in MISSING:
+        raise LookupError("Prescription has no GTIN")
+    return wsd.calc_price(
+        gtin=gtin,
+        quantity=inputs["quantity"],
+        authority_medicare=inputs["authority_medicare"],
+        concession_eligible=inputs["concession_eligible"],
+    )
+
+
+def _error(e: BaseException, upstream_status: int) -> dict:
+    if isinstance(e, HTTPException):
+        return {"status_code": e.status_code, "detail": str(e.detail)}
+    if isinstance(e, LookupError):
+        return {"status_code": 404, "detail": str(e)}
+    return {"status_code": upstream_status, "detail": str(e)}
+
+
+async def price_prescription(svc: PrescriptionService, wsd: WsdPriceService, scid: str) -> dict:
+    """
+    Summary of `scid` plus its PBS and WSD prices. The bundle is fetched once;
+    both pricing paths then run concurrently, and a failure in one is reported
+    under "errors" without failing the other.
+    """
+    # Priced right away below, so nothing to gain from prefetching
+    summary = await svc.summarize(scid, prefetch=False)
+    inputs = pricing_inputs(summary)
+    with profiling.span("price"):
+        pbs, wsd_price = await asyncio.gather(
+            _price_pbs(summary, inputs),
+            _price_wsd(wsd, summary, inputs),
+            return_exceptions=True,
+        )
+
+    errors = {}
+    if isinstance(pbs, BaseException):
+        log.info("PBS pricing for SCID %s failed: %s", scid, pbs)
+        errors["pbs"], pbs = _error(pbs, 502), None
+    if isinstance(wsd_price, BaseException):
+        log.info("WSD pricing for SCID %s failed: %s", scid, wsd_price)
+        errors["wsd"], wsd_price = _error(wsd_price, 500), None
+
+    return {
+        "scid":    scid,
+        "summary": summary,
+        "inputs":  inputs,
+        "pbs":     pbs,
+        "wsd":     wsd_price,
+        "errors":  errors,
+    }
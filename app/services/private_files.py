@@ -0,0 +1,36 @@
+# app/services/private_files.py
+"""
+Local state files shared by the workers on a host (the SQLite cache, the PBS
+rate bucket). They live in a directory only the service user can write to,
+by default a per-user directory under the system temp dir, and are refused
+when another user owns them or could have put them there: a file planted
+first (or a symlink) would otherwise be read, or written, as ours.
+"""
+import os
+import stat
+import tempfile
+
+
+def default_path(name: str) -> str:
+    """`name` in the service user's own directory under the system temp dir."""
+    return os.path.join(tempfile.gettempdir(), f"escript-{os.getuid()}", name)
+
+
+def open_private(path: str) -> int:
+    """
+    Open (creating if needed, mode 0600) `path` for reading and writing and
+    return the descriptor. Creates its directory (0700) if missing; raises
+    PermissionError if the directory is not ours alone or the file is not
+    ours, and OSError if `path` is a symlink.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise PermissionError(f"{directory} is not a directory only this user can write to")
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    st = os.fstat(fd)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        os.close(fd)
+        raise PermissionError(f"{path} is owned by another user or readable by others")
+    return fd
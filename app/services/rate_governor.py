@@ -0,0 +1,243 @@
+# app/services/rate_governor.py
+"""
+Host-wide token bucket for an upstream quota, shared by every worker process.
+
+The bucket state (tokens, last refill time) lives in a small file and is
+updated under an exclusive flock, so all uvicorn workers on the host draw
+from one budget without a separate service. Callers wait their turn instead
+of colliding on 429s:
+
+* interactive calls reserve the next free slot (the bucket may go negative)
+  and sleep until it comes round, so they are served in arrival order;
+* background calls (cache refreshes, prefetching) only take a token while
+  more than `reserve` tokens are left for interactive traffic, and otherwise
+  back off and try again, so they never delay an interactive call;
+* either gives up with RateLimitExceeded as soon as it is clear no slot
+  will come within the call's deadline (`deadline_remaining()`), so a wait
+  here never ends as an upstream timeout;
+* a 429 from the upstream empties the bucket for its Retry-After, so every
+  worker pauses, not just the one that was refused.
+
+Priority is carried in a contextvar; wrap background work in
+`with background():`. Time spent waiting is recorded in app.metrics.
+
+The bucket file is opened only in a directory of the service user's own
+(see private_files); if it is refused, each worker keeps its own bucket.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from app import metrics, profiling
+from app.settings import settings
+from app.services.private_files import default_path, open_private
+from app.services.resilience import BudgetExhausted, deadline_remaining, retry_after
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: fall back to a per-process bucket
+    fcntl = None
+
+log = logging.getLogger("rate_governor")
+
+INTERACTIVE, BACKGROUND = "interactive", "background"
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("rate_priority", default=INTERACTIVE)
+
+_STATE = struct.Struct("dd")   # tokens, last refill (time.time())
+
+
+class RateLimitExceeded(BudgetExhausted):
+    """The wait for a slot would outlast the caller's budget."""
+
+
+@contextmanager
+def background():
+    """Mark calls made inside the block as background (lowest priority)."""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class RateGovernor:
+    def __init__(self, name: str, rate: float, burst: float, reserve: float, path: str):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.path = path
+        self._fd: int | None = None
+        self._pid: int | None = None
+        self._local_lock = threading.Lock()
+        self._local_state = (burst, time.time())
+        self.granted = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.waited = {INTERACTIVE: 0.0, BACKGROUND: 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    async def acquire(self, priority: str | None = None, max_wait: float | None = None) -> float:
+        """
+        Wait for permission to make one call; returns the seconds waited.
+        Raises RateLimitExceeded when the wait would exceed `max_wait`.
+        """
+        if not self.enabled:
+            return 0.0
+        priority = priority or current_priority()
+        start = time.monotonic()
+        while True:
+            budget = None if max_wait is None else max_wait - (time.monotonic() - start)
+            granted, wait = self._take(priority, budget)
+            if granted:
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                break
+            if wait is None:
+                metrics.RATE_REJECTED.labels(self.name, priority).inc()
+                raise RateLimitExceeded(f"{self.name} rate limit: no slot within {max_wait:.1f}s")
+            await asyncio.sleep(wait)   # background: re-check once the reserve has refilled
+
+        waited = time.monotonic() - start
+        self.granted[priority] += 1
+        self.waited[priority] += waited
+        metrics.RATE_WAIT.labels(self.name, priority).observe(waited)
+        return waited
+
+    def penalize(self, seconds: float) -> None:
+        """The upstream said slow down (429): hold every worker off for `seconds`."""
+        if self.enabled:
+            self._transact(lambda tokens: (min(tokens, -seconds * self.rate), None))
+
+    def available(self) -> float:
+        """Tokens in the bucket right now (negative while calls are queued)."""
+        return self._peek()[0] if self.enabled else float("inf")
+
+    def stats(self) -> dict:
+        tokens, _ = self._peek() if self.enabled else (0.0, None)
+        return {
+            "rate":                    self.rate,
+            "burst":                   self.burst,
+            "reserve":                 self.reserve,
+            "tokens":                  round(tokens, 2),
+            "granted_interactive":     self.granted[INTERACTIVE],
+            "granted_background":      self.granted[BACKGROUND],
+            "wait_seconds_interactive": round(self.waited[INTERACTIVE], 3),
+            "wait_seconds_background":  round(self.waited[BACKGROUND], 3),
+        }
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    def _take(self, priority: str, max_wait: float | None) -> tuple[bool, float | None]:
+        """
+        Returns (True, wait) when a slot was reserved `wait` seconds from now,
+        (False, retry_in) when a background caller should come back later, or
+        (False, None) when the slot (or the retry) would be later than `max_wait`.
+        """
+        def decide(tokens):
+            if priority == BACKGROUND:
+                if tokens - 1 < self.reserve:
+                    retry_in = (self.reserve + 1 - tokens) / self.rate
+                    if max_wait is not None and retry_in > max_wait:
+                        return tokens, (False, None)
+                    return tokens, (False, retry_in)
+                return tokens - 1, (True, 0.0)
+            wait = max(0.0, (1 - tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return tokens, (False, None)
+            return tokens - 1, (True, wait)
+        return self._transact(decide)
+
+    def _peek(self) -> tuple[float, float]:
+        return self._transact(lambda tokens: (tokens, (tokens, time.time())))
+
+    def _transact(self, decide):
+        """
+        Refill the bucket to now, apply `decide(tokens) -> (new_tokens, result)`
+        and store the new level, all under the host-wide lock.
+        """
+        with self._lock() as (state, store):
+            tokens, last = state
+            now = time.time()
+            tokens = min(self.burst, tokens + max(0.0, now - last) * self.rate)
+            tokens, result = decide(tokens)
+            store(tokens, now)
+        return result
+
+    @contextmanager
+    def _lock(self):
+        fd = self._open() if fcntl is not None else None
+        if fd is None:
+            with self._local_lock:
+                def store(tokens, ts):
+                    self._local_state = (tokens, ts)
+                yield self._local_state, store
+            return
+
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            raw = os.pread(fd, _STATE.size, 0)
+            state = _STATE.unpack(raw) if len(raw) == _STATE.size else (self.burst, time.time())
+
+            def store(tokens, ts):
+                os.pwrite(fd, _STATE.pack(tokens, ts), 0)
+            yield state, store
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _open(self) -> int | None:
+        # One descriptor per process; flock locks belong to the open file description.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            try:
+                self._fd = open_private(self.path)
+            except OSError as e:
+                self._fd = None
+                log.warning("Cannot use %s as the shared %s rate bucket (%s); this worker keeps its own",
+                            self.path, self.name, e)
+        return self._fd
+
+
+class GovernedTransport(httpx.AsyncBaseTransport):
+    """Transport that takes a slot from `governor` before every request it sends."""
+
+    def __init__(self, governor: RateGovernor, inner: httpx.AsyncBaseTransport):
+        self.governor = governor
+        self.inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            waited = await self.governor.acquire(max_wait=deadline_remaining())
+        except RateLimitExceeded as e:
+            e.request = request
+            raise
+        if waited > 0:
+            profiling.record("rate_wait", time.perf_counter() - waited, waited, upstream=self.governor.name)
+        response = await self.inner.handle_async_request(request)
+        if response.status_code == 429:
+            # Our bucket is more generous than the real quota right now
+            self.governor.penalize(retry_after(response) or 1.0 / self.governor.rate)
+        return response
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+pbs_governor = RateGovernor(
+    "pbs",
+    rate=settings.pbs_rate_limit,
+    burst=settings.pbs_rate_burst,
+    reserve=settings.pbs_rate_reserve,
+    path=settings.pbs_rate_state_path or default_path("pbs-rate.bucket"),
+)
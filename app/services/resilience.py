@@ -0,0 +1,306 @@
+# app/services/resilience.py
+"""
+Retry, deadline and circuit-breaking for every outbound call.
+
+`ResilientTransport` wraps the pooled transport of each upstream client
+(see http_clients), so token, FHIR and PBS calls all get the same handling:
+
+* retryable failures (transport errors, timeouts, 429, 502/503/504, 520) are
+  retried with full-jitter exponential backoff; a Retry-After header is
+  honoured instead when present;
+* every call has a deadline covering all of its attempts and backoffs, and
+  is further limited by the remaining budget of the inbound request
+  (`request_budget` / BudgetMiddleware). Layers under this one see it via
+  `deadline_remaining()`: the rate governor gives up on a slot it cannot
+  get in time, and only the send itself (`send_by_deadline`) is timed out,
+  so only an upstream that is actually slow counts against its breaker;
+* a per-upstream circuit breaker opens after consecutive failures and fails
+  fast until a cool-down has passed, then lets probe calls through
+  (half-open) and closes again on the first success.
+
+The last response is returned as-is when retries run out, so callers keep
+their own `raise_for_status()` handling.
+"""
+import asyncio
+import contextvars
+import email.utils
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+import httpx
+
+from app import metrics
+from app.settings import settings
+
+log = logging.getLogger("resilience")
+
+RETRY_STATUSES = frozenset({429, 502, 503, 504, 520})
+
+# Wall-clock deadline (time.monotonic) of the inbound request being served
+_request_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("request_deadline", default=None)
+# Deadline of the outbound call in progress (set by ResilientTransport)
+_call_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("call_deadline", default=None)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """The upstream's circuit breaker is open; the call was not attempted."""
+
+
+class BudgetExhausted(httpx.TimeoutException):
+    """The call's deadline or the request's time budget ran out."""
+
+
+# ─── Request Budget ─────────────────────────────────────────────────────────────
+@contextmanager
+def request_budget(seconds: float | None, inherit: bool = True):
+    """
+    Limit all upstream calls made inside the block to `seconds` in total.
+    With inherit=False the block gets its own budget instead of sharing what
+    is left of the enclosing one (each item of a long batch, for example).
+    """
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _request_deadline.get() if inherit else None
+    token = _request_deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def budget_remaining() -> float | None:
+    deadline = _request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def deadline_remaining() -> float | None:
+    """Seconds left for the outbound call in progress, else for the inbound request."""
+    deadline = _call_deadline.get()
+    return budget_remaining() if deadline is None else deadline - time.monotonic()
+
+
+async def send_by_deadline(send, request: httpx.Request) -> httpx.Response:
+    """
+    `await send(request)`, timed out at the call's deadline. BudgetExhausted
+    if the deadline has already passed (e.g. spent waiting for a rate slot).
+    """
+    remaining = deadline_remaining()
+    if remaining is not None and remaining <= 0:
+        raise BudgetExhausted("Deadline passed before the request was sent", request=request)
+    return await asyncio.wait_for(send(request), remaining)
+
+
+class BudgetMiddleware:
+    """ASGI middleware giving each inbound HTTP request `settings.request_budget` seconds upstream."""
+
+    def __init__(self, app, seconds: float | None = None):
+        self.app = app
+        self.seconds = seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with request_budget(self.seconds or settings.request_budget):
+            await self.app(scope, receive, send)
+
+
+# ─── Circuit Breaker ────────────────────────────────────────────────────────────
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures;
+    open -> half-open once `reset_timeout` has passed, admitting at most
+    `half_open_max` concurrent probes; a probe success closes the circuit,
+    a probe failure re-opens it for another `reset_timeout`.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_max: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state, self._probes = self.HALF_OPEN, 0
+        return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; half-open admits a limited number of probes."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._probes < self.half_open_max:
+            self._probes += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def retry_in(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self) -> None:
+        if self._state != self.CLOSED:
+            log.info("Circuit for %s closed", self.name)
+        self._state, self._failures, self._probes = self.CLOSED, 0, 0
+
+    def abandon(self) -> None:
+        """A call admitted by allow() ended without an outcome (e.g. cancelled)."""
+        if self._state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.opened += 1
+                log.warning("Circuit for %s opened after %d failures", self.name, self._failures)
+            self._state, self._opened_at, self._probes = self.OPEN, time.monotonic(), 0
+
+    def stats(self) -> dict:
+        state = self.state
+        return {
+            "state":                state,
+            "open":                 state == self.OPEN,
+            "consecutive_failures": self._failures,
+            "opened":               self.opened,
+            "rejected":             self.rejected,
+            "retry_in":             round(self.retry_in(), 1) if state == self.OPEN else 0,
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def breaker(upstream: str) -> CircuitBreaker:
+    b = _breakers.get(upstream)
+    if b is None:
+        b = _breakers[upstream] = CircuitBreaker(
+            upstream, settings.breaker_failure_threshold, settings.breaker_reset_timeout,
+        )
+    return b
+
+
+def breaker_stats() -> dict:
+    return {name: b.stats() for name, b in _breakers.items()}
+
+
+# ─── Backoff ────────────────────────────────────────────────────────────────────
+def retry_after(response: httpx.Response) -> float | None:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# ─── Transport ──────────────────────────────────────────────────────────────────
+class ResilientTransport(httpx.AsyncBaseTransport):
+    def __init__(
+        self,
+        upstream: str,
+        inner: httpx.AsyncBaseTransport,
+        attempts: int | None = None,
+        deadline: float | None = None,
+        backoff_base: float | None = None,
+        backoff_cap: float | None = None,
+    ):
+        self.upstream = upstream
+        self.inner = inner
+        self.attempts = attempts or settings.upstream_attempts
+        self.deadline = deadline or settings.upstream_deadline
+        self.backoff_base = backoff_base or settings.upstream_backoff_base
+        self.backoff_cap = backoff_cap or settings.upstream_backoff_cap
+        self.breaker = breaker(upstream)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        deadline = time.monotonic() + self.deadline
+        budget = _request_deadline.get()
+        if budget is not None:
+            deadline = min(deadline, budget)
+
+        for attempt in range(self.attempts):
+            last = attempt == self.attempts - 1
+            if not self.breaker.allow():
+                raise CircuitOpenError(
+                    f"Circuit for {self.upstream} is open; retry in {self.breaker.retry_in():.0f}s",
+                    request=request,
+                )
+            if deadline <= time.monotonic():
+                raise BudgetExhausted(f"Deadline for {self.upstream} call exceeded", request=request)
+
+            token = _call_deadline.set(deadline)
+            try:
+                # The transport at the bottom times out the send (send_by_deadline)
+                response = await self.inner.handle_async_request(request)
+            except (asyncio.CancelledError, BudgetExhausted):
+                # Cancelled, or out of budget before reaching the upstream
+                # (e.g. no rate governor slot in time): not the upstream's fault.
+                self.breaker.abandon()
+                raise
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                self.breaker.record_failure()
+                if isinstance(e, asyncio.TimeoutError):
+                    e = BudgetExhausted(f"Deadline for {self.upstream} call exceeded", request=request)
+                if last or not await self._pause(self._delay(attempt, None), deadline):
+                    raise e
+                continue
+            finally:
+                _call_deadline.reset(token)
+
+            status = response.status_code
+            if status >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            if status not in RETRY_STATUSES or last:
+                return response
+
+            delay = self._delay(attempt, response)
+            if time.monotonic() + delay >= deadline:
+                return response
+            await response.aclose()
+            await self._pause(delay, deadline)
+        raise AssertionError("unreachable")
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+    def _delay(self, attempt: int, response: httpx.Response | None) -> float:
+        hinted = retry_after(response) if response is not None else None
+        return hinted if hinted is not None else backoff(attempt, self.backoff_base, self.backoff_cap)
+
+    async def _pause(self, delay: float, deadline: float) -> bool:
+        """Sleep before the next attempt; False when that would pass the deadline."""
+        if time.monotonic() + delay >= deadline:
+            return False
+        metrics.UPSTREAM_RETRIES.labels(self.upstream).inc()
+        log.info("Retrying %s call in %.2fs", self.upstream, delay)
+        await asyncio.sleep(delay)
+        return True
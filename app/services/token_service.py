@@ -1,8 +1,173 @@
 # app/services/token_service.py
-from get_token import get_access_token
+import asyncio
+import logging
+import os
+import time
+
+from get_token import request_token
+from app import profiling
+from app.services.cache_backend import CacheBackend, make_backend
+from app.services.http_clients import http_clients
+
+log = logging.getLogger("token_service")
+
+# ─── Refresh Tuning ─────────────────────────────────────────────────────────────
+DEFAULT_EXPIRES_IN = 300    # seconds, used when the token response omits expires_in
+REFRESH_AHEAD      = 300    # start a background refresh this long before expiry
+EXPIRY_MARGIN      = 30     # never hand out a token this close to expiry
+RETRY_BACKOFF      = 15     # wait between failed background refreshes
+LEASE_TTL          = 10     # how long other workers wait on one worker's exchange
+LEASE_POLL         = 0.05   # how often they look for its token meanwhile
+
+_TOKEN_KEY, _LEASE_KEY = "access_token", "exchange_lease"
+
+
+async def _exchange() -> dict:
+    return await request_token(http_clients.token)
+
 
 class TokenService:
-    def get_token(self) -> str:
-        return get_access_token()
+    """
+    Access token cache, shared by all workers through a cache_backend.
+
+    The token is reused until shortly before its `expires_in`. Once it enters
+    the refresh window a single background refresh is started while callers
+    keep receiving the current token; only when the token is (nearly) expired
+    do callers wait, and then only one of them performs the exchange. Across
+    workers, the one holding the exchange lease mints the token and the
+    others pick it up from the shared backend.
+    """
+
+    def __init__(
+        self,
+        fetch=_exchange,
+        refresh_ahead: float = REFRESH_AHEAD,
+        expiry_margin: float = EXPIRY_MARGIN,
+        backend: CacheBackend | None = None,
+    ):
+        self._fetch = fetch
+        self._shared = backend or make_backend("token")
+        self.refresh_ahead = refresh_ahead
+        self.expiry_margin = expiry_margin
+        self._lock = asyncio.Lock()
+        self._token: str | None = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._background: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.adopted = 0
+        self.failures = 0
+
+    async def get_token(self) -> str:
+        now = time.time()
+        if now >= self._refresh_at:
+            self._adopt()   # another worker may already have refreshed
+        token = self._token
+        if token and now < self._expires_at - self.expiry_margin:
+            self.hits += 1
+            if now >= self._refresh_at:
+                self._refresh_in_background()
+            return token
+
+        with profiling.span("token"):
+            async with self._lock:
+                # Another caller may have refreshed while we waited for the lock.
+                self._adopt()
+                if self._fresh():
+                    self.hits += 1
+                    return self._token
+                self.misses += 1
+                return await self._refresh()
+
+    def invalidate(self) -> None:
+        """Drop the cached token, e.g. after the upstream rejected it with 401."""
+        shared = self._shared.get(_TOKEN_KEY)
+        if shared is not None and shared[0] == self._token:
+            self._shared.delete(_TOKEN_KEY)   # unless another worker already replaced it
+        self._token = None
+        self._expires_at = self._refresh_at = 0.0
+
+    def stats(self) -> dict:
+        remaining = self._expires_at - time.time() if self._token else 0.0
+        return {
+            "hits":       self.hits,
+            "misses":     self.misses,
+            "refreshes":  self.refreshes,
+            "adopted":    self.adopted,
+            "failures":   self.failures,
+            "cached":     self._token is not None,
+            "expires_in": max(0, round(remaining)),
+        }
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    def _fresh(self) -> bool:
+        return bool(self._token) and time.time() < self._expires_at - self.expiry_margin
+
+    def _adopt(self) -> bool:
+        """Take over a newer token stored by another worker; True if one was found."""
+        shared = self._shared.get(_TOKEN_KEY)
+        if shared is None or shared[1] <= self._expires_at:
+            return False
+        self._token, self._expires_at, self._refresh_at = shared
+        self.adopted += 1
+        return True
+
+    async def _refresh(self) -> str:
+        """Exchange a new token; caller must hold self._lock."""
+        leased = self._shared.add(_LEASE_KEY, os.getpid(), time.time() + LEASE_TTL)
+        if not leased:
+            # Another worker is exchanging; wait for its token rather than mint a second one.
+            deadline = time.monotonic() + LEASE_TTL
+            while time.monotonic() < deadline:
+                await asyncio.sleep(LEASE_POLL)
+                if self._adopt() and self._fresh():
+                    return self._token
+            # It never arrived: exchange anyway.
+        try:
+            payload = await self._fetch()
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            if leased:
+                self._shared.delete(_LEASE_KEY)
+        token = payload.get("access_token")
+        if not token:
+            self.failures += 1
+            raise Exception("Token response did not contain an access_token")
+
+        try:
+            expires_in = float(payload.get("expires_in") or DEFAULT_EXPIRES_IN)
+        except (TypeError, ValueError):
+            expires_in = DEFAULT_EXPIRES_IN
+        now = time.time()
+        self._token = token
+        self._expires_at = now + expires_in
+        # Short-lived tokens refresh halfway through their lifetime.
+        self._refresh_at = self._expires_at - min(self.refresh_ahead, expires_in / 2)
+        self._shared.set(_TOKEN_KEY, (token, self._expires_at, self._refresh_at), self._expires_at)
+        return token
+
+    def _refresh_in_background(self) -> None:
+        if self._lock.locked() or (self._background and not self._background.done()):
+            return  # a refresh is already running
+
+        async def run():
+            async with self._lock:
+                self._adopt()
+                if time.time() < self._refresh_at:
+                    return
+                try:
+                    await self._refresh()
+                    self.refreshes += 1
+                except Exception as e:
+                    log.warning("Background token refresh failed: %s", e)
+                    # Back off before the next background attempt.
+                    self._refresh_at = time.time() + RETRY_BACKOFF
+
+        self._background = asyncio.create_task(run())
+
 
 token_service = TokenService()
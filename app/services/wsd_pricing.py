@@ -1,14 +1,19 @@
 # app/services/wsd_pricing.py
 
 import csv
+import io
 from pathlib import Path
+from typing import Iterable, Iterator
 from fastapi import HTTPException
 
 from app.services.pbs_pricing import (
-    markup_tier, cap,
+    markup_tier, cap, markup_tier_array, cap_array, round_cents,
     DISPENSING_FEE, CONTAINER_FEE, EXTRA_DISP_FEE, PFDI,
     GENERAL_CAP, CONCESSIONAL_CAP,
 )
+from app.metrics import PRICEBOOK_LOOKUP
+from app.responses import dumps
+from app.services.pricebook import Pricebook, PricebookError, PricebookIndex
 
 # Additional tuning constants for WSD
 ADJUSTED_MARKUP = 4.20   # Additional tuning added to DPMQ for WSD only
@@ -17,9 +22,15 @@ FDP_ADJUSTMENT  = 5.00   # Additional flat markup added to final dispense price
 # Path to your CSV database (at project root)
 CSV_PATH = Path(__file__).parent.parent / "Pricebook_1055053.csv"
 
+# Bulk export: record fields (CSV column order) and GTINs priced per vectorized step
+EXPORT_COLUMNS = ("GTIN", "quantity", "auth", "conc", "BasePrice", "DPMQ", "FDP",
+                  "General", "Concessional", "Brand", "error")
+EXPORT_CHUNK = 4096
+
 class WsdPriceService:
     def __init__(self, csv_path: Path = CSV_PATH):
         self.csv_path = csv_path
+        self.pricebook = Pricebook(csv_path)
 
     def calc_price(
         self,
@@ -28,27 +39,13 @@ class WsdPriceService:
         authority_medicare: bool = False,
         concession_eligible: bool = False,
     ) -> dict:
-                # 1. Lookup base price in CSV: GTIN in column 4, price in column 9
+        # 1. Lookup base price in the in-memory pricebook index
         try:
-            with open(self.csv_path, newline="") as f:
-                reader = csv.DictReader(f)
-                headers = reader.fieldnames or []
-                if len(headers) < 9:
-                    raise HTTPException(500, f"Expected at least 9 columns in CSV, found {len(headers)}")
-                gtin_col = headers[3]   # 4th column
-                base_col = headers[8]   # 9th column
-                base_price = None
-                for row in reader:
-                    if row.get(gtin_col) == gtin:
-                        try:
-                            base_price = float(row.get(base_col, 0))
-                        except ValueError:
-                            raise HTTPException(500, f"Invalid base price value '{row.get(base_col)}' for GTIN {gtin}")
-                        break
-                if base_price is None:
-                    raise HTTPException(404, f"No WSD entry for GTIN {gtin}")
-        except FileNotFoundError:
-            raise HTTPException(500, f"Pricebook file not found at {self.csv_path}")
+            base_price = self.pricebook.price(gtin)
+        except PricebookError as e:
+            raise HTTPException(500, str(e))
+        if base_price is None:
+            raise HTTPException(404, f"No WSD entry for GTIN {gtin}")
 
         # 2. Compute DPMQ using tier markup Compute DPMQ using tier markup
         D = base_price * quantity
@@ -82,3 +79,191 @@ class WsdPriceService:
             "Concessional":   concessional_cost,
             "Brand":          brand_cost,
         }
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        with_price: bool = False,
+        quantity: int = 1,
+        authority_medicare: bool = False,
+        concession_eligible: bool = False,
+    ) -> dict:
+        """
+        Ranked pricebook rows whose description or generic name matches
+        `query` (see drug_search), optionally each priced as calc_price would.
+        """
+        try:
+            index = self.pricebook.index()
+        except PricebookError as e:
+            raise HTTPException(500, str(e))
+        with PRICEBOOK_LOOKUP.labels("search").time():
+            total, docs = index.search.search(query, limit)
+
+        hits = []
+        for gtin, description, generic in docs:
+            hit = {"gtin": gtin, "description": description, "generic": generic or None}
+            if with_price:
+                try:
+                    hit["price"] = self.calc_price(gtin, quantity, authority_medicare, concession_eligible)
+                except HTTPException:
+                    hit["price"] = None   # invalid price in the pricebook row
+            hits.append(hit)
+        return {"query": query, "total": total, "hits": hits}
+
+    def calc_prices(self, lines: Iterable) -> list[dict]:
+        """
+        Price many lines at once. Each line has gtin/qty/auth/conc attributes
+        (see WsdBatchLine). All GTINs are resolved against one index snapshot
+        and the fee maths runs over NumPy arrays. Returns one entry per line,
+        in order: {"gtin", "result"} on success or {"gtin", "error"}.
+        """
+        import numpy as np  # deferred: only batch pricing needs numpy
+        lines = list(lines)
+        try:
+            index = self.pricebook.index()
+        except PricebookError as e:
+            raise HTTPException(500, str(e))
+
+        n = len(lines)
+        base = np.zeros(n)
+        qty = np.zeros(n)
+        auth = np.zeros(n, dtype=bool)
+        conc = np.zeros(n, dtype=bool)
+        errors: dict[int, dict] = {}
+        with PRICEBOOK_LOOKUP.labels("batch").time():
+            for i, line in enumerate(lines):
+                try:
+                    price = index.price(line.gtin)
+                except PricebookError as e:
+                    errors[i] = {"status_code": 500, "detail": str(e)}
+                    continue
+                if price is None:
+                    errors[i] = {"status_code": 404, "detail": f"No WSD entry for GTIN {line.gtin}"}
+                    continue
+                base[i] = price
+                qty[i] = line.qty
+                auth[i] = line.auth
+                conc[i] = line.conc
+
+        priced = self._price_arrays(base, qty, auth, conc)
+        columns = {k: v.tolist() for k, v in priced.items()}
+
+        out = []
+        for i, line in enumerate(lines):
+            if i in errors:
+                out.append({"gtin": line.gtin, "error": errors[i]})
+                continue
+            out.append({"gtin": line.gtin, "result": {
+                "GTIN":         line.gtin,
+                "quantity":     line.qty,
+                "BasePrice":    columns["BasePrice"][i],
+                "DPMQ":         columns["DPMQ"][i],
+                "FDP":          columns["FDP"][i],
+                "General":      columns["General"][i],
+                "Concessional": columns["Concessional"][i],
+                "Brand":        columns["Brand"][i],
+            }})
+        return out
+
+    def export(
+        self,
+        index: PricebookIndex,
+        combos: list[tuple[int, bool, bool]],
+        start: int = 0,
+        stop: int | None = None,
+        fmt: str = "ndjson",
+        chunk: int = EXPORT_CHUNK,
+    ) -> Iterator[bytes]:
+        """
+        Price every GTIN in `index` at each (quantity, auth, conc) in `combos`
+        and yield records [start, stop) as encoded NDJSON or CSV, one chunk of
+        GTINs at a time. Record n is GTIN n // len(combos) at combo
+        n % len(combos), so a range of records can be resumed exactly. GTINs
+        with an invalid price produce a record with only "error" set.
+        """
+        import numpy as np
+        gtins, rows = index.entries()
+        width = len(combos)
+        total = len(gtins) * width
+        stop = total if stop is None else min(stop, total)
+        prices = np.frombuffer(index.prices, dtype=np.float64)
+        rows = np.asarray(rows, dtype=np.int64)
+        qty = np.array([c[0] for c in combos], dtype=np.float64)
+        auth = np.array([c[1] for c in combos], dtype=bool)
+        conc = np.array([c[2] for c in combos], dtype=bool)
+
+        if fmt == "csv" and start == 0:
+            yield (",".join(EXPORT_COLUMNS) + "\r\n").encode()
+
+        g = start // width
+        while g * width < stop:
+            g_end = min(len(gtins), g + chunk)
+            n = g_end - g
+            base = np.repeat(prices[rows[g:g_end]], width)
+            cols = {k: v.tolist() for k, v in
+                    self._price_arrays(base, np.tile(qty, n), np.tile(auth, n), np.tile(conc, n)).items()}
+            invalid = set(np.flatnonzero(np.isnan(base)).tolist())
+
+            first = g * width
+            records = []
+            for i in range(max(start, first) - first, min(stop, g_end * width) - first):
+                gtin = gtins[g + i // width]
+                q, a, c = combos[i % width]
+                rec = {"GTIN": gtin, "quantity": q, "auth": a, "conc": c}
+                if i in invalid:
+                    try:
+                        index.price(gtin)
+                    except PricebookError as e:
+                        rec["error"] = {"status_code": 500, "detail": str(e)}
+                else:
+                    for key in ("BasePrice", "DPMQ", "FDP", "General", "Concessional", "Brand"):
+                        rec[key] = cols[key][i]
+                records.append(rec)
+            yield _encode_csv(records) if fmt == "csv" else b"".join(dumps(r) + b"\n" for r in records)
+            g = g_end
+
+    @staticmethod
+    def _price_arrays(base, qty, auth, conc) -> dict:
+        """calc_price's fee maths (steps 2-5) over whole arrays."""
+        import numpy as np
+        D = base * qty
+        fdp_raw = (
+            D
+            + markup_tier_array(D)
+            + DISPENSING_FEE
+            + CONTAINER_FEE
+            + EXTRA_DISP_FEE
+            + PFDI
+            + FDP_ADJUSTMENT
+        )
+        FDP = round_cents(fdp_raw)
+        general_cost = np.where(auth, cap_array(FDP, GENERAL_CAP), FDP)
+        concessional_cost = np.where(auth & conc, cap_array(FDP, CONCESSIONAL_CAP), 0.0)
+        brand_cost = round_cents(D + ADJUSTED_MARKUP)
+        return {
+            "BasePrice":    base,
+            "DPMQ":         D,
+            "FDP":          FDP,
+            "General":      general_cost,
+            "Concessional": concessional_cost,
+            "Brand":        brand_cost,
+        }
+
+
+def _encode_csv(records: list[dict]) -> bytes:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for r in records:
+        error = r.get("error")
+        w.writerow([
+            "true" if v is True else "false" if v is False else
+            "" if v is None else v
+            for v in (r["GTIN"], r["quantity"], r["auth"], r["conc"], r.get("BasePrice"), r.get("DPMQ"),
+                      r.get("FDP"), r.get("General"), r.get("Concessional"), r.get("Brand"),
+                      error["detail"] if error else None)
+        ])
+    return buf.getvalue().encode()
+
+
+wsd_price_service = WsdPriceService()
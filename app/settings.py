@@ -22,6 +22,133 @@ class Settings(BaseSettings):
     # Path to your RSA private key for client_assertion (if used)
     private_key_path: str = Field("converted_private_key.pem", env="PRIVATE_KEY_PATH")
 
+    # POST /prescription/batch fan-out: parallel SCID fetches, and the
+    # per-SCID and whole-batch time limits in seconds
+    batch_concurrency: int = Field(8, env="BATCH_CONCURRENCY")
+    batch_item_timeout: float = Field(15.0, env="BATCH_ITEM_TIMEOUT")
+    batch_timeout: float = Field(60.0, env="BATCH_TIMEOUT")
+
+    # SCID bundle cache: default freshness (seconds) and memory budget (bytes)
+    bundle_cache_ttl: float = Field(15.0, env="BUNDLE_CACHE_TTL")
+    bundle_cache_max_bytes: int = Field(32 * 1024 * 1024, env="BUNDLE_CACHE_MAX_BYTES")
+
+    # Where the token, bundle and PBS caches live (see cache_backend.py):
+    # "memory" keeps them per process, "sqlite" shares them between all
+    # workers on the host through one WAL-mode file at CACHE_PATH, which
+    # must be in a directory only the service user can write to (default:
+    # a per-user directory under the system temp dir)
+    cache_backend: str = Field("memory", env="CACHE_BACKEND")
+    cache_path: str | None = Field(None, env="CACHE_PATH")
+
+    # JSON responses at least this large are gzip/brotli-compressed when accepted
+    response_compress_min_bytes: int = Field(1024, env="RESPONSE_COMPRESS_MIN_BYTES")
+
+    # Outbound calls (see app/services/resilience.py): attempts per call,
+    # deadline per call across all attempts, full-jitter backoff base/cap,
+    # and the total upstream time one inbound request may use (seconds)
+    upstream_attempts: int = Field(3, env="UPSTREAM_ATTEMPTS")
+    upstream_deadline: float = Field(20.0, env="UPSTREAM_DEADLINE")
+    upstream_backoff_base: float = Field(0.5, env="UPSTREAM_BACKOFF_BASE")
+    upstream_backoff_cap: float = Field(8.0, env="UPSTREAM_BACKOFF_CAP")
+    request_budget: float = Field(30.0, env="REQUEST_BUDGET")
+
+    # Per-upstream circuit breaker: consecutive failures to open, cool-down before probing
+    breaker_failure_threshold: int = Field(5, env="BREAKER_FAILURE_THRESHOLD")
+    breaker_reset_timeout: float = Field(30.0, env="BREAKER_RESET_TIMEOUT")
+
+    # Hedged FHIR GETs (see app/services/hedging.py): off unless enabled;
+    # a second attempt goes out once the first has run past this percentile
+    # of the last HEDGE_WINDOW latencies (never sooner than HEDGE_MIN_DELAY
+    # seconds, and not before HEDGE_MIN_SAMPLES have been seen), for at most
+    # HEDGE_BUDGET (a fraction) of requests
+    fhir_hedge_enabled: bool = Field(False, env="FHIR_HEDGE_ENABLED")
+    hedge_percentile: float = Field(0.95, env="HEDGE_PERCENTILE")
+    hedge_budget: float = Field(0.05, env="HEDGE_BUDGET")
+    hedge_window: int = Field(500, env="HEDGE_WINDOW")
+    hedge_min_samples: int = Field(50, env="HEDGE_MIN_SAMPLES")
+    hedge_min_delay: float = Field(0.05, env="HEDGE_MIN_DELAY")
+
+    # PBS API (see app/services/pbs_pricing.py): subscription key (defaults
+    # to OCP_APIM_SUBSCRIPTION_KEY) and base URL
+    pbs_api_key: str | None = Field(None, env="PBS_API_KEY")
+    pbs_base_url: str = Field("https://data-api.health.gov.au/pbs/api/v3", env="PBS_BASE_URL")
+
+    # PBS lookup caches: items and rules are fresh for PBS_CACHE_TTL seconds,
+    # then served stale for up to PBS_CACHE_STALE_TTL more while they refresh;
+    # not-found results are kept PBS_CACHE_NEGATIVE_TTL seconds; at most
+    # PBS_CACHE_MAXSIZE items (and as many rules) are held
+    pbs_cache_ttl: float = Field(6 * 3600, env="PBS_CACHE_TTL")
+    pbs_cache_stale_ttl: float = Field(24 * 3600, env="PBS_CACHE_STALE_TTL")
+    pbs_cache_negative_ttl: float = Field(15 * 60, env="PBS_CACHE_NEGATIVE_TTL")
+    pbs_cache_maxsize: int = Field(5000, env="PBS_CACHE_MAXSIZE")
+
+    # PBS batch pricing: PBS codes per bulk /items call, page size of those
+    # calls, and how many rule lookups run at once
+    pbs_items_per_call: int = Field(20, env="PBS_ITEMS_PER_CALL")
+    pbs_items_page_size: int = Field(100, env="PBS_ITEMS_PAGE_SIZE")
+    pbs_batch_concurrency: int = Field(8, env="PBS_BATCH_CONCURRENCY")
+
+    # When set, PBS pricing reads only from this offline snapshot (see
+    # pbs_ingest); distinct requested PBS codes counted for month-rollover
+    # pre-warming
+    pbs_snapshot_path: str | None = Field(None, env="PBS_SNAPSHOT_PATH")
+    pbs_tracked_codes: int = Field(2000, env="PBS_TRACKED_CODES")
+
+    # Host-wide PBS API rate limit shared by all workers (see rate_governor.py):
+    # requests/second (0 disables), burst size, tokens kept back for
+    # interactive calls, and the file holding the shared bucket (in a
+    # directory only the service user can write to; default: a per-user
+    # directory under the system temp dir). The default is the public PBS
+    # API's documented allowance of about one request every 20 seconds (as
+    # paced by pbs_ingest), with a small burst; raise it only for a
+    # subscription with a higher quota. Lookups are cached for hours, so
+    # steady traffic stays well inside it.
+    pbs_rate_limit: float = Field(0.05, env="PBS_RATE_LIMIT")
+    pbs_rate_burst: float = Field(3.0, env="PBS_RATE_BURST")
+    pbs_rate_reserve: float = Field(1.0, env="PBS_RATE_RESERVE")
+    pbs_rate_state_path: str | None = Field(None, env="PBS_RATE_STATE_PATH")
+
+    # Month-rollover pre-warming (see app/services/pbs_rollover.py): from
+    # PBS_ROLLOVER_LEAD seconds before the month ends, check every
+    # PBS_ROLLOVER_INTERVAL seconds for next month's schedule and load the
+    # items and rules of the PBS_ROLLOVER_TOP_N most requested codes under it,
+    # PBS_ROLLOVER_CONCURRENCY rule lookups at a time
+    pbs_rollover_enabled: bool = Field(True, env="PBS_ROLLOVER_ENABLED")
+    pbs_rollover_lead: float = Field(3 * 3600, env="PBS_ROLLOVER_LEAD")
+    pbs_rollover_interval: float = Field(900.0, env="PBS_ROLLOVER_INTERVAL")
+    pbs_rollover_top_n: int = Field(200, env="PBS_ROLLOVER_TOP_N")
+    pbs_rollover_concurrency: int = Field(2, env="PBS_ROLLOVER_CONCURRENCY")
+
+    # Speculative prefetch (see app/services/prefetch.py): warm the PBS item
+    # and rules lookups of each summarized prescription in the background;
+    # jobs running at once, waiting at most, started per second (per worker),
+    # seconds before the same PBS code is prefetched again, and the upstream
+    # time budget of one job
+    prefetch_enabled: bool = Field(False, env="PREFETCH_ENABLED")
+    prefetch_concurrency: int = Field(2, env="PREFETCH_CONCURRENCY")
+    prefetch_max_pending: int = Field(32, env="PREFETCH_MAX_PENDING")
+    prefetch_rate: float = Field(1.0, env="PREFETCH_RATE")
+    prefetch_dedupe_window: float = Field(300.0, env="PREFETCH_DEDUPE_WINDOW")
+    prefetch_timeout: float = Field(10.0, env="PREFETCH_TIMEOUT")
+
+    # Request profiling (see app/profiling.py): PROFILE_REQUESTS ("spans" or
+    # "flame") profiles every request, otherwise only those sent with an
+    # X-Profile header; the header and POST /_debug/profiling need an
+    # X-Profile-Token equal to PROFILE_ADMIN_TOKEN (unset: both are off);
+    # flamegraph sampling interval (seconds); requests slower than
+    # SLOW_REQUEST_THRESHOLD seconds (0 disables) are kept, the last
+    # SLOW_REQUEST_BUFFER of them
+    profile_requests: str = Field("off", env="PROFILE_REQUESTS")
+    profile_admin_token: str | None = Field(None, env="PROFILE_ADMIN_TOKEN")
+    profile_flame_interval: float = Field(0.001, env="PROFILE_FLAME_INTERVAL")
+    slow_request_threshold: float = Field(2.0, env="SLOW_REQUEST_THRESHOLD")
+    slow_request_buffer: int = Field(50, env="SLOW_REQUEST_BUFFER")
+
+    # Startup warm-up (see app/warmup.py): whether to run it, and how long
+    # the lifespan waits for it before accepting traffic (seconds)
+    warmup_enabled: bool = Field(True, env="WARMUP_ENABLED")
+    warmup_timeout: float = Field(8.0, env="WARMUP_TIMEOUT")
+
     model_config = ConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -0,0 +1,162 @@
+# app/warmup.py
+"""
+Startup warm-up, run from the app lifespan so the first request on a fresh
+instance does not pay for it.
+
+Components run concurrently and the lifespan waits for them at most
+`settings.warmup_timeout` seconds; anything still running after that keeps
+going in the background. /ready reports every component and is only 200
+once the required (local) ones have succeeded. Upstream components are not
+required: an upstream outage should not take every instance out of
+rotation, and those lookups are retried on first use anyway.
+"""
+import asyncio
+import importlib
+import logging
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from app.settings import settings
+from app.services.http_clients import http_clients
+
+log = logging.getLogger("warmup")
+
+# Imported in a worker thread during warm-up instead of at module import time
+DEFERRED_IMPORTS = ("numpy", "jwt", "cryptography.hazmat.primitives.serialization")
+
+
+class Component:
+    __slots__ = ("name", "required", "status", "elapsed", "detail", "error")
+
+    def __init__(self, name: str, required: bool):
+        self.name = name
+        self.required = required
+        self.status = "pending"
+        self.elapsed: float | None = None
+        self.detail = None
+        self.error: str | None = None
+
+    def report(self) -> dict:
+        out = {"status": self.status, "required": self.required}
+        if self.elapsed is not None:
+            out["elapsed_ms"] = round(self.elapsed * 1000, 1)
+        if self.detail is not None:
+            out["detail"] = self.detail
+        if self.error is not None:
+            out["error"] = self.error
+        return out
+
+
+# ─── Steps ──────────────────────────────────────────────────────────────────────
+def _import_heavy_modules():
+    for name in DEFERRED_IMPORTS:
+        importlib.import_module(name)
+    return list(DEFERRED_IMPORTS)
+
+
+async def _imports():
+    return await run_in_threadpool(_import_heavy_modules)
+
+
+async def _http_pools():
+    await http_clients.start()
+    # Token and PBS connections are opened by their own steps; FHIR has no
+    # cheap data call, so open its pool with the capability statement.
+    r = await http_clients.fhir.get(f"{settings.fhir_api_base}/metadata", timeout=5)
+    return {"fhir_metadata": r.status_code}
+
+
+async def _token():
+    from app.services.token_service import token_service
+    await token_service.get_token()
+    return {"expires_in": token_service.stats()["expires_in"]}
+
+
+async def _pbs_schedule():
+    from app.services import pbs_pricing, pbs_snapshot
+    if pbs_pricing.PBS_SNAPSHOT_PATH:
+        snapshot = await run_in_threadpool(pbs_snapshot.current, pbs_pricing.PBS_SNAPSHOT_PATH)
+        if snapshot is not None:
+            return {"schedule_code": snapshot.schedule_code, "source": "snapshot"}
+    return {"schedule_code": await pbs_pricing.current_schedule(), "source": "api"}
+
+
+async def _pricebook():
+    from app.services.wsd_pricing import wsd_price_service
+    index = await run_in_threadpool(wsd_price_service.pricebook.index)
+    return {"rows": index.rows}
+
+
+# name -> (step, required)
+STEPS = {
+    "imports":      (_imports, True),
+    "pricebook":    (_pricebook, True),
+    "http_pools":   (_http_pools, False),
+    "token":        (_token, False),
+    "pbs_schedule": (_pbs_schedule, False),
+}
+
+
+class Warmup:
+    def __init__(self, steps: dict = STEPS):
+        self.steps = steps
+        self.components = {name: Component(name, required) for name, (_, required) in steps.items()}
+        self.enabled = False
+        self.elapsed: float | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def run(self, timeout: float | None = None) -> None:
+        """Start every step and wait for them for at most `timeout` seconds."""
+        timeout = settings.warmup_timeout if timeout is None else timeout
+        self.enabled = True
+        start = time.perf_counter()
+        self._tasks = [asyncio.create_task(self._run_step(name, step))
+                       for name, (step, _) in self.steps.items()]
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        self.elapsed = time.perf_counter() - start
+        if pending:
+            log.warning("Warm-up still running after %.1fs: %s", timeout,
+                        ", ".join(c.name for c in self.components.values() if c.status == "pending"))
+        else:
+            log.info("Warm-up finished in %.2fs", self.elapsed)
+
+    async def aclose(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def ready(self) -> bool:
+        if not self.enabled:
+            return True
+        return all(c.status == "ok" for c in self.components.values() if c.required)
+
+    def report(self) -> dict:
+        return {
+            "ready":      self.ready(),
+            "warmup":     ("disabled" if not self.enabled
+                           else "running" if any(c.status == "pending" for c in self.components.values())
+                           else "done"),
+            "elapsed_ms": round(self.elapsed * 1000, 1) if self.elapsed is not None else None,
+            "components": {name: c.report() for name, c in self.components.items()},
+        }
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    async def _run_step(self, name: str, step) -> None:
+        component = self.components[name]
+        start = time.perf_counter()
+        try:
+            component.detail = await step()
+            component.status = "ok"
+        except asyncio.CancelledError:
+            component.status = "cancelled"
+            raise
+        except Exception as e:
+            component.status = "failed"
+            component.error = f"{type(e).__name__}: {e}"
+            log.warning("Warm-up step %s failed: %s", name, component.error)
+        finally:
+            component.elapsed = time.perf_counter() - start
+
+
+warmup = Warmup()
@@ -0,0 +1,117 @@
+# benchmarks/bench_coldstart.py
+"""
+Cold-start report: import time of `main`, and boot time plus first- and
+second-request latency of a fresh uvicorn process with and without warm-up.
+
+    python -m benchmarks.bench_coldstart [--repeat 3] [--top 12] [stub options]
+
+Import time comes from `python -X importtime -c "import main"` (median of
+--repeat runs, heaviest top-level imports listed). Each boot starts a new
+server against the local stubs (see stub_upstreams) with WARMUP_ENABLED set
+on or off; "boot" is process start until /health answers, which includes the
+lifespan warm-up.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.loadtest import ROOT, Workload, free_port, pricebook_gtins, start_server
+from benchmarks.stub_upstreams import add_fault_args, stubs_from_args
+from app.services.bundle_summary import summarize_bundle
+
+PROBES = ("single", "pbs", "wsd", "priced")
+
+
+def import_times(repeat: int) -> tuple[float, dict[str, float]]:
+    """Median total import time of main (ms) and per top-level import (ms)."""
+    totals, per_module = [], {}
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                             cwd=ROOT, capture_output=True, text=True, check=True).stderr
+        for line in out.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if name.strip() == "main":
+                totals.append(int(cumulative) / 1000)
+            elif name.startswith("   ") and not name.startswith("     "):
+                per_module.setdefault(name.strip(), []).append(int(cumulative) / 1000)
+    return statistics.median(totals), {k: statistics.median(v) for k, v in per_module.items()}
+
+
+def boot(env: dict[str, str], workload: Workload, scid: str) -> dict:
+    port = free_port()
+    start = time.perf_counter()
+    server = start_server(port, env, workers=1)
+    booted = time.perf_counter() - start
+    base = f"http://127.0.0.1:{port}"
+    paths = {
+        "single": f"/prescription/{scid}",
+        "pbs":    workload.request("pbs", 0)[1],
+        "wsd":    workload.request("wsd", 0)[1],
+        "priced": f"/prescription/{scid}/priced",
+    }
+    out = {"boot_ms": round(booted * 1000, 1)}
+    try:
+        with httpx.Client(base_url=base, timeout=60) as client:
+            out["ready"] = client.get("/ready").json()
+            for name in PROBES:
+                for attempt in ("first", "second"):
+                    t = time.perf_counter()
+                    r = client.get(paths[name])
+                    out[f"{name}_{attempt}_ms"] = round((time.perf_counter() - t) * 1000, 1)
+                    out[f"{name}_status"] = r.status_code
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--top", type=int, default=12)
+    ap.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    add_fault_args(ap)
+    args = ap.parse_args()
+
+    total, modules = import_times(args.repeat)
+    print(f"import main: {total:.1f} ms (median of {args.repeat})")
+    for name, ms in sorted(modules.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    stubs = stubs_from_args(args).start()
+    scids = list(stubs.bundles)
+    pbs_codes = sorted({summarize_bundle(json.loads(b))["pbs_code"] for b in stubs.bundles.values()} - {"N/A"})
+    workload = Workload(scids, pbs_codes, pricebook_gtins(10), batch_size=1)
+    results = {}
+    try:
+        for warm in (False, True):
+            # Fresh SCID and shared cache file per boot so neither run is
+            # served from a warm cache
+            env = {**stubs.env(), "WARMUP_ENABLED": str(warm).lower(),
+                   "CACHE_PATH": os.path.join(stubs.state_dir, f"cache-{int(warm)}.sqlite3")}
+            results["warm" if warm else "cold"] = boot(env, workload, scids[int(warm)])
+    finally:
+        stubs.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"\n{'':<18}{'no warm-up':>12}{'warm-up':>12}")
+    keys = ["boot_ms"] + [f"{p}_{a}_ms" for p in PROBES for a in ("first", "second")]
+    for key in keys:
+        print(f"{key:<18}{results['cold'][key]:>12}{results['warm'][key]:>12}")
+    comps = results["warm"]["ready"]["components"]
+    print("\nwarm-up components: " + ", ".join(
+        f"{name} {c['status']} {c.get('elapsed_ms', '-')}ms" for name, c in comps.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/bench_pricebook.py
+"""
+Compare the original per-request CSV scan with the in-memory PricebookIndex.
+
+    python -m benchmarks.bench_pricebook --rows 120000 --lookups 2000
+
+A synthetic pricebook with the same column layout as Pricebook_1055053.csv is
+written to a temp dir; lookups are drawn uniformly from its GTINs.
+"""
+import argparse
+import csv
+import gc
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from app.services.pricebook import PricebookIndex
+
+HEADER = ["PDE", "Description", "Supp Part No", "EAN", "Generic",
+          "Inventory Group", "Document Display", "Price GST Inc", "Price GST Exc"]
+
+
+def write_synthetic_pricebook(path: Path, rows: int, seed: int = 1) -> list[str]:
+    rnd = random.Random(seed)
+    gtins = []
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(HEADER)
+        for i in range(rows):
+            gtin = str(9300000000000 + i * 7)
+            exc = round(rnd.uniform(0.5, 2500.0), 2)
+            w.writerow([i, f"Drug {i} Tab 10mg 30", i, gtin, f"Generic {i % 997} 10mg Tab",
+                        rnd.randint(1, 9), "", round(exc * 1.1, 2), exc])
+            gtins.append(gtin)
+    return gtins
+
+
+def legacy_scan(csv_path: Path, gtin: str) -> float | None:
+    """The pre-index WsdPriceService lookup: DictReader scan until a match."""
+    with open(csv_path, newline="") as f:
+        reader = csv.DictReader(f)
+        headers = reader.fieldnames or []
+        gtin_col, base_col = headers[3], headers[8]
+        for row in reader:
+            if row.get(gtin_col) == gtin:
+                return float(row.get(base_col, 0))
+    return None
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def time_lookups(fn, gtins: list[str]) -> list[float]:
+    out = []
+    for g in gtins:
+        t0 = time.perf_counter()
+        fn(g)
+        out.append((time.perf_counter() - t0) * 1e6)
+    return out
+
+
+def report(name: str, samples: list[float]) -> None:
+    print(f"  {name:<8} mean {statistics.fmean(samples):>12.2f} us   "
+          f"p50 {percentile(samples, 50):>12.2f} us   p99 {percentile(samples, 99):>12.2f} us")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=120_000)
+    ap.add_argument("--lookups", type=int, default=2_000)
+    ap.add_argument("--scan-lookups", type=int, default=50,
+                    help="lookups for the legacy scan (it is O(rows) per call)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "pricebook.csv"
+        gtins = write_synthetic_pricebook(path, args.rows)
+        size_mb = path.stat().st_size / 1e6
+        rnd = random.Random(2)
+        sample = [rnd.choice(gtins) for _ in range(args.lookups)]
+        print(f"Synthetic pricebook: {args.rows} rows, {size_mb:.1f} MB")
+
+        gc.collect()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        index = PricebookIndex.load(path)
+        build_s = time.perf_counter() - t0
+        index_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        legacy_scan(path, gtins[-1])
+        _, scan_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        for g in sample[:args.scan_lookups]:
+            assert legacy_scan(path, g) == index.price(g)
+
+        print(f"Index build: {build_s * 1e3:.1f} ms")
+        print("Per-lookup latency:")
+        report("scan", time_lookups(lambda g: legacy_scan(path, g), sample[:args.scan_lookups]))
+        report("index", time_lookups(index.price, sample))
+        print("Memory:")
+        print(f"  scan     peak per request {scan_peak / 1e6:>8.2f} MB (nothing retained)")
+        print(f"  index    resident         {index_bytes / 1e6:>8.2f} MB "
+              f"({index_bytes / max(1, len(index)):.0f} B/GTIN)")
+
+
+if __name__ == "__main__":
+    main()
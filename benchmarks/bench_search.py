@@ -0,0 +1,81 @@
+# benchmarks/bench_search.py
+"""
+Pricebook search (GET /pricing/wsd/search) index build and query latency.
+
+    python -m benchmarks.bench_search [--rows 120000] [--repeat 200]
+
+Scales the bundled pricebook up to --rows rows by repeating it with fresh
+GTINs and a numbered suffix on each description, then reports: full index
+build time, incremental rebuild time after 1% of rows changed (as on a
+pricebook reload), and p50/p99 latency of typical typeahead queries: each
+query is replayed keystroke by keystroke ("am", "amo", ...).
+"""
+import argparse
+import csv
+import statistics
+import time
+
+from app.services.drug_search import SearchIndex
+from app.services.pricebook import DESCRIPTION_COL, GENERIC_COL, GTIN_COL, MIN_COLUMNS
+from app.services.wsd_pricing import CSV_PATH
+
+QUERIES = ("amoxicillin 500", "panadol", "atorvastatin 40", "ventolin", "metformin 1g",
+           "para tab", "amoxycilin", "cillin", "nurofen", "zzzz")
+
+
+def pricebook_docs(rows: int) -> list[tuple[str, str, str]]:
+    with open(CSV_PATH, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        base = [(r[GTIN_COL], r[DESCRIPTION_COL].strip(), r[GENERIC_COL].strip())
+                for r in reader if len(r) >= MIN_COLUMNS and r[GTIN_COL]]
+    docs = list(base)
+    copy = 1
+    while len(docs) < rows:
+        docs.extend((f"{copy}{gtin}", f"{desc} {copy}", generic) for gtin, desc, generic in base)
+        copy += 1
+    return docs[:rows]
+
+
+def keystrokes(query: str) -> list[str]:
+    # The endpoint needs at least two characters
+    return [query[:i] for i in range(2, len(query) + 1) if query[:i].strip()]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--rows", type=int, default=120_000)
+    ap.add_argument("--repeat", type=int, default=200, help="times each keystroke sequence is replayed")
+    args = ap.parse_args()
+
+    docs = pricebook_docs(args.rows)
+    start = time.perf_counter()
+    index = SearchIndex(docs)
+    built = time.perf_counter() - start
+    print(f"{len(index)} rows, {len(index.vocab)} distinct words")
+    print(f"full build:        {built * 1000:8.1f} ms")
+
+    changed = list(docs)
+    for i in range(0, len(changed), 100):
+        gtin, desc, generic = changed[i]
+        changed[i] = (gtin, desc + " new", generic)
+    start = time.perf_counter()
+    SearchIndex(changed, previous=index)
+    print(f"rebuild, 1% moved: {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    print(f"\n{'query':<18}{'hits':>7}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}   (per keystroke)")
+    for query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            for prefix in keystrokes(query):
+                t = time.perf_counter()
+                total, _ = index.search(prefix, 20)
+                timings.append(time.perf_counter() - t)
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        print(f"{query:<18}{total:>7}{statistics.median(timings) * 1000:>9.3f}"
+              f"{p99 * 1000:>9.3f}{timings[-1] * 1000:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
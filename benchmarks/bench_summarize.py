@@ -0,0 +1,50 @@
+# benchmarks/bench_summarize.py
+"""
+Per-bundle CPU time of the single-pass summarizer vs the original
+PrescriptionService.summarize.
+
+    python -m benchmarks.bench_summarize [--corpus bundles.jsonl] [--repeat 20]
+
+Without --corpus a synthetic corpus is generated (see fhir_fixtures). That
+both give the same output is checked by tests/test_bundle_summary.py.
+"""
+import argparse
+import time
+from pathlib import Path
+
+from app.services.bundle_summary import summarize_bundle
+from benchmarks.fhir_fixtures import load_corpus, synthetic_corpus
+from tests.legacy_summary import legacy_summarize
+
+
+def per_bundle_us(fn, corpus, repeat: int) -> float:
+    bundles = [b for _, b in corpus]
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.process_time()
+        for b in bundles:
+            fn(b)
+        best = min(best, time.process_time() - t0)
+    return best / len(bundles) * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", type=Path, help="JSON Lines file of recorded bundles")
+    ap.add_argument("--synthetic", type=int, default=2000, help="synthetic bundles when no corpus is given")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.synthetic)
+    if not corpus:
+        raise SystemExit(f"No bundles found in {args.corpus}")
+
+    legacy = per_bundle_us(legacy_summarize, corpus, args.repeat)
+    single = per_bundle_us(summarize_bundle, corpus, args.repeat)
+    print(f"Per-bundle CPU time (best of {args.repeat}):")
+    print(f"  legacy       {legacy:8.2f} us")
+    print(f"  single-pass  {single:8.2f} us   ({legacy / single:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/fhir_fixtures.py
+"""
+Recorded and synthetic eRx MedicationRequest bundles for benchmarks.
+
+A corpus file is JSON Lines: each line is either a FHIR Bundle, or an object
+with the bundle under "bundle" (and optionally its "scid").
+"""
+import json
+import random
+from pathlib import Path
+
+EXT = "http://fhir.erx.com.au/StructureDefinition/"
+
+
+def synthetic_bundle(scid: str, rnd: random.Random) -> dict:
+    identifiers = [
+        ("http://ns.electronichealth.net.au/id/medicare-number", f"{rnd.randrange(10**9, 10**10)}"),
+        ("http://ns.electronichealth.net.au/id/hi/ihi/1.0", f"800360{rnd.randrange(10**9, 10**10)}"),
+        ("http://ns.electronichealth.net.au/id/pensioner-concession-card", f"PCC{rnd.randrange(10**6)}"),
+        ("http://ns.electronichealth.net.au/id/commonwealth-seniors-health-card", f"CSHC{rnd.randrange(10**6)}"),
+        ("http://ns.electronichealth.net.au/id/racf-id", f"RACF{rnd.randrange(10**4)}"),
+        ("http://fhir.erx.com.au/NamingSystem/identifiers#authority-script-number", f"{rnd.randrange(10**7)}"),
+    ]
+    rnd.shuffle(identifiers)
+    name = ({"text": "Jane Q Citizen"} if rnd.random() < 0.3
+            else {"given": ["Jane", "Q"], "family": f"Citizen{rnd.randrange(100)}"})
+    codings = [
+        {"system": "http://snomed.info/sct", "code": str(rnd.randrange(10**8))},
+        {"system": "http://www.gs1.org/gtin", "code": str(9300000000000 + rnd.randrange(10**6))},
+        {"system": "http://pbs.gov.au/code/item", "code": f"{rnd.randrange(1, 99999)}{rnd.choice('ABCKLMNPTWXY')}"},
+        {"system": "http://www.tga.gov.au/artg", "code": str(rnd.randrange(10**6))},
+    ]
+    rnd.shuffle(codings)
+    extensions = [
+        {"url": EXT + "medication-brand-name", "valueString": "Brand"},
+        {"url": EXT + "medication-generic-name", "valueString": "Generic 10mg Tab"},
+        {"url": EXT + "aip-complient-drug-name", "valueString": "Generic 10 mg tablet"},
+        {"url": EXT + "item-generic-intension", "valueString": "Generic"},
+        {"url": EXT + "schedule-number", "valueString": rnd.choice(["4", "8", "2"])},
+        {"url": EXT + "private-prescription", "valueBoolean": rnd.random() < 0.2},
+    ] + [{"url": EXT + f"misc-{k}", "valueString": "x" * 20} for k in range(rnd.randrange(4))]
+    allowed = rnd.randrange(0, 6)
+    return {"resourceType": "Bundle", "type": "searchset", "entry": [{"resource": {
+        "resourceType": "MedicationRequest", "id": f"mr-{scid}", "status": "active", "intent": "order",
+        "authoredOn": "2024-05-01",
+        "contained": [
+            {"resourceType": "Practitioner", "id": "pr", "name": [{"family": "Doctor"}]},
+            {"resourceType": "Patient", "id": "pt", "identifier": [{"system": s, "value": v} for s, v in identifiers],
+             "name": [name], "birthDate": "1950-02-03"},
+            {"resourceType": "Organization", "id": "org", "name": "Clinic"},
+            {"resourceType": "Medication", "id": "med", "code": {"coding": codings, "text": "Generic 10mg Tab"},
+             "form": {"text": "Tablet"}, "extension": [{"url": EXT + "strength", "valueString": "10 mg"}]},
+        ],
+        "extension": extensions,
+        "note": [{"text": "Take one daily"}] * rnd.randrange(3),
+        "dispenseRequest": {
+            "numberOfRepeatsAllowed": allowed,
+            "repeatsDispensed": rnd.randrange(0, allowed + 1),
+            "quantity": {"value": rnd.choice([28, 30, 60])},
+            "expectedSupplyDuration": {"value": 30},
+        },
+    }}]}
+
+
+def synthetic_corpus(n: int, seed: int = 7) -> list[tuple[str, dict]]:
+    rnd = random.Random(seed)
+    return [(f"SCID{i:06d}", synthetic_bundle(f"SCID{i:06d}", rnd)) for i in range(n)]
+
+
+def load_corpus(path: Path) -> list[tuple[str, dict]]:
+    """(scid, bundle) pairs from a JSON Lines file; lines that are not bundles are skipped."""
+    out = []
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            bundle = rec.get("bundle", rec)
+            if bundle.get("resourceType") != "Bundle":
+                continue
+            out.append((rec.get("scid") or f"REC{i:06d}", bundle))
+    return out
@@ -0,0 +1,255 @@
+# benchmarks/loadtest.py
+"""
+End-to-end load test of main:app against local upstream stubs.
+
+    python -m benchmarks.loadtest [--concurrency 1,8,32] [--requests 300]
+        [--scenarios single,batch,pbs,pbs_batch,wsd] [--baseline benchmarks/baseline.json]
+        [--save-baseline] [--out results.json] [stub options, see stub_upstreams]
+
+Starts the token/FHIR/PBS stubs, runs `uvicorn main:app` in a subprocess
+pointed at them (TOKEN_URL, FHIR_API_BASE, PBS_BASE_URL), then drives each
+scenario at each concurrency level with a closed loop of workers:
+
+    single     GET  /prescription/{scid}
+    batch      POST /prescription/batch      (--batch-size SCIDs per call)
+    pbs        GET  /pricing/pbs/{pbs_code}  (codes taken from the corpus)
+    pbs_batch  POST /pricing/pbs/batch       (--batch-size lines per call)
+    wsd        GET  /pricing/wsd/{gtin}      (GTINs taken from the pricebook)
+
+Reports throughput, p50/p95/p99 latency and non-2xx counts, and the change
+against a stored baseline. Numbers are only comparable between runs on the
+same machine with the same stub settings.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from app.services.bundle_summary import summarize_bundle
+from app.services.pricebook import GTIN_COL
+from app.services.wsd_pricing import CSV_PATH
+from benchmarks.stub_upstreams import add_fault_args, stubs_from_args
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+SCENARIOS = ("single", "batch", "pbs", "pbs_batch", "wsd")
+
+
+def percentile(ordered: list[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def pricebook_gtins(limit: int = 1000) -> list[str]:
+    gtins = []
+    with open(CSV_PATH, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if len(row) > GTIN_COL and row[GTIN_COL].strip():
+                gtins.append(row[GTIN_COL].strip())
+                if len(gtins) >= limit:
+                    break
+    return gtins
+
+
+# ─── Workload ───────────────────────────────────────────────────────────────────
+class Workload:
+    """Request factory per scenario, cycling through the seeded inputs."""
+
+    def __init__(self, scids: list[str], pbs_codes: list[str], gtins: list[str], batch_size: int):
+        self.scids = scids
+        self.pbs_codes = pbs_codes or ["ZZZ"]
+        self.gtins = gtins or ["0"]
+        self.batch_size = batch_size
+
+    def request(self, scenario: str, i: int) -> tuple[str, str, object]:
+        if scenario == "single":
+            return "GET", f"/prescription/{self.scids[i % len(self.scids)]}", None
+        if scenario == "batch":
+            start = (i * self.batch_size) % len(self.scids)
+            batch = [self.scids[(start + k) % len(self.scids)] for k in range(self.batch_size)]
+            return "POST", "/prescription/batch", batch
+        if scenario == "pbs":
+            return "GET", f"/pricing/pbs/{self.pbs_codes[i % len(self.pbs_codes)]}", None
+        if scenario == "pbs_batch":
+            start = (i * self.batch_size) % len(self.pbs_codes)
+            lines = [{"pbs_code": self.pbs_codes[(start + k) % len(self.pbs_codes)], "qty": 1 + k % 3}
+                     for k in range(self.batch_size)]
+            return "POST", "/pricing/pbs/batch", lines
+        if scenario == "wsd":
+            return "GET", f"/pricing/wsd/{self.gtins[i % len(self.gtins)]}", None
+        raise ValueError(f"Unknown scenario {scenario}")
+
+
+async def drive(base_url: str, workload: Workload, scenario: str, concurrency: int,
+                total: int, warmup: int) -> dict:
+    """Closed-loop run: `concurrency` workers issue `total` requests between them."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        async def call(i: int) -> tuple[float, int]:
+            method, path, body = workload.request(scenario, i)
+            start = time.perf_counter()
+            try:
+                r = await client.request(method, path, json=body)
+                status = r.status_code
+            except httpx.HTTPError:
+                status = 0
+            return time.perf_counter() - start, status
+
+        for i in range(warmup):
+            await call(i)
+
+        latencies: list[float] = []
+        statuses: dict[int, int] = {}
+        counter = iter(range(warmup, warmup + total))
+
+        async def worker():
+            for i in counter:
+                elapsed, status = await call(i)
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests":    total,
+        "concurrency": concurrency,
+        "rps":         round(total / wall, 1),
+        "p50_ms":      round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms":      round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms":      round(percentile(latencies, 99) * 1000, 2),
+        "non_2xx":     sum(n for s, n in statuses.items() if not 200 <= s < 300),
+        "statuses":    {str(s): n for s, n in sorted(statuses.items())},
+    }
+
+
+# ─── Server ─────────────────────────────────────────────────────────────────────
+def start_server(port: int, env: dict[str, str], workers: int) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning", "--workers", str(workers)]
+    # PBS pricing must go to the stubs, not an offline snapshot
+    inherited = {k: v for k, v in os.environ.items() if k != "PBS_SNAPSHOT_PATH"}
+    proc = subprocess.Popen(cmd, cwd=ROOT, env={**inherited, **env})
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {proc.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError("uvicorn did not become healthy within 30s")
+
+
+# ─── Reporting ──────────────────────────────────────────────────────────────────
+def _delta(now: float, before: float | None, lower_is_better: bool) -> str:
+    if not before:
+        return ""
+    pct = (now - before) / before * 100
+    better = pct < 0 if lower_is_better else pct > 0
+    return f"{pct:+6.1f}%{' ✓' if better and abs(pct) >= 5 else ' ✗' if abs(pct) >= 5 else '  '}"
+
+
+def report(results: dict, baseline: dict | None) -> None:
+    base = (baseline or {}).get("results", {})
+    print(f"\n{'scenario':<14}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'non2xx':>8}"
+          + ("   Δrps     Δp50     Δp99" if base else ""))
+    for key, r in results.items():
+        line = f"{key:<14}{r['rps']:>9}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['non_2xx']:>8}"
+        b = base.get(key)
+        if b:
+            line += "  " + "  ".join((
+                _delta(r["rps"], b.get("rps"), lower_is_better=False),
+                _delta(r["p50_ms"], b.get("p50_ms"), lower_is_better=True),
+                _delta(r["p99_ms"], b.get("p99_ms"), lower_is_better=True),
+            ))
+        print(line)
+    if baseline:
+        print(f"\nbaseline: {baseline.get('meta', {}).get('recorded_at', '?')}  "
+              "(✓/✗ mark changes of 5% or more)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--concurrency", default="1,8,32", help="comma-separated worker counts")
+    ap.add_argument("--requests", type=int, default=300, help="requests per scenario and level")
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--batch-size", type=int, default=10)
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    ap.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                    help="extra environment for the server, e.g. BUNDLE_CACHE_TTL=0")
+    ap.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    ap.add_argument("--out", type=Path, help="also write the results here as JSON")
+    add_fault_args(ap)
+    args = ap.parse_args()
+
+    stubs = stubs_from_args(args).start()
+    corpus_scids = list(stubs.bundles)
+    pbs_codes = sorted({
+        code for code in (summarize_bundle(json.loads(b))["pbs_code"] for b in stubs.bundles.values())
+        if code != "N/A"
+    })
+    workload = Workload(corpus_scids, pbs_codes, pricebook_gtins(), args.batch_size)
+
+    env = stubs.env()
+    env.update(kv.split("=", 1) for kv in args.env)
+
+    port = free_port()
+    server = start_server(port, env, args.workers)
+    base_url = f"http://127.0.0.1:{port}"
+    results: dict[str, dict] = {}
+    try:
+        for scenario in args.scenarios.split(","):
+            for conc in (int(c) for c in args.concurrency.split(",")):
+                key = f"{scenario}@{conc}"
+                print(f"running {key} ...", flush=True)
+                results[key] = asyncio.run(drive(base_url, workload, scenario, conc, args.requests, args.warmup))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        stubs.stop()
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else None
+    report(results, None if args.save_baseline else baseline)
+    print(f"\nupstream calls: {stubs.counts}")
+
+    doc = {
+        "meta": {
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python":      platform.python_version(),
+            "machine":     platform.machine(),
+            "args":        {k: str(v) for k, v in vars(args).items()},
+        },
+        "results": results,
+    }
+    if args.out:
+        args.out.write_text(json.dumps(doc, indent=2))
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(doc, indent=2))
+        print(f"baseline written to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
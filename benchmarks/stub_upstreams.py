@@ -0,0 +1,249 @@
+# benchmarks/stub_upstreams.py
+"""
+Local stand-ins for the token, FHIR and PBS APIs, for load tests.
+
+    python -m benchmarks.stub_upstreams --port 8777 [--corpus bundles.jsonl]
+        [--fhir-latency-ms 80] [--pbs-latency-ms 40] [--error-rate 0.01] [--rate-429 0.02]
+
+One threaded HTTP server answers all three upstreams under different prefixes:
+
+    POST /connect/token                               token exchange
+    GET  /fhir/MedicationRequest?identifier=...|SCID  searchset from the corpus
+    GET  /pbs/api/v3/schedules | /items | /item-dispensing-rule-relationships
+
+Each upstream has its own latency (mean +/- jitter), error rate and 429 rate;
+errors are 520 for the token endpoint (what the real one returns) and 503
+elsewhere, and 429s carry Retry-After. Unknown SCIDs return an empty
+searchset, PBS codes starting with "Z" are not found. Responses are seeded,
+so two runs with the same arguments serve the same data.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from benchmarks.fhir_fixtures import load_corpus, synthetic_corpus
+
+FHIR_PREFIX = "/fhir"
+PBS_PREFIX  = "/pbs/api/v3"
+TOKEN_PATH  = "/connect/token"
+
+
+@dataclass
+class Fault:
+    """Latency and failure injection for one upstream."""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    rate_429: float = 0.0
+    retry_after: int = 1
+
+
+@dataclass
+class StubConfig:
+    token: Fault = field(default_factory=lambda: Fault(latency_ms=30))
+    fhir: Fault = field(default_factory=lambda: Fault(latency_ms=80, jitter_ms=30))
+    pbs: Fault = field(default_factory=lambda: Fault(latency_ms=40, jitter_ms=15))
+    token_expires_in: int = 3600
+    seed: int = 11
+
+
+def _stable_price(code: str) -> str:
+    """Deterministic per-code price, so PBS results are comparable across runs."""
+    h = int(hashlib.sha1(code.encode()).hexdigest()[:8], 16)
+    return f"{5 + (h % 20000) / 100:.2f}"
+
+
+class StubUpstreams:
+    def __init__(self, corpus: list[tuple[str, dict]], config: StubConfig | None = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StubConfig()
+        self.bundles = {scid: json.dumps(bundle).encode() for scid, bundle in corpus}
+        self.counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._rnd = random.Random(self.config.seed)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+        self.state_dir = tempfile.mkdtemp(prefix="escript-stub-")
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> dict[str, str]:
+        """Environment that points the service at these stubs."""
+        return {
+            "TOKEN_URL":     self.url + TOKEN_PATH,
+            "FHIR_API_BASE": self.url + FHIR_PREFIX,
+            "PBS_BASE_URL":  self.url + PBS_PREFIX,
+            # Own rate bucket and shared cache, so a benchmark neither draws on
+            # a live instance's quota nor starts from its warm cache
+            "PBS_RATE_STATE_PATH": os.path.join(self.state_dir, "pbs-rate.bucket"),
+            "CACHE_BACKEND":       "sqlite",
+            "CACHE_PATH":          os.path.join(self.state_dir, "cache.sqlite3"),
+            # The stub has no quota; the real API's would throttle the benchmark
+            "PBS_RATE_LIMIT":      "0",
+        }
+
+    def start(self) -> "StubUpstreams":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-upstreams", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    # ─── Internals ──────────────────────────────────────────────────────────────
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _roll(self, fault: Fault) -> tuple[float, str | None]:
+        """Delay for this call and the injected failure, if any ("429" / "error")."""
+        with self._lock:
+            delay = max(0.0, fault.latency_ms + self._rnd.uniform(-1, 1) * fault.jitter_ms) / 1000
+            r = self._rnd.random()
+        if r < fault.rate_429:
+            return delay, "429"
+        if r < fault.rate_429 + fault.error_rate:
+            return delay, "error"
+        return delay, None
+
+    def _token(self) -> dict:
+        return {"access_token": "stub-" + "x" * 40, "token_type": "Bearer",
+                "expires_in": self.config.token_expires_in}
+
+    def _medication_request(self, q: dict) -> bytes:
+        scid = q.get("identifier", "").rpartition("|")[2]
+        body = self.bundles.get(scid)
+        if body is None:
+            return json.dumps({"resourceType": "Bundle", "type": "searchset", "entry": []}).encode()
+        return body
+
+    def _pbs(self, path: str, q: dict) -> dict:
+        if path == "/schedules":
+            now = datetime.date.today()
+            prev = now.replace(day=1) - datetime.timedelta(days=1)
+            return {"data": [
+                {"schedule_code": "4001", "effective_month": now.strftime("%B").upper(), "effective_year": now.year},
+                {"schedule_code": "4000", "effective_month": prev.strftime("%B").upper(), "effective_year": prev.year},
+            ]}
+        if path == "/items":
+            codes = [c for c in q.get("pbs_code", "").split(",") if c and not c.startswith("Z")]
+            return {"data": [{"pbs_code": c, "li_item_id": f"LI-{c}", "determined_price": _stable_price(c),
+                              "schedule_code": q.get("schedule_code")} for c in codes]}
+        if path == "/item-dispensing-rule-relationships":
+            li = q.get("li_item_id", "")
+            return {"data": [{"li_item_id": li, "dispensing_rule_mnem": "S90-CP",
+                              "cmnwlth_dsp_price_max_qty": _stable_price(li + "dpmq"), "brand_premium": "0.00"}]}
+        return None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, headers: dict | None = None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _faulted(self, fault: Fault, error_status: int) -> bool:
+                delay, failure = stub._roll(fault)
+                time.sleep(delay)
+                if failure == "429":
+                    self._send(429, b'{"message":"rate limited"}', {"Retry-After": str(fault.retry_after)})
+                elif failure == "error":
+                    self._send(error_status, b'{"message":"injected failure"}')
+                return failure is not None
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path.split("?")[0] != TOKEN_PATH:
+                    return self._send(404, b"{}")
+                stub._count("token")
+                if not self._faulted(stub.config.token, 520):
+                    self._send(200, json.dumps(stub._token()).encode())
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                q = dict(urllib.parse.parse_qsl(url.query))
+                if url.path == FHIR_PREFIX + "/MedicationRequest":
+                    stub._count("fhir")
+                    if not self._faulted(stub.config.fhir, 503):
+                        self._send(200, stub._medication_request(q))
+                elif url.path.startswith(PBS_PREFIX):
+                    path = url.path[len(PBS_PREFIX):]
+                    stub._count("pbs" + path)
+                    if not self._faulted(stub.config.pbs, 503):
+                        body = stub._pbs(path, q)
+                        self._send(200 if body is not None else 404, json.dumps(body or {}).encode())
+                else:
+                    self._send(404, b"{}")
+
+        return Handler
+
+
+def add_fault_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--corpus", type=Path, help="JSON Lines of recorded bundles (default: synthetic)")
+    ap.add_argument("--scids", type=int, default=500, help="synthetic corpus size")
+    ap.add_argument("--token-latency-ms", type=float, default=30)
+    ap.add_argument("--fhir-latency-ms", type=float, default=80)
+    ap.add_argument("--pbs-latency-ms", type=float, default=40)
+    ap.add_argument("--jitter", type=float, default=0.3, help="latency jitter as a fraction of the mean")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=11)
+
+
+def stubs_from_args(args, port: int = 0) -> StubUpstreams:
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.scids, args.seed)
+
+    def fault(latency):
+        return Fault(latency, latency * args.jitter, args.error_rate, args.rate_429)
+
+    config = StubConfig(fault(args.token_latency_ms), fault(args.fhir_latency_ms),
+                        fault(args.pbs_latency_ms), seed=args.seed)
+    return StubUpstreams(corpus, config, port=port)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--port", type=int, default=8777)
+    add_fault_args(ap)
+    args = ap.parse_args()
+
+    stubs = stubs_from_args(args, args.port)
+    for k, v in stubs.env().items():
+        print(f"{k}={v}")
+    print(f"serving {len(stubs.bundles)} bundles; Ctrl-C to stop")
+    try:
+        stubs._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
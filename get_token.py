@@ -1,21 +1,32 @@
-import requests
+import asyncio
+import httpx
 import os
-import jwt
 import datetime
 import uuid
 import urllib.parse
-from dotenv import load_dotenv
+from functools import lru_cache
+from app.services.http_clients import make_client  # importing app loads .env
 
-# Load environment variables from .env file
-load_dotenv()
+TOKEN_URL        = os.getenv("TOKEN_URL", "https://auth-int.medicationknowledge.com.au/connect/token")
+PRIVATE_KEY_PATH = os.getenv("PRIVATE_KEY_PATH", "converted_private_key.pem")
+
+@lru_cache(maxsize=4)
+def load_private_key(private_key_path: str):
+    """
+    Read and parse the RSA private key once per process; the key file does
+    not change while the service is running.
+    """
+    # jwt/cryptography are imported on first use to keep them off the import path
+    from cryptography.hazmat.primitives import serialization
+    with open(private_key_path, "rb") as key_file:
+        return serialization.load_pem_private_key(key_file.read(), password=None)
 
 def generate_jwt(private_key_path: str) -> str:
     """
     Generate a JWT using RS256 algorithm and a provided RSA private key.
     The payload matches the expected structure required by the token exchange API.
     """
-    with open(private_key_path, "rb") as key_file:
-        private_key = key_file.read()
+    private_key = load_private_key(private_key_path)
 
     now = datetime.datetime.now(datetime.timezone.utc)
     exp = now + datetime.timedelta(hours=1)  # Token expires in 1 hour
@@ -32,17 +43,23 @@ def generate_jwt(private_key_path: str) -> str:
         "pesType": "eRx"
     }
 
+    import jwt
     return jwt.encode(payload, private_key, algorithm="RS256")
 
-import time
-
-def get_access_token(retries: int = 3, delay: int = 5):
+async def request_token(client: httpx.AsyncClient | None = None) -> dict:
     """
-    Request an access token from the Medication Knowledge API
-    with retry logic in case of temporary server issues.
+    Request an access token from the Medication Knowledge API.
+    Returns the full token response (access_token, expires_in, ...).
+    Retries on 520s and connection errors are handled by the client's
+    transport (see app/services/resilience.py). Pass a pooled `client` to
+    reuse connections; otherwise a one-off client is used.
     """
-    url = "https://auth-int.medicationknowledge.com.au/connect/token"
-    subject_token = generate_jwt("converted_private_key.pem")
+    if client is None:
+        async with make_client("token") as own_client:
+            return await request_token(own_client)
+
+    url = TOKEN_URL
+    subject_token = generate_jwt(PRIVATE_KEY_PATH)
 
     headers = {
         "Content-Type": "application/x-www-form-urlencoded",
@@ -61,26 +78,23 @@ def get_access_token(retries: int = 3, delay: int = 5):
 
     data_encoded = urllib.parse.urlencode(data)
 
-    for attempt in range(1, retries + 1):
-        try:
-            response = requests.post(url, headers=headers, data=data_encoded, verify=True)
-            if response.status_code == 200:
-                return response.json().get("access_token")
-            elif response.status_code == 520:
-                print(f"⚠️  520 Web server error on attempt {attempt}. Retrying in {delay} seconds...")
-                time.sleep(delay)
-            else:
-                raise Exception(f"Token request failed: {response.status_code} - {response.text}")
-        except requests.exceptions.RequestException as e:
-            print(f"⚠️  Request error: {e}. Retrying in {delay} seconds...")
-            time.sleep(delay)
+    response = await client.post(url, headers=headers, content=data_encoded)
+    if response.status_code != 200:
+        raise Exception(f"Token request failed: {response.status_code} - {response.text}")
+    return response.json()
+
 
-    raise Exception("❌ Failed to obtain token after multiple attempts.")
+async def get_access_token(client: httpx.AsyncClient | None = None):
+    """
+    Request a fresh access token string. Prefer TokenService, which caches
+    the token until shortly before it expires.
+    """
+    return (await request_token(client)).get("access_token")
 
 
 if __name__ == "__main__":
     try:
-        token = get_access_token()
+        token = asyncio.run(get_access_token())
         print("✅ Access Token:", token)
     except Exception as e:
         print("❌ Error:", e)
@@ -1,17 +1,45 @@
-from dotenv import load_dotenv
-load_dotenv()    # must be first, so services pick up os.environ
-
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from app import metrics, profiling
+from app.settings import settings
+from app.warmup import warmup
+from app.services.http_clients import http_clients
+from app.services.token_service import token_service
+from app.services import cache, hedging, resilience
+from app.services.bundle_cache import bundle_cache
+from app.services.pbs_rollover import rollover_warmer
+from app.services.prefetch import prefetcher
 from app.routers.prescription          import router as prescription_router
 from app.routers.pbs_pricing_router   import router as pbs_pricing_router
 from app.routers.wsd_pricing_router   import router as wsd_pricing_router
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled keep-alive client per upstream for the life of the process
+    await http_clients.start()
+    # Token, PBS schedule, pricebook and connection pools, concurrently and
+    # time-limited, before the instance takes traffic
+    if settings.warmup_enabled:
+        await warmup.run(settings.warmup_timeout)
+    # Loads next month's PBS schedule and busiest items before the 1st
+    rollover_warmer.start()
+    yield
+    await rollover_warmer.aclose()
+    await prefetcher.aclose()
+    await warmup.aclose()
+    await http_clients.aclose()
+
 app = FastAPI(
     title="Medication + Pricing API",
+    lifespan=lifespan,
     docs_url="/",
     redoc_url=None,
     openapi_url="/openapi.json",
     )
+app.add_middleware(resilience.BudgetMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
 app.include_router(prescription_router)
 app.include_router(pbs_pricing_router)
 app.include_router(wsd_pricing_router)
@@ -20,33 +48,88 @@ app.include_router(wsd_pricing_router)
 
 
 @app.get("/_debug/token")
-def debug_token():
-    tok = token_service.get_token()
-    return {"token_sample": tok[:30] + "...", "type": type(tok).__name__}
+async def debug_token():
+    tok = await token_service.get_token()
+    return {
+        "token_sample": tok[:30] + "...",
+        "type": type(tok).__name__,
+        "cache": token_service.stats(),
+    }
+
+@app.get("/_debug/cache")
+async def debug_cache():
+    """Per-cache size, hit/miss/stale/negative counters and hit ratio."""
+    return {"token": token_service.stats(), "bundle": bundle_cache.stats(), **cache.all_stats(),
+            "prefetch": prefetcher.stats(), "pbs_rollover": rollover_warmer.stats()}
 
-@app.get("/_debug/bundle/{scid}")
-def debug_bundle(scid: str):
+@app.get("/_debug/upstreams")
+async def debug_upstreams():
+    """Circuit breaker state per upstream (closed / open / half_open), and hedging stats."""
+    return {**resilience.breaker_stats(), "hedging": hedging.hedge_stats()}
+
+@app.get("/_debug/slow")
+async def debug_slow(
+    limit: int = Query(20, ge=1, le=1000),
+    x_profile_token: str | None = Header(None),
+):
     """
-    Returns raw HTTP response (status, headers, body) for the FHIR bundle request.
+    Requests slower than SLOW_REQUEST_THRESHOLD, newest first, with their span
+    breakdown. Needs X-Profile-Token: PROFILE_ADMIN_TOKEN.
     """
-    token = token_service.get_token()
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Ocp-Apim-Subscription-Key": settings.ocp_apim_subscription_key
-    }
-    params = {"identifier": f"http://fhir.erx.com.au/NamingSystem/identifiers#scid|{scid}"}
-    resp = requests.get(
-        f"{settings.fhir_api_base}/MedicationRequest",
-        headers=headers,
-        params=params,
-        timeout=10
-    )
-    return {
-        "status_code": resp.status_code,
-        "headers": dict(resp.headers),
-        "body": resp.text
-    }
+    if not profiling.is_admin(x_profile_token):
+        raise HTTPException(status_code=403, detail="Profiling admin token required")
+    profiler = profiling.request_profiler
+    return {**profiler.stats(), "requests": profiler.slowest(limit)}
+
+@app.get("/_debug/profile/{trace_id}")
+async def debug_profile(
+    trace_id: str,
+    format: str = Query("json", pattern="^(json|html)$"),
+    x_profile_token: str | None = Header(None),
+):
+    """
+    Trace of a profiled or slow request (id from its X-Profile-Id header);
+    format=html returns the flamegraph of an `X-Profile: flame` request.
+    Needs X-Profile-Token: PROFILE_ADMIN_TOKEN.
+    """
+    if not profiling.is_admin(x_profile_token):
+        raise HTTPException(status_code=403, detail="Profiling admin token required")
+    trace = profiling.request_profiler.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"No trace {trace_id} (expired or never recorded)")
+    if format == "html":
+        if trace.flame is None:
+            raise HTTPException(status_code=404, detail=f"No flamegraph recorded for {trace_id}")
+        return HTMLResponse(trace.flame.output_html())
+    return trace.to_dict()
+
+@app.post("/_debug/profiling")
+async def debug_profiling(
+    mode: str = Query(..., pattern="^(off|spans|flame)$"),
+    x_profile_token: str | None = Header(None),
+):
+    """
+    Admin flag: profile every request (spans / flame), or only those sent with
+    X-Profile (off). Needs X-Profile-Token: PROFILE_ADMIN_TOKEN.
+    """
+    if not profiling.is_admin(x_profile_token):
+        raise HTTPException(status_code=403, detail="Profiling admin token required")
+    profiling.request_profiler.mode = None if mode == "off" else mode
+    return profiling.request_profiler.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus exposition: route/upstream latency, errors, caches, threadpool."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
 @app.get("/health")
-def healthcheck():
+async def healthcheck():
+    """Liveness: the process is up. See /ready for readiness."""
     return {"status": "ok"}
+
+@app.get("/ready")
+async def readiness():
+    """Readiness: 200 once the required warm-up components succeeded, else 503."""
+    report = warmup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
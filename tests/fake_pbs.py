@@ -0,0 +1,59 @@
+# tests/fake_pbs.py
+"""
+In-process stand-in for the PBS data API: installed as http_clients.pbs,
+it serves /schedules, /items (single and comma-separated pbs_code filters,
+paged) and /item-dispensing-rule-relationships, and records every call.
+"""
+import httpx
+
+from app.services import pbs_pricing
+from app.services.http_clients import http_clients
+
+
+class FakePbs:
+    def __init__(self):
+        self.schedules: list[dict] = []
+        self.items: dict[str, dict[str, dict]] = {}   # schedule_code -> pbs_code -> item
+        self.rules: dict[str, list[dict]] = {}        # li_item_id -> records
+        self.calls: list[tuple[str, dict]] = []
+
+    def add_schedule(self, schedule_code: str, month: str, year: int) -> None:
+        self.schedules.append({"schedule_code": schedule_code, "effective_month": month, "effective_year": year})
+
+    def add_item(self, schedule_code: str, pbs_code: str, price: float, dpmq: float | None = None) -> None:
+        li_item_id = f"{schedule_code}-{pbs_code}"
+        self.items.setdefault(schedule_code, {})[pbs_code] = {
+            "pbs_code": pbs_code, "li_item_id": li_item_id, "determined_price": str(price),
+        }
+        record = {"li_item_id": li_item_id, "dispensing_rule_mnem": "S90-CP", "brand_premium": "0.50"}
+        if dpmq is not None:
+            record["cmnwlth_dsp_price_max_qty"] = str(dpmq)
+        self.rules[li_item_id] = [record]
+
+    def params_of(self, path: str) -> list[dict]:
+        """Params of each recorded call to `path`."""
+        return [params for p, params in self.calls if p == path]
+
+    def install(self, monkeypatch) -> "FakePbs":
+        """Route http_clients.pbs here and start from empty PBS caches."""
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+        monkeypatch.setitem(http_clients._clients, "pbs", client)
+        monkeypatch.setattr(pbs_pricing, "PBS_SNAPSHOT_PATH", None)
+        for cache in (pbs_pricing.schedule_cache, pbs_pricing.item_cache, pbs_pricing.rules_cache):
+            cache.invalidate()
+        return self
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.rsplit("/", 1)[-1]
+        params = dict(request.url.params)
+        self.calls.append((path, params))
+        if path == "schedules":
+            return httpx.Response(200, json={"data": self.schedules})
+        if path == "items":
+            by_code = self.items.get(params["schedule_code"], {})
+            data = [by_code[c] for c in params["pbs_code"].split(",") if c in by_code]
+            limit, page = int(params.get("limit", 1)), int(params.get("page", 1))
+            return httpx.Response(200, json={"data": [dict(d) for d in data[(page - 1) * limit:page * limit]]})
+        if path == "item-dispensing-rule-relationships":
+            return httpx.Response(200, json={"data": self.rules.get(params["li_item_id"], [])})
+        return httpx.Response(404)
@@ -0,0 +1,76 @@
+# tests/legacy_summary.py
+"""
+PrescriptionService.summarize as it was before bundle_summary: the reference
+the single-pass summarizer is checked against (test_bundle_summary) and timed
+against (benchmarks/bench_summarize).
+"""
+import re
+
+
+def legacy_summarize(bundle: dict) -> dict:
+    """PrescriptionService.summarize as it was before bundle_summary (minus the fetch)."""
+    def extract_coding(code_block, system):
+        for c in code_block.get("coding", []):
+            if c.get("system") == system:
+                return c.get("code")
+        return "N/A"
+
+    entries = bundle.get("entry", [])
+    mr = entries[0]["resource"]
+    patient = next((c for c in mr.get("contained", []) if c.get("resourceType") == "Patient"), {})
+    pid_map = {sid.get("system"): sid.get("value") for sid in patient.get("identifier", [])}
+    full_name = patient.get("name", [{}])[0].get("text") or \
+                " ".join(patient.get("name", [{}])[0].get("given", []) + [patient.get("name", [{}])[0].get("family", "")])
+    dob = patient.get("birthDate", "N/A")
+    med = next((c for c in mr.get("contained", []) if c.get("resourceType") == "Medication"), {})
+    dispense = mr.get("dispenseRequest", {})
+    med_no = pid_map.get("http://ns.electronichealth.net.au/id/medicare-number", "N/A")
+    irn = pid_map.get("http://fhir.erx.com.au/NamingSystem/identifiers#authority-script-number", "N/A")
+    pension = pid_map.get("http://ns.electronichealth.net.au/id/pensioner-concession-card", "N/A")
+    seniors = pid_map.get("http://ns.electronichealth.net.au/id/commonwealth-seniors-health-card", "N/A")
+    reps_allowed = dispense.get("numberOfRepeatsAllowed")
+    disp_count = dispense.get("repeatsDispensed")
+    reps_remain = reps_allowed - disp_count if reps_allowed is not None and disp_count is not None else None
+    prescribed_qty = dispense.get("quantity", {}).get("value")
+    max_qty_auth = dispense.get("quantity", {}).get("value")
+    package_qty = dispense.get("expectedSupplyDuration", {}).get("value")
+    med_ext = {ext.get("url").split("/")[-1]: ext.get("valueString") or ext.get("valueBoolean")
+               for ext in mr.get("extension", [])}
+    med_strength = med.get("extension", [{}])[0].get("valueString")
+    med_form = med.get("form", {}).get("text")
+    return {
+        "medicare_no": med_no,
+        "irn": irn,
+        "ihi": pid_map.get("http://ns.electronichealth.net.au/id/hi/ihi/1.0", "N/A"),
+        "racf": pid_map.get("http://ns.electronichealth.net.au/id/racf-id", "N/A"),
+        "pension_card": pension,
+        "seniors_card": seniors,
+        "pensioner_elig": False,
+        "seniors_elig": False,
+        "name": full_name,
+        "dob": dob,
+        "allergies": [],
+        "prescriber_notes": "; ".join(n.get("text", "") for n in mr.get("note", [])),
+        "aip_drug_name": med_ext.get("aip-complient-drug-name", "N/A"),
+        "brand_name": med_ext.get("medication-brand-name", "N/A"),
+        "generic_name": med_ext.get("medication-generic-name", "N/A"),
+        "item_generic_intension": med_ext.get("item-generic-intension", "N/A"),
+        "schedule_number": med_ext.get("schedule-number", "N/A"),
+        "private_prescription": str(med_ext.get("private-prescription", "N/A")),
+        "repeats_allowed": reps_allowed,
+        "repeats_dispensed": disp_count,
+        "repeats_remaining": reps_remain,
+        "snomed": extract_coding(med.get("code", {}), "http://snomed.info/sct"),
+        "gtin": extract_coding(med.get("code", {}), "http://www.gs1.org/gtin"),
+        "med_text": med.get("code", {}).get("text", "N/A"),
+        "pbs_code": next(
+            (c.get("code") for c in med.get("code", {}).get("coding", [])
+             if re.match(r"^[0-9]{1,5}[A-Z]$", c.get("code", ""))),
+            "N/A"
+        ),
+        "prescribed_qty": prescribed_qty,
+        "max_qty_auth": max_qty_auth,
+        "package_qty": package_qty,
+        "med_strength": med_strength,
+        "med_form": med_form,
+    }
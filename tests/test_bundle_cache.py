@@ -0,0 +1,54 @@
+# tests/test_bundle_cache.py
+"""
+BundleCache freshness and invalidation: upstream max-age never extends the
+configured TTL, and a fetch that was in flight when its SCID was invalidated
+(by this worker or another sharing the backend) does not store its result.
+"""
+import asyncio
+
+import pytest
+
+from app.services.bundle_cache import BundleCache, UpstreamBundle
+from app.services.cache_backend import MemoryBackend, SQLiteBackend
+
+
+def test_max_age_cannot_extend_ttl():
+    cache = BundleCache(ttl=15.0, backend=MemoryBackend("bundle"))
+    assert cache._ttl_for("max-age=86400") == 15.0
+    assert cache._ttl_for("public, max-age=5") == 5.0
+    assert cache._ttl_for("no-cache") == 0.0
+    assert cache._ttl_for("no-store") is None
+    assert cache._ttl_for(None) == 15.0
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_invalidation_during_fetch_is_not_stored(tmp_path, shared):
+    def backend():
+        if shared:
+            return SQLiteBackend("bundle", str(tmp_path / "cache.sqlite3"))
+        return MemoryBackend("bundle")
+    worker = BundleCache(ttl=60.0, backend=backend())
+    # With a shared backend the invalidation comes from another worker
+    other = BundleCache(ttl=60.0, backend=backend()) if shared else worker
+    calls = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def fetch(scid, etag):
+            calls.append(scid)
+            await release.wait()
+            return UpstreamBundle(200, {"entry": [len(calls)]}, 10, None, None)
+
+        first = asyncio.ensure_future(worker.get("S1", fetch))
+        while not calls:   # until the fetch is under way
+            await asyncio.sleep(0)
+        other.invalidate("S1")
+        release.set()
+        await first
+        assert worker._backend.get("S1") is None   # the stale fetch stored nothing
+        return await worker.get("S1", fetch)   # so this fetches again
+
+    assert asyncio.run(run()) == {"entry": [2]}
+    assert len(calls) == 2
+    assert not hasattr(worker, "_versions")
@@ -0,0 +1,64 @@
+# tests/test_bundle_summary.py
+"""
+The single-pass summarizer (bundle_summary) must give exactly what the
+original PrescriptionService.summarize gave: same keys, same order, same
+values, over the fixture corpus and over bundles with parts missing.
+
+Set BUNDLE_CORPUS to a JSON Lines file of recorded bundles to check those too.
+"""
+import copy
+import os
+import random
+from pathlib import Path
+
+
+from app.services.bundle_summary import summarize_bundle
+from benchmarks.fhir_fixtures import load_corpus, synthetic_corpus
+from tests.legacy_summary import legacy_summarize
+
+
+def _corpus() -> list[tuple[str, dict]]:
+    corpus = synthetic_corpus(300)
+    if os.getenv("BUNDLE_CORPUS"):
+        corpus += load_corpus(Path(os.environ["BUNDLE_CORPUS"]))
+    return corpus
+
+
+def _stripped(bundle: dict, rnd: random.Random) -> dict:
+    """`bundle` with a few optional parts of its MedicationRequest removed."""
+    bundle = copy.deepcopy(bundle)
+    mr = bundle["entry"][0]["resource"]
+    for part in rnd.sample(["note", "extension", "dispenseRequest"], rnd.randrange(1, 3)):
+        mr.pop(part, None)
+    for res in mr.get("contained", []):
+        if res.get("resourceType") == "Medication" and rnd.random() < 0.5:
+            res.pop("form", None)
+            res["code"] = {"coding": [c for c in res.get("code", {}).get("coding", [])
+                                      if c.get("system") != "http://www.gs1.org/gtin"]}
+        if res.get("resourceType") == "Patient" and rnd.random() < 0.5:
+            res.pop("birthDate", None)
+            res["identifier"] = res.get("identifier", [])[:2]
+    return bundle
+
+
+def _outcome(fn, bundle):
+    try:
+        return list(fn(bundle).items())
+    except Exception as e:
+        return type(e)
+
+
+def test_matches_legacy():
+    mismatched = [scid for scid, bundle in _corpus()
+                  if list(summarize_bundle(bundle).items()) != list(legacy_summarize(bundle).items())]
+    assert not mismatched
+
+
+def test_matches_legacy_with_parts_missing():
+    rnd = random.Random(11)
+    mismatched = []
+    for scid, bundle in synthetic_corpus(200, seed=3):
+        variant = _stripped(bundle, rnd)
+        if _outcome(summarize_bundle, variant) != _outcome(legacy_summarize, variant):
+            mismatched.append(scid)
+    assert not mismatched
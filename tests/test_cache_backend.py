@@ -0,0 +1,90 @@
+# tests/test_cache_backend.py
+"""
+The shared SQLite cache holds bundles and the access token: it only opens a
+file the service user owns, in a directory nobody else can write to, and
+stores data (JSON), never pickles.
+"""
+import asyncio
+import os
+
+import pytest
+
+from app.settings import settings
+from app.services.cache import TTLCache
+from app.services.cache_backend import CacheBackend, MemoryBackend, SQLiteBackend, _open, make_backend
+
+
+def test_roundtrip_is_data_only(tmp_path):
+    backend = SQLiteBackend("test", str(tmp_path / "cache.sqlite3"))
+    backend.set("k", ("token", 1.5, {"a": [1, None]}), expires_at=2e9)
+    assert backend.get("k") == ["token", 1.5, {"a": [1, None]}]
+    raw = backend._execute("SELECT value FROM cache_v2 WHERE key = 'k'", ())[0][0]
+    assert raw == b'["token",1.5,{"a":[1,null]}]'
+
+
+def test_unencodable_value_not_stored(tmp_path):
+    backend = SQLiteBackend("test", str(tmp_path / "cache.sqlite3"))
+    backend.set("k", object(), expires_at=2e9)
+    assert backend.get("k") is None
+    assert backend.errors == 1
+
+
+def test_negative_entries_survive_the_codec(tmp_path):
+    cache = TTLCache("test-negative", backend=SQLiteBackend("test", str(tmp_path / "cache.sqlite3")))
+
+    async def missing():
+        raise LookupError("PBS item 1234X not found")
+
+    async def lookup():
+        return await cache.get_or_load("1234X", missing)
+    for _ in range(2):
+        with pytest.raises(LookupError, match="1234X not found"):
+            asyncio.run(lookup())
+    assert cache.negative_hits == 1
+
+
+def test_refuses_shared_directory(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o1777)
+    with pytest.raises(PermissionError):
+        _open(str(shared / "cache.sqlite3"))
+
+
+def test_creates_private_directory(tmp_path):
+    path = tmp_path / "escript" / "cache.sqlite3"
+    _open(str(path)).close()
+    assert path.parent.stat().st_mode & 0o777 == 0o700
+    assert path.stat().st_mode & 0o777 == 0o600
+
+
+@pytest.mark.skipif(os.getuid() != 0, reason="needs root to chown")
+def test_refuses_file_owned_by_another_user(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    path.touch(mode=0o600)
+    os.chown(path, 65534, 65534)
+    with pytest.raises(PermissionError):
+        _open(str(path))
+
+
+def test_refused_sqlite_falls_back_to_memory(tmp_path, monkeypatch, caplog):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o1777)
+    monkeypatch.setattr(settings, "cache_backend", "sqlite")
+    monkeypatch.setattr(settings, "cache_path", str(shared / "cache.sqlite3"))
+    backend = make_backend("test")
+    assert isinstance(backend, MemoryBackend)
+    assert "Cannot use" in caplog.text and "stays per-process" in caplog.text
+    assert "Unknown CACHE_BACKEND" not in caplog.text
+
+
+def test_incomplete_backend_fails_when_created():
+    class NoStats(CacheBackend):
+        def get(self, key): ...
+        def set(self, key, value, expires_at, size=0): ...
+        def add(self, key, value, expires_at): ...
+        def delete(self, key): ...
+        def clear(self): ...
+    with pytest.raises(TypeError):
+        NoStats("test")
@@ -0,0 +1,102 @@
+# tests/test_hedging.py
+"""
+Hedging waits for history: nothing is hedged before `min_samples`
+latencies. After that a slow first attempt gets a second one, whichever
+answers first wins and the other is cancelled, and hedges never exceed the
+budget.
+"""
+import asyncio
+import time
+
+import httpx
+
+from app.services.hedging import HedgedTransport, Hedger
+
+
+class Upstream(httpx.AsyncBaseTransport):
+    """Attempt n sleeps delays(n) and answers with its number; records cancellations."""
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.attempts = 0
+        self.cancelled: list[int] = []
+
+    async def handle_async_request(self, request):
+        n = self.attempts
+        self.attempts += 1
+        try:
+            await asyncio.sleep(self.delays(n))
+        except asyncio.CancelledError:
+            self.cancelled.append(n)
+            raise
+        return httpx.Response(200, headers={"x-attempt": str(n)}, request=request)
+
+
+def _transport(upstream, budget=0.5, min_samples=5):
+    transport = HedgedTransport("test", upstream)
+    transport.hedger = Hedger("test", percentile=0.5, budget=budget, window=100,
+                              min_samples=min_samples, min_delay=0.01)
+    return transport
+
+
+def _get(transport, n=1, method="GET"):
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            rs = await asyncio.gather(*(client.request(method, "https://fhir.test/Bundle") for _ in range(n)))
+        return [int(r.headers["x-attempt"]) for r in rs]
+    return asyncio.run(run())
+
+
+def test_no_hedge_before_min_samples():
+    upstream = Upstream(lambda n: 0.05)
+    transport = _transport(upstream)
+    for _ in range(4):
+        _get(transport)
+    assert transport.hedger.delay() is None
+    assert transport.hedger.fired == 0 and upstream.attempts == 4
+    _get(transport)
+    assert transport.hedger.delay() is not None
+
+
+def test_slow_first_attempt_loses_to_hedge():
+    upstream = Upstream(lambda n: 0.01 if n < 5 or n == 6 else 1.0)
+    transport = _transport(upstream)
+    for _ in range(5):
+        _get(transport)
+    start = time.monotonic()
+    assert _get(transport) == [6]   # attempt 5 stalled; its hedge, attempt 6, answered
+    assert time.monotonic() - start < 0.5
+    assert upstream.cancelled == [5]
+    assert (transport.hedger.fired, transport.hedger.won) == (1, 1)
+
+
+def test_first_attempt_still_wins_if_it_answers_first():
+    upstream = Upstream(lambda n: 0.01 if n < 5 else 0.08 if n == 5 else 1.0)
+    transport = _transport(upstream)
+    for _ in range(5):
+        _get(transport)
+    assert _get(transport) == [5]
+    assert upstream.cancelled == [6]
+    assert (transport.hedger.fired, transport.hedger.won) == (1, 0)
+
+
+def test_hedges_never_exceed_budget():
+    upstream = Upstream(lambda n: 0.01 if n < 5 else 0.1)
+    transport = _transport(upstream, budget=0.1)
+    for _ in range(5):
+        _get(transport)
+    _get(transport, n=30)
+    h = transport.hedger
+    assert h.requests == 35
+    assert 0 < h.fired <= h.requests * 0.1
+    assert h.over_budget == 30 - h.fired
+    assert upstream.attempts == 35 + h.fired
+
+
+def test_post_is_never_hedged():
+    upstream = Upstream(lambda n: 0.01 if n < 5 else 0.2)
+    transport = _transport(upstream)
+    for _ in range(5):
+        _get(transport)
+    _get(transport, method="POST")
+    assert transport.hedger.fired == 0 and upstream.attempts == 6
@@ -0,0 +1,71 @@
+# tests/test_pbs_pricing.py
+"""
+Batch PBS pricing makes upstream calls per distinct item, not per line:
+codes are fetched ITEMS_PER_CALL at a time, duplicates once, rules once per
+li_item_id, and every line is priced as calc_pbs_price would price it.
+"""
+import asyncio
+import math
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import pbs_pricing
+from tests.fake_pbs import FakePbs
+
+SCHED = "3900"
+
+
+@pytest.fixture
+def pbs(monkeypatch):
+    fake = FakePbs().install(monkeypatch)
+    for i in range(25):
+        fake.add_item(SCHED, f"{1000 + i}X", price=5.0 + i, dpmq=40.0 if i % 5 == 0 else None)
+    return fake
+
+
+def _line(code, qty=1, auth=False, conc=False, sched=SCHED):
+    return SimpleNamespace(pbs_code=code, qty=qty, auth=auth, conc=conc, sched=sched)
+
+
+@pytest.mark.parametrize("n", [1, 3, 7, 25])
+def test_items_fetched_per_call_limit(pbs, monkeypatch, n):
+    monkeypatch.setattr(pbs_pricing, "PBS_ITEMS_PER_CALL", 3)
+    lines = [_line(f"{1000 + i}X") for i in range(n)]
+    results = asyncio.run(pbs_pricing.calc_pbs_prices(lines))
+    assert all("result" in r for r in results)
+    assert len(pbs.params_of("items")) == math.ceil(n / 3)
+    assert len(pbs.params_of("item-dispensing-rule-relationships")) == n
+
+
+def test_duplicate_lines_fetched_once(pbs):
+    lines = [_line("1000X", qty=q, auth=a) for q in (1, 2) for a in (False, True)] * 5
+    results = asyncio.run(pbs_pricing.calc_pbs_prices(lines))
+    assert len(results) == len(lines)
+    assert [p["pbs_code"] for p in pbs.params_of("items")] == ["1000X"]
+    assert len(pbs.params_of("item-dispensing-rule-relationships")) == 1
+
+
+def test_batch_matches_single_prices(pbs):
+    lines = [_line(f"{1000 + i}X", qty=q, auth=a, conc=c)
+             for i in (0, 1, 7) for q in (1, 3) for a in (False, True) for c in (False, True)]
+
+    async def run():
+        batch = await pbs_pricing.calc_pbs_prices(lines)
+        single = [await pbs_pricing.calc_pbs_price(l.pbs_code, l.sched, l.qty, l.auth, l.conc) for l in lines]
+        return batch, single
+    batch, single = asyncio.run(run())
+    assert [b["result"] for b in batch] == single
+
+
+def test_missing_code_fails_only_its_line(pbs):
+    good, missing = asyncio.run(pbs_pricing.calc_pbs_prices([_line("1000X"), _line("9999Z")]))
+    assert "result" in good
+    assert missing["error"]["status_code"] == 404
+
+
+def test_schedule_resolved_once(pbs):
+    pbs.add_schedule(SCHED, *pbs_pricing.schedule_month(0))
+    results = asyncio.run(pbs_pricing.calc_pbs_prices([_line(f"{1000 + i}X", sched=None) for i in range(10)]))
+    assert {r["result"]["schedule"] for r in results} == {SCHED}
+    assert len(pbs.params_of("schedules")) == 1
@@ -0,0 +1,71 @@
+# tests/test_pbs_rollover.py
+"""
+Month rollover: until this month's schedule is published pricing uses last
+month's, and ahead of the boundary next month's schedule and the busiest
+codes' items and rules are loaded, so the first requests under it are warm.
+"""
+import asyncio
+import datetime
+
+import pytest
+
+from app.services import pbs_pricing
+from app.services.pbs_pricing import CodeCounter
+from app.services.pbs_rollover import IDLE, WAITING, WARMED, RolloverWarmer
+from tests.fake_pbs import FakePbs
+
+NOW = datetime.datetime(2026, 10, 31, 23, 0)   # an hour before the boundary
+CURRENT, NEXT = "3900", "4000"
+
+
+@pytest.fixture
+def pbs(monkeypatch):
+    fake = FakePbs().install(monkeypatch)
+    for code, price in (("1000X", 10.0), ("2000Y", 20.0), ("3000Z", 30.0)):
+        fake.add_item(CURRENT, code, price)
+        fake.add_item(NEXT, code, price + 1)
+    counter = CodeCounter(100)
+    counter.note(["1000X"] * 3 + ["2000Y"] * 2 + ["3000Z"])
+    monkeypatch.setattr(pbs_pricing, "requested_codes", counter)
+    return fake
+
+
+def _warmer():
+    return RolloverWarmer(lead=6 * 3600, interval=60, top_n=2, concurrency=2)
+
+
+def test_unpublished_month_falls_back_to_previous(pbs, caplog):
+    pbs.add_schedule("3800", *pbs_pricing.schedule_month(1))
+    assert asyncio.run(pbs_pricing.current_schedule()) == "3800"
+    assert "pricing against last month's schedule 3800" in caplog.text
+    pbs.add_schedule("3900", *pbs_pricing.schedule_month(0))
+    pbs_pricing.schedule_cache.invalidate()   # the not-found is negative-cached
+    assert asyncio.run(pbs_pricing.current_schedule()) == "3900"
+
+
+def test_busiest_codes_warmed_before_the_boundary(pbs):
+    pbs.add_schedule(NEXT, *pbs_pricing.next_schedule_month(NOW))
+    warmer = _warmer()
+    assert asyncio.run(warmer.run_once(NOW)) == WARMED
+    assert (warmer.schedule, warmer.codes, warmer.items, warmer.rules) == (NEXT, 2, 2, 2)
+    warmed = len(pbs.calls)
+
+    async def price(code):
+        return await pbs_pricing.calc_pbs_price(code, schedule_code=NEXT)
+    assert asyncio.run(price("1000X"))["schedule"] == NEXT
+    asyncio.run(price("2000Y"))
+    assert len(pbs.calls) == warmed   # both served from the warmed caches
+    asyncio.run(price("3000Z"))
+    assert len(pbs.calls) > warmed    # outside the top 2
+
+
+def test_waits_for_next_schedule(pbs):
+    warmer = _warmer()
+    assert asyncio.run(warmer.run_once(NOW)) == WAITING
+    assert not pbs.params_of("items")
+
+
+def test_idle_outside_lead_window(pbs):
+    warmer = _warmer()
+    assert asyncio.run(warmer.run_once(NOW - datetime.timedelta(days=2))) == IDLE
+    assert not pbs.calls
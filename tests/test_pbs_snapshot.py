@@ -0,0 +1,84 @@
+# tests/test_pbs_snapshot.py
+"""
+Replacing the snapshot file closes the previous snapshot's connections, and
+pricing reads the snapshot from the threadpool, never on the event loop.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import pbs_pricing, pbs_snapshot
+from app.services.pbs_ingest import ingest
+
+
+class FakePager:
+    requests = 0
+
+    def __init__(self, price: str):
+        self.price = price
+
+    def pages(self, path, params):
+        if path == "/items":
+            yield [{"pbs_code": "1234X", "li_item_id": "LI1", "determined_price": self.price}]
+        else:
+            yield [{"li_item_id": "LI1", "dispensing_rule_mnem": "s90-cp", "brand_premium": "1.00"}]
+
+
+def _write(path, price: str, mtime: float):
+    ingest("3900", path, FakePager(price))
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, monkeypatch):
+    path = tmp_path / "pbs_snapshot.sqlite"
+    _write(path, "10.00", 1_000_000)
+    monkeypatch.setattr(pbs_snapshot, "CHECK_INTERVAL", 0)
+    monkeypatch.setattr(pbs_snapshot, "_current", None)
+    monkeypatch.setattr(pbs_pricing, "PBS_SNAPSHOT_PATH", str(path))
+    return path
+
+
+def test_replaced_snapshot_is_closed(snapshot_path):
+    old = pbs_snapshot.current(str(snapshot_path))
+    conn = old._conn()
+    _write(snapshot_path, "20.00", 2_000_000)
+    new = pbs_snapshot.current(str(snapshot_path))
+    assert new is not old
+    assert new.fetch_item("1234X", "3900")["determined_price"] == "20.00"
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+
+def test_lookup_running_during_swap_finishes(snapshot_path):
+    old = pbs_snapshot.current(str(snapshot_path))
+    with old._reading() as conn:
+        _write(snapshot_path, "20.00", 2_000_000)
+        pbs_snapshot.current(str(snapshot_path))
+        assert conn.execute("SELECT count(*) FROM items").fetchone() == (1,)
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+
+def test_pricing_reads_snapshot_off_the_event_loop(snapshot_path, monkeypatch):
+    threads = []
+    fetch_item = pbs_snapshot.PbsSnapshot.fetch_item
+
+    def recording(self, *args):
+        threads.append(threading.get_ident())
+        return fetch_item(self, *args)
+    monkeypatch.setattr(pbs_snapshot.PbsSnapshot, "fetch_item", recording)
+
+    async def run():
+        line = SimpleNamespace(pbs_code="1234x", sched=None, qty=1, auth=False, conc=False)
+        single = await pbs_pricing.calc_pbs_price("1234x")
+        (batch,) = await pbs_pricing.calc_pbs_prices([line])
+        return threading.get_ident(), single, batch
+    loop_thread, single, batch = asyncio.run(run())
+    assert single == batch["result"]
+    assert single["schedule"] == "3900"
+    assert threads and loop_thread not in threads
@@ -0,0 +1,103 @@
+# tests/test_prefetch.py
+"""
+A prefetched PBS code is fetched once however often it is submitted, and
+the pricing lookup that follows is served warm and counted as a prefetch
+hit, once. The prefetcher's limits drop work rather than queue it.
+"""
+import asyncio
+
+import pytest
+
+from app.services import pbs_pricing, prefetch
+from app.services.prefetch import Prefetcher
+from app.services.rate_governor import RateGovernor
+from tests.fake_pbs import FakePbs
+
+SCHED = "3900"
+
+
+@pytest.fixture
+def pbs(monkeypatch, tmp_path):
+    fake = FakePbs().install(monkeypatch)
+    fake.add_schedule(SCHED, *pbs_pricing.schedule_month(0))
+    for code in ("1000X", "2000Y", "3000Z"):
+        fake.add_item(SCHED, code, price=12.0)
+    monkeypatch.setattr(prefetch, "pbs_governor",
+                        RateGovernor("test", rate=1000, burst=10, reserve=0, path=str(tmp_path / "bucket")))
+    return fake
+
+
+def _prefetcher(rate=100.0, max_pending=32):
+    return Prefetcher(concurrency=2, max_pending=max_pending, rate=rate, dedupe_window=300, timeout=5)
+
+
+def _prefetch_hits() -> tuple[int, int]:
+    return pbs_pricing.item_cache.prefetch_hits, pbs_pricing.rules_cache.prefetch_hits
+
+
+def test_duplicate_submissions_fetch_once(pbs):
+    p = _prefetcher()
+
+    async def run():
+        accepted = [p.submit("1000X") for _ in range(5)]
+        await asyncio.gather(*p._tasks)
+        return accepted
+    assert asyncio.run(run()) == [True, False, False, False, False]
+    assert p.duplicates == 4 and p.completed == 1
+    assert len(pbs.params_of("items")) == 1
+    assert len(pbs.params_of("item-dispensing-rule-relationships")) == 1
+
+
+def test_pricing_after_prefetch_is_a_counted_hit(pbs):
+    p = _prefetcher()
+    before = _prefetch_hits()
+
+    async def run():
+        p.submit("1000X")
+        await asyncio.gather(*p._tasks)
+        calls = len(pbs.calls)
+        for _ in range(3):
+            await pbs_pricing.calc_pbs_price("1000X")
+        return calls
+    calls = asyncio.run(run())
+    assert len(pbs.calls) == calls   # served warm
+    after = _prefetch_hits()
+    assert (after[0] - before[0], after[1] - before[1]) == (1, 1)   # counted once, not per lookup
+
+
+def test_lookup_joining_inflight_prefetch_is_a_hit(pbs):
+    p = _prefetcher()
+    before = pbs_pricing.item_cache.prefetch_hits
+
+    async def run():
+        await pbs_pricing.current_schedule()
+        p.submit("2000Y")
+        await asyncio.sleep(0)   # let the prefetch start its item load
+        assert ("2000Y", SCHED) in pbs_pricing.item_cache._inflight
+        await pbs_pricing.calc_pbs_price("2000Y")
+        await asyncio.gather(*p._tasks)
+    asyncio.run(run())
+    assert pbs_pricing.item_cache.prefetch_hits - before == 1
+    assert len(pbs.params_of("items")) == 1
+
+
+def test_rate_limit_drops_instead_of_queueing(pbs):
+    p = _prefetcher(rate=1.0)
+
+    async def run():
+        accepted = [p.submit(code) for code in ("1000X", "2000Y", "3000Z")]
+        await asyncio.gather(*p._tasks)
+        return accepted
+    assert asyncio.run(run()) == [True, False, False]
+    assert p.throttled == 2
+
+
+def test_pending_limit_drops(pbs):
+    p = _prefetcher(max_pending=1)
+
+    async def run():
+        accepted = [p.submit(code) for code in ("1000X", "2000Y")]
+        await asyncio.gather(*p._tasks)
+        return accepted
+    assert asyncio.run(run()) == [True, False]
+    assert p.dropped == 1
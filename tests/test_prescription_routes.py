@@ -0,0 +1,83 @@
+# tests/test_prescription_routes.py
+"""
+A summary that fails the response model is a server error (500), never a
+404 "No data", and in a batch (streamed or not) it only fails its own entry.
+"""
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from app.dependencies import get_prescription_service
+from app.services.bundle_summary import summarize_bundle
+from benchmarks.fhir_fixtures import synthetic_corpus
+from main import app
+
+SUMMARY = summarize_bundle(synthetic_corpus(1)[0][1])
+
+
+class FakeService:
+    def __init__(self, summaries: dict):
+        self.summaries = summaries
+
+    async def summarize(self, scid):
+        if scid not in self.summaries:
+            raise ValueError(f"No data for SCID {scid}")
+        return self.summaries[scid]
+
+    async def summarize_many(self, scids):
+        return [entry async for _, entry in self.iter_summaries(scids)]
+
+    async def iter_summaries(self, scids):
+        for i, scid in enumerate(scids):
+            try:
+                yield i, {"scid": scid, "result": await self.summarize(scid)}
+            except ValueError as e:
+                yield i, {"scid": scid, "error": {"status_code": 404, "detail": str(e)}}
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_prescription_service] = lambda: FakeService({
+        "good":  SUMMARY,
+        "bad":   {**SUMMARY, "name": None},
+        "extra": {**SUMMARY, "new_field": "x"},
+    })
+    yield TestClient(app, raise_server_exceptions=False)
+    app.dependency_overrides.clear()
+
+
+def test_summary(client):
+    r = client.get("/prescription/good")
+    assert r.status_code == 200
+    assert r.json()["name"] == SUMMARY["name"]
+
+
+def test_missing_is_404(client):
+    assert client.get("/prescription/none").status_code == 404
+
+
+def test_invalid_summary_is_500_not_404(client):
+    assert client.get("/prescription/bad").status_code == 500
+
+
+def test_new_summary_field_passes_through(client):
+    assert client.get("/prescription/extra").json()["new_field"] == "x"
+
+
+def test_invalid_summary_fails_only_its_batch_entry(client):
+    r = client.post("/prescription/batch", json=["good", "bad", "none"])
+    assert r.status_code == 200
+    good, bad, missing = r.json()
+    assert good["result"]["name"] == SUMMARY["name"]
+    assert bad["error"]["status_code"] == 500
+    assert missing["error"]["status_code"] == 404
+
+
+def test_invalid_summary_fails_only_its_streamed_entry(client):
+    r = client.post("/prescription/batch?stream=ndjson", json=["good", "bad", "none"])
+    *entries, summary = [orjson.loads(line) for line in r.content.splitlines()]
+    good, bad, missing = sorted(entries, key=lambda e: e["index"])
+    assert good["result"]["name"] == SUMMARY["name"]
+    assert bad["error"]["status_code"] == 500
+    assert missing["error"]["status_code"] == 404
+    assert summary["summary"]["errors"] == {"500": 1, "404": 1}
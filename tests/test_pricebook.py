@@ -0,0 +1,38 @@
+# tests/test_pricebook.py
+"""
+GTIN lookups are exact-match on the ASCII digits in the pricebook: other
+Unicode digits are not found, never mis-read as a different GTIN or a crash.
+"""
+import pytest
+from fastapi import HTTPException
+
+from app.services.pricebook import PricebookIndex
+from app.services.wsd_pricing import WsdPriceService
+
+HEADER = "Code,Description,Supplier,EAN,Generic,Pack,Unit,RRP,Price GST Exc\n"
+
+
+@pytest.fixture
+def pricebook_csv(tmp_path):
+    path = tmp_path / "pricebook.csv"
+    path.write_text(HEADER
+                    + "1,Amoxil 500mg caps 20,X,123,amoxicillin,20,cap,10,5.50\n"
+                    + "2,Panadol 500mg tabs 20,X,0123,paracetamol,20,tab,4,2.00\n")
+    return path
+
+
+def test_exact_match(pricebook_csv):
+    index = PricebookIndex.load(pricebook_csv)
+    assert index.price("123") == 5.50
+    assert index.price("0123") == 2.00
+
+
+@pytest.mark.parametrize("gtin", ["١٢٣", "１２３", "12³", "²"])
+def test_non_ascii_digits_not_found(pricebook_csv, gtin):
+    assert PricebookIndex.load(pricebook_csv).price(gtin) is None
+
+
+def test_non_ascii_digits_are_404(pricebook_csv):
+    with pytest.raises(HTTPException) as e:
+        WsdPriceService(pricebook_csv).calc_price("²")
+    assert e.value.status_code == 404
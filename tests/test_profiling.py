@@ -0,0 +1,76 @@
+# tests/test_profiling.py
+"""
+Profiling is an admin switch: the X-Profile header, POST /_debug/profiling
+and reading traces need the admin token; traces keep the route template.
+"""
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from app import profiling
+from app.dependencies import get_prescription_service
+from app.settings import settings
+from main import app
+
+TOKEN = "s3cret"
+
+
+class FakeService:
+    async def summarize(self, scid):
+        raise ValueError(f"No data for SCID {scid}")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "profile_admin_token", TOKEN)
+    monkeypatch.setattr(profiling.request_profiler, "mode", None)
+    app.dependency_overrides[get_prescription_service] = lambda: FakeService()
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def test_header_needs_admin_token(client):
+    assert "x-profile-id" not in client.get("/health", headers={"X-Profile": "1"}).headers
+    assert "x-profile-id" not in client.get(
+        "/health", headers={"X-Profile": "1", "X-Profile-Token": "wrong"}).headers
+    r = client.get("/health", headers={"X-Profile": "1", "X-Profile-Token": TOKEN})
+    assert "x-profile-id" in r.headers
+
+
+def test_header_ignored_without_configured_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "profile_admin_token", None)
+    r = client.get("/health", headers={"X-Profile": "1", "X-Profile-Token": ""})
+    assert "x-profile-id" not in r.headers
+
+
+def test_admin_flag_needs_admin_token(client):
+    assert client.post("/_debug/profiling?mode=flame").status_code == 403
+    assert client.post("/_debug/profiling?mode=flame", headers={"X-Profile-Token": "x"}).status_code == 403
+    assert profiling.request_profiler.mode is None
+    r = client.post("/_debug/profiling?mode=spans", headers={"X-Profile-Token": TOKEN})
+    assert r.status_code == 200
+    assert profiling.request_profiler.mode == "spans"
+
+
+def test_trace_keeps_route_template_not_scid(client):
+    r = client.get("/prescription/21KR32KDBCY38MCDW7",
+                   headers={"X-Profile": "1", "X-Profile-Token": TOKEN})
+    trace = profiling.request_profiler.get(r.headers["x-profile-id"])
+    assert trace.route == "/prescription/{scid}"
+    assert b"21KR32KDBCY38MCDW7" not in orjson.dumps(trace.to_dict())
+
+
+@pytest.mark.parametrize("path", ["/_debug/slow", "/_debug/profile/1-1", "/_debug/profile/1-1?format=html"])
+def test_reading_traces_needs_admin_token(client, path):
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={"X-Profile-Token": "wrong"}).status_code == 403
+
+
+def test_reading_traces_with_admin_token(client):
+    r = client.get("/prescription/21KR32KDBCY38MCDW7",
+                   headers={"X-Profile": "1", "X-Profile-Token": TOKEN})
+    trace_id = r.headers["x-profile-id"]
+    assert client.get("/_debug/slow", headers={"X-Profile-Token": TOKEN}).status_code == 200
+    r = client.get(f"/_debug/profile/{trace_id}", headers={"X-Profile-Token": TOKEN})
+    assert r.status_code == 200
+    assert r.json()["route"] == "/prescription/{scid}"
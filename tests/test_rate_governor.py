@@ -0,0 +1,111 @@
+# tests/test_rate_governor.py
+"""
+Waiting on the rate governor is not an upstream failure: when no slot comes
+within the call's deadline the call fails with RateLimitExceeded, and the
+upstream's circuit breaker is left alone. A slow upstream still counts. The
+shared bucket file is never one another user could have planted.
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.services import resilience
+from app.services.rate_governor import GovernedTransport, RateGovernor, RateLimitExceeded, background
+from app.services.resilience import ResilientTransport, request_budget, send_by_deadline
+
+UPSTREAM = "test-governed"
+
+
+class Upstream(httpx.AsyncBaseTransport):
+    """Bottom of the stack: answers 200 after `delay`, timed out like the pooled transport."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def handle_async_request(self, request):
+        return await send_by_deadline(self._send, request)
+
+    async def _send(self, request):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return httpx.Response(200, request=request)
+
+
+@pytest.fixture
+def breaker():
+    resilience._breakers.pop(UPSTREAM, None)
+    yield resilience.breaker(UPSTREAM)
+    resilience._breakers.pop(UPSTREAM, None)
+
+
+@pytest.fixture
+def empty_governor(tmp_path):
+    # One call every 10 s, and the bucket already spent
+    governor = RateGovernor("test", rate=0.1, burst=1, reserve=0, path=str(tmp_path / "bucket"))
+    governor.penalize(10)
+    return governor
+
+
+def _get(governor, upstream, deadline, budget=None, priority=None):
+    transport = ResilientTransport(UPSTREAM, GovernedTransport(governor, upstream),
+                                   attempts=3, deadline=deadline)
+
+    async def run():
+        with request_budget(budget):
+            async with httpx.AsyncClient(transport=transport) as client:
+                if priority == "background":
+                    with background():
+                        return await client.get("https://pbs.test/api/items")
+                return await client.get("https://pbs.test/api/items")
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("priority", ["interactive", "background"])
+def test_governor_wait_never_records_failure(empty_governor, breaker, priority):
+    upstream = Upstream()
+    for _ in range(breaker.failure_threshold + 1):
+        start = time.monotonic()
+        with pytest.raises(RateLimitExceeded):
+            _get(empty_governor, upstream, deadline=0.3, priority=priority)
+        assert time.monotonic() - start < 0.3   # gave up without sleeping into the deadline
+    assert upstream.calls == 0
+    assert breaker.stats()["consecutive_failures"] == 0
+    assert breaker.state == breaker.CLOSED
+
+
+def test_governor_wait_bounded_by_call_deadline(empty_governor, breaker):
+    # The 30 s request budget does not let the governor wait past the 0.3 s call deadline
+    with pytest.raises(RateLimitExceeded):
+        _get(empty_governor, Upstream(), deadline=0.3, budget=30)
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_slow_upstream_records_failure(tmp_path, breaker):
+    governor = RateGovernor("test", rate=1000, burst=10, reserve=0, path=str(tmp_path / "bucket"))
+    upstream = Upstream(delay=1.0)
+    with pytest.raises(httpx.TimeoutException):
+        _get(governor, upstream, deadline=0.2)
+    assert upstream.calls == 1
+    assert breaker.stats()["consecutive_failures"] == 1
+
+
+def test_bucket_in_shared_directory_falls_back_to_own_bucket(tmp_path, caplog):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o1777)
+    governor = RateGovernor("test", rate=1000, burst=5, reserve=0, path=str(shared / "bucket"))
+    assert asyncio.run(governor.acquire()) < 0.1
+    assert "this worker keeps its own" in caplog.text
+    assert not (shared / "bucket").exists()
+
+
+def test_planted_symlink_is_not_followed(tmp_path):
+    target = tmp_path / "elsewhere"
+    target.write_bytes(b"")
+    (tmp_path / "bucket").symlink_to(target)
+    governor = RateGovernor("test", rate=1000, burst=5, reserve=0, path=str(tmp_path / "bucket"))
+    asyncio.run(governor.acquire())
+    assert target.read_bytes() == b""
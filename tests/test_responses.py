@@ -0,0 +1,43 @@
+# tests/test_responses.py
+"""
+Response compression: brotli when the client accepts it (and it is
+installed), else gzip, and nothing for small bodies or other clients.
+"""
+import gzip
+
+import pytest
+from starlette.requests import Request
+
+from app import responses
+from app.responses import compress
+
+BODY = b'{"items":[' + b",".join(b'{"gtin":"%d","price":1.5}' % i for i in range(200)) + b"]}"
+
+
+def _request(accept_encoding: str) -> Request:
+    return Request({"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]})
+
+
+def test_brotli_when_accepted():
+    brotli = pytest.importorskip("brotli")
+    body, encoding = compress(_request("gzip, deflate, br"), BODY)
+    assert encoding == "br"
+    assert brotli.decompress(body) == BODY
+
+
+def test_gzip_when_brotli_not_accepted():
+    body, encoding = compress(_request("gzip;q=1.0, br;q=0"), BODY)
+    assert encoding == "gzip"
+    assert gzip.decompress(body) == BODY
+
+
+def test_gzip_when_brotli_not_installed(monkeypatch):
+    monkeypatch.setattr(responses, "brotli", None)
+    body, encoding = compress(_request("br, gzip"), BODY)
+    assert encoding == "gzip"
+    assert gzip.decompress(body) == BODY
+
+
+def test_uncompressed_when_small_or_not_accepted():
+    assert compress(_request("br, gzip"), b"{}") == (b"{}", None)
+    assert compress(_request("identity"), BODY) == (BODY, None)
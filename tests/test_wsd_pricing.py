@@ -0,0 +1,127 @@
+# tests/test_wsd_pricing.py
+"""
+Batch pricing (NumPy over the whole basket) gives exactly what calc_price
+gives line by line: the same prices at every markup tier and half cent, and
+the same 404/500 for missing GTINs and bad price cells. The export streams
+the same prices and resumes from any record with Range/If-Range.
+"""
+import itertools
+
+import orjson
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.models.pricing import WsdBatchLine
+from app.routers import wsd_pricing_router
+from app.services.wsd_pricing import WsdPriceService
+from main import app
+
+HEADER = "Code,Description,Supplier,EAN,Generic,Pack,Unit,RRP,Price GST Exc\n"
+# Each side of every markup tier boundary, cent ties, a duplicate GTIN, a bad cell
+PRICES = ["0.01", "1.005", "2.675", "14.995", "29.99", "30.00", "30.01", "45.00", "45.01",
+          "225.00", "450.00", "450.01", "999.99", "1000.00", "2000.00", "2500.00", "n/a"]
+GTINS = [str(9300000000000 + i) for i in range(len(PRICES))]
+MISSING = "9399999999999"
+
+
+@pytest.fixture
+def service(tmp_path):
+    path = tmp_path / "pricebook.csv"
+    rows = [f"{i},Item {i},X,{gtin},generic,1,ea,0,{price}" for i, (gtin, price) in enumerate(zip(GTINS, PRICES))]
+    rows.append(f"99,Duplicate,X,{GTINS[0]},generic,1,ea,0,99.00")
+    path.write_text(HEADER + "\n".join(rows) + "\n")
+    return WsdPriceService(path)
+
+
+def _single(service, line: WsdBatchLine) -> dict:
+    try:
+        return {"gtin": line.gtin, "result": service.calc_price(line.gtin, line.qty, line.auth, line.conc)}
+    except HTTPException as e:
+        return {"gtin": line.gtin, "error": {"status_code": e.status_code, "detail": e.detail}}
+
+
+def test_batch_matches_calc_price(service):
+    lines = [WsdBatchLine(gtin=gtin, qty=qty, auth=auth, conc=conc)
+             for gtin, qty, auth, conc in itertools.product(GTINS + [MISSING], (1, 2, 3, 7), (False, True), (False, True))]
+    batch = service.calc_prices(lines)
+    mismatched = [(line.gtin, line.qty, line.auth, line.conc)
+                  for line, entry in zip(lines, batch) if entry != _single(service, line)]
+    assert not mismatched
+
+
+def test_batch_errors(service):
+    missing, bad = service.calc_prices([WsdBatchLine(gtin=MISSING), WsdBatchLine(gtin=GTINS[-1])])
+    assert missing["error"]["status_code"] == 404
+    assert bad["error"] == {"status_code": 500, "detail": f"Invalid base price value 'n/a' for GTIN {GTINS[-1]}"}
+
+
+def test_empty_batch(service):
+    assert service.calc_prices([]) == []
+
+
+@pytest.fixture
+def client(service, monkeypatch):
+    monkeypatch.setattr(wsd_pricing_router, "_service", service)
+    return TestClient(app)
+
+
+def _export(client, headers=None, **params):
+    return client.get("/pricing/wsd/export", params={"qty": [1, 2], **params}, headers=headers or {})
+
+
+def test_export_prices_every_gtin_and_combo(client, service):
+    r = _export(client)
+    records = [orjson.loads(line) for line in r.content.splitlines()]
+    assert r.status_code == 200
+    assert int(r.headers["x-record-count"]) == len(records) == len(GTINS) * 2 * 2 * 2
+    for rec in records:
+        line = WsdBatchLine(gtin=rec["GTIN"], qty=rec["quantity"], auth=rec["auth"], conc=rec["conc"])
+        expected = _single(service, line)
+        if "error" in expected:
+            assert rec["error"] == expected["error"]
+        else:
+            assert {k: rec[k] for k in expected["result"] if k != "GTIN"} == \
+                   {k: v for k, v in expected["result"].items() if k != "GTIN"}
+
+
+def test_export_resumes_from_range(client):
+    full = _export(client)
+    lines = full.content.splitlines()
+    etag = full.headers["etag"]
+    r = _export(client, {"Range": "records=5-", "If-Range": etag})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == f"records 5-{len(lines) - 1}/{len(lines)}"
+    assert r.content.splitlines() == lines[5:]
+    r = _export(client, {"Range": "records=5-9", "If-Range": etag})
+    assert r.content.splitlines() == lines[5:10]
+
+
+def test_export_ignores_range_for_stale_etag(client):
+    full = _export(client)
+    r = _export(client, {"Range": "records=5-", "If-Range": '"stale"'})
+    assert r.status_code == 200
+    assert r.content == full.content
+
+
+def test_export_range_past_the_end(client):
+    total = int(_export(client).headers["x-record-count"])
+    r = _export(client, {"Range": f"records={total}-"})
+    assert r.status_code == 416
+    assert r.headers["content-range"] == f"records */{total}"
+
+
+def test_resumed_csv_has_no_header(client):
+    full = _export(client, format="csv").content.splitlines()
+    resumed = _export(client, {"Range": "records=3-"}, format="csv").content.splitlines()
+    assert full[0].startswith(b"GTIN,quantity")
+    assert resumed == full[4:]
+
+
+def test_export_ranges_across_chunks(service):
+    index = service.pricebook.index()
+    combos = list(itertools.product((1, 2), (False, True), (False, True)))
+    full = b"".join(service.export(index, combos)).splitlines()
+    for start, stop in [(0, None), (5, 21), (7, 8), (24, None)]:
+        part = b"".join(service.export(index, combos, start, stop, chunk=3)).splitlines()
+        assert part == full[start:stop]